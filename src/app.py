@@ -1,11 +1,25 @@
 """ entry point for lambda"""
-import json  # pylint: disable=unresolved-import
+import time
 
 # pylint: disable=import-error
 import aws_helper
+import checkpoint
+import clients
+import continuation
+import fanout
+import lex_helper
+import metrics
+import payload_log
 from bot_builder import LexBotBuilder
+from parallel import run_concurrently
+import resource_diff
+import retry
+from scheduler import BOT, INTENT, SLOT_TYPE
+import state_store
 
 from slot_builder import SlotBuilder
+from utils import client_error, ContinuationRequired, ProvisioningError
+from version_pruner import VersionPruner
 from models.bot import Bot
 from models.intent import Intent
 from models.slot_type import SlotType
@@ -18,6 +32,11 @@ logger = aws_helper.log_config({"RequestId": "CONTAINER_INIT"})  # pylint: disab
 logger.info('Logging configured')
 # set global to track init failures
 INIT_FAILED = False
+# default number of lex resources provisioned at the same time
+MAX_WORKERS = 1
+# 'staged' puts all slot types, then all intents, then the bot. 'graph'
+# starts each resource as soon as the resources it depends on are done
+SCHEDULING = 'staged'
 
 
 def _get_function_arn(function_name, aws_region, aws_account_id, prefix):
@@ -88,14 +107,29 @@ def _add_prefix(lex_definition, name_prefix, aws_region, aws_account_id):
     )
 
 
-def lex_builder_instance(context):
+def lex_builder_instance(context, max_workers=MAX_WORKERS, slot_builder=None,
+                         wait_for_build=True, state=None, alias=None,
+                         checkpoint=None):  # pylint: disable=redefined-outer-name
     """Creates an instance of LexBotBuilder"""
-    return LexBotBuilder(logger, context)
+    return LexBotBuilder(logger, context, max_workers=max_workers, slot_builder=slot_builder,
+                         wait_for_build=wait_for_build, state=state, alias=alias,
+                         checkpoint=checkpoint)
 
 
-def slot_builder_instance(context):
+def slot_builder_instance(context, state=None,
+                          checkpoint=None):  # pylint: disable=redefined-outer-name
     """Creates an instance of SlotBuilder"""
-    return SlotBuilder(logger, context)
+    return SlotBuilder(logger, context, state=state, checkpoint=checkpoint)
+
+
+def version_pruner_instance(context, keep, max_workers=MAX_WORKERS):
+    """Creates an instance of VersionPruner"""
+    return VersionPruner(logger, context, keep=keep, max_workers=max_workers)
+
+
+def _state_store(event):
+    resource_properties = event.get('ResourceProperties')
+    return state_store.from_uri(resource_properties.get('stateStore'))
 
 
 def _name_prefix(event):
@@ -104,6 +138,179 @@ def _name_prefix(event):
     return "" if name_prefix is None else name_prefix
 
 
+def _max_workers(event):
+    resource_properties = event.get('ResourceProperties')
+    max_workers = resource_properties.get('maxWorkers')
+    return MAX_WORKERS if max_workers is None else max(1, int(max_workers))
+
+
+def _wait_for_build(event):
+    resource_properties = event.get('ResourceProperties')
+    return str(resource_properties.get('waitForBuild', True)).lower() != 'false'
+
+
+def _clear_checkpoint(progress, resources=()):
+    """Forget the request's checkpoint, resources are (type, name) pairs
+    checkpointed by other invocations, e.g. fan-out workers"""
+    if progress is not None:
+        logger.info('Forgetting %s checkpointed resources', len(progress))
+        progress.clear(resources)
+
+
+def _worker_resources(event, bot):
+    """The intents checkpointed by fan-out workers"""
+    if _workers(event) <= 1:
+        return ()
+    return [(INTENT, intent.intent_name) for intent in bot.intents]
+
+
+def _request_resources(event):
+    """(type, name) of every resource the request may have checkpointed,
+    taken from the properties so that a request that failed to parse them
+    still has its resources"""
+    events = [event]
+    if event.get('OldResourceProperties') is not None:
+        events.append(_old_event(event))
+    resources = set()
+    for request_event in events:
+        properties = request_event.get('ResourceProperties') or {}
+        resources.add((BOT, _bot_name(request_event)))
+        resources.update((INTENT, intent.get('Name'))
+                         for intent in properties.get('intents') or [])
+        resources.update((SLOT_TYPE, _name_prefix(request_event) + name)
+                         for name in properties.get('slotTypes') or {})
+    return resources
+
+
+def _forget_failed_request(event, context, ex, log):
+    """Clear the checkpoint of a request that failed, as it is not run
+    again with it. A failure to clear is logged, not raised, so that the
+    request still fails with ex"""
+    try:
+        progress = checkpoint.from_event(event, context)
+        if progress is not None:
+            log.info('Forgetting the checkpoint of the request that failed with %s', ex)
+            progress.clear(_request_resources(event))
+    except Exception:  # pylint: disable=broad-except
+        log.warning('Failed to clear the checkpoint', exc_info=True)
+
+
+def _workers(event):
+    resource_properties = event.get('ResourceProperties')
+    workers = resource_properties.get('workers')
+    return 1 if workers is None else max(1, int(workers))
+
+
+def _fan_out(event, context, lex_bot_builder, bot, changed_intents=None):
+    """Put the intents with one worker invocation per shard, then the bot
+
+    Codehook permissions are reconciled here, once, as the workers would all
+    change the same function policies at the same time
+    """
+    lex_bot_builder.reconcile_permissions(bot, changed_intents)
+    versions, timings = fanout.run_workers(event, context,
+                                           [intent.intent_name for intent in bot.intents],
+                                           _workers(event), changed_intents)
+    logger.info('Worker timings: %s', timings)
+    bot_put_response = lex_bot_builder.put_bot(
+        bot, [{'intentName': intent.intent_name, 'intentVersion': versions[intent.intent_name]}
+              for intent in bot.intents])
+    bot_put_response['workers'] = timings
+    return bot_put_response
+
+
+def worker(event, context):
+    """
+    Handle a fan-out worker invocation, putting the intents of one shard
+
+    Returns the intent versions to the coordinator rather than responding to
+    CloudFormation. A worker that runs out of time returns continuation
+    instead, what it did is in the checkpoint
+    """
+    started = time.time()
+    work = event[fanout.WORKER_KEY]
+    context = fanout.worker_context(event, context)
+    resources = event.get('ResourceProperties')
+    bot_name = _bot_name(event)
+    intents = [intent for intent in _extract_intents(bot_name, resources)
+               if intent.intent_name in work['intents']]
+    _validate_intents(intents)
+    bot = Bot.create_bot(bot_name,
+                         intents,
+                         resources.get('messages'),
+                         locale=resources.get('locale'),
+                         description=resources.get('description'))
+
+    max_workers = _max_workers(event)
+    clients.ensure_pool_size(max_workers)
+    lex_bot_builder = lex_builder_instance(context, max_workers=max_workers,
+                                           state=_state_store(event),
+                                           checkpoint=checkpoint.from_event(event, context))
+    try:
+        intent_versions = lex_bot_builder.put_intents(bot,
+                                                      changed_intents=work['changedIntents'],
+                                                      permissions_reconciled=True)
+    except (ContinuationRequired, ProvisioningError) as ex:
+        if not continuation.required(ex):
+            raise
+        logger.info('Shard %s out of time: %s', work['shard'], ex)
+        return {'shard': work['shard'], 'intentVersions': [], 'continuation': True,
+                'seconds': round(time.time() - started, 3)}
+    return {'shard': work['shard'],
+            'intentVersions': intent_versions,
+            'seconds': round(time.time() - started, 3)}
+
+
+def _keep_versions(event):
+    resource_properties = event.get('ResourceProperties')
+    keep_versions = resource_properties.get('keepVersions')
+    return None if keep_versions is None else max(1, int(keep_versions))
+
+
+def _prune_versions(event, context, bot, max_workers):
+    """Delete old bot and intent versions when keepVersions is set
+
+    The put has already succeeded, so failures are only logged
+    """
+    keep_versions = _keep_versions(event)
+    if keep_versions is None:
+        return
+    pruner = version_pruner_instance(context, keep_versions, max_workers=max_workers)
+    try:
+        pruner.prune(bot.name, [intent.intent_name for intent in bot.intents])
+    except (client_error(), ProvisioningError) as ex:
+        logger.warning('Failed to delete old versions of %s: %s', bot.name, ex)
+
+
+def _alias(event):
+    resource_properties = event.get('ResourceProperties')
+    return resource_properties.get('alias')
+
+
+def _bot_response(bot_put_response):
+    response = dict(
+        BotName=bot_put_response['name'],
+        BotVersion=bot_put_response['version']
+    )
+    if bot_put_response.get('buildStatus') is not None:
+        response.update(BuildStatus=bot_put_response['buildStatus'],
+                        BuildSeconds=str(bot_put_response['buildSeconds']))
+    if bot_put_response.get('workers'):
+        response.update(Workers=str(len(bot_put_response['workers'])),
+                        WorkerSeconds=','.join(str(timing['seconds'])
+                                               for timing in bot_put_response['workers']))
+    if bot_put_response.get('alias') is not None:
+        # previous version is the rollback target, empty on the first deploy
+        response.update(BotAlias=bot_put_response['alias'],
+                        PreviousBotVersion=bot_put_response['previousVersion'] or '')
+    return response
+
+
+def _graph_scheduling(event):
+    resource_properties = event.get('ResourceProperties')
+    return resource_properties.get('scheduling', SCHEDULING) == 'graph'
+
+
 def _bot_name(event):
     return _name_prefix(event) + event['LogicalResourceId']
 
@@ -119,6 +326,15 @@ def _validate_intents(intents):
     [intent.validate_intent() for intent in intents]
 
 
+def _put_slot_types(slot_builder, slot_types, max_workers):
+    """Put all slot types, reporting every failed slot type together"""
+    run_concurrently(slot_builder.put_slot_type,
+                     slot_types,
+                     max_workers=max_workers,
+                     key=lambda slot_type: slot_type.name,
+                     fail_fast=False)
+
+
 def create(event, context):
     """
     Handle Create events
@@ -126,14 +342,23 @@ def create(event, context):
     To return a failure to CloudFormation simply raise an exception,
     the exception message will be sent to CloudFormation Events.
     """
-    slot_builder = slot_builder_instance(context)
-    lex_bot_builder = lex_builder_instance(context)
+    max_workers = _max_workers(event)
+    clients.ensure_pool_size(max_workers)
+    state = _state_store(event)
+    progress = checkpoint.from_event(event, context)
+    slot_builder = slot_builder_instance(context, state=state, checkpoint=progress)
+    lex_bot_builder = lex_builder_instance(context, max_workers=max_workers,
+                                           slot_builder=slot_builder,
+                                           wait_for_build=_wait_for_build(event),
+                                           state=state, alias=_alias(event),
+                                           checkpoint=progress)
     resources = event.get('ResourceProperties')
 
     slot_types = SlotType.create_slot_types(resources.get('slotTypes'), prefix=_name_prefix(event))
-
-    for slot_type in slot_types:
-        slot_builder.put_slot_type(slot_type)
+    fan_out = _workers(event) > 1
+    graph_scheduling = _graph_scheduling(event) and not fan_out
+    if not graph_scheduling:
+        _put_slot_types(slot_builder, slot_types, max_workers)
 
     bot_name = _bot_name(event)
 
@@ -146,22 +371,101 @@ def create(event, context):
                          locale=resources.get('locale'),
                          description=resources.get('description'))
 
-    bot_put_response = lex_bot_builder.put(bot)
+    if fan_out:
+        bot_put_response = _fan_out(event, context, lex_bot_builder, bot)
+    elif graph_scheduling:
+        bot_put_response = lex_bot_builder.put(bot, slot_types=slot_types)
+    else:
+        bot_put_response = lex_bot_builder.put(bot)
 
-    return dict(
-        BotName=bot_put_response['name'],
-        BotVersion=bot_put_response['version']
-    )
+    _prune_versions(event, context, bot, max_workers)
+    _clear_checkpoint(progress, _worker_resources(event, bot))
+    return _bot_response(bot_put_response)
+
+
+def _old_event(event):
+    return dict(event, ResourceProperties=event['OldResourceProperties'])
+
+
+def _delete_slot_types(slot_builder, names, max_workers, **kwargs):
+    run_concurrently(lambda name: slot_builder.delete_slot_type(name, **kwargs),
+                     names,
+                     max_workers=max_workers,
+                     fail_fast=False)
 
 
 def update(event, context):
     """
     Handle Update events
 
+    Only slot types and intents that differ from OldResourceProperties are
+    put and the ones that were removed are deleted. Without old properties,
+    or when the bot is renamed, everything is provisioned as on create.
+
     To return a failure to CloudFormation simply raise an exception,
     the exception message will be sent to CloudFormation Events.
     """
-    return create(event, context)
+    if event.get('OldResourceProperties') is None:
+        return create(event, context)
+
+    old_event = _old_event(event)
+    bot_name = _bot_name(event)
+    if _bot_name(old_event) != bot_name:
+        return create(event, context)
+
+    resources = event.get('ResourceProperties')
+    old_resources = event.get('OldResourceProperties')
+    slot_type_diff = resource_diff.diff_slot_types(old_resources, resources,
+                                                   _name_prefix(old_event),
+                                                   _name_prefix(event))
+    intent_diff = resource_diff.diff_intents(old_resources, resources)
+    logger.info('Slot types %s, intents %s', slot_type_diff, intent_diff)
+
+    max_workers = _max_workers(event)
+    clients.ensure_pool_size(max_workers)
+    state = _state_store(event)
+    progress = checkpoint.from_event(event, context)
+    slot_builder = slot_builder_instance(context, state=state, checkpoint=progress)
+    lex_bot_builder = lex_builder_instance(context, max_workers=max_workers,
+                                           slot_builder=slot_builder,
+                                           wait_for_build=_wait_for_build(event),
+                                           state=state, alias=_alias(event),
+                                           checkpoint=progress)
+
+    slot_types = [slot_type for slot_type in
+                  SlotType.create_slot_types(resources.get('slotTypes'), prefix=_name_prefix(event))
+                  if slot_type.name in slot_type_diff.to_put()]
+    fan_out = _workers(event) > 1
+    graph_scheduling = _graph_scheduling(event) and not fan_out
+    if not graph_scheduling:
+        _put_slot_types(slot_builder, slot_types, max_workers)
+
+    intents = _extract_intents(bot_name, resources)
+    _validate_intents(intents)
+    bot = Bot.create_bot(bot_name,
+                         intents,
+                         resources.get('messages'),
+                         locale=resources.get('locale'),
+                         description=resources.get('description'))
+
+    if fan_out:
+        bot_put_response = _fan_out(event, context, lex_bot_builder, bot,
+                                    changed_intents=intent_diff.to_put())
+    elif graph_scheduling:
+        bot_put_response = lex_bot_builder.put(bot, slot_types=slot_types,
+                                               changed_intents=intent_diff.to_put())
+    else:
+        bot_put_response = lex_bot_builder.put(bot, changed_intents=intent_diff.to_put())
+
+    # older bot and intent versions keep removed intents and slot types in
+    # use, so they are pruned first. Whatever they still use is left behind
+    # rather than failing an update whose bot is already put
+    _prune_versions(event, context, bot, max_workers)
+    lex_bot_builder.delete_intents(intent_diff.removed, leave_in_use=True)
+    _delete_slot_types(slot_builder, slot_type_diff.removed, max_workers, leave_in_use=True)
+    _clear_checkpoint(progress, _worker_resources(event, bot))
+
+    return _bot_response(bot_put_response)
 
 
 def delete(event, context):
@@ -179,16 +483,57 @@ def delete(event, context):
                          resources.get('messages'),
                          locale=resources.get('locale'),
                          description=resources.get('description'))
-    slot_builder = slot_builder_instance(context)
-    lex_bot_builder = lex_builder_instance(context)
+    max_workers = _max_workers(event)
+    clients.ensure_pool_size(max_workers)
+    state = _state_store(event)
+    # the checkpoint records what was deleted so a continuation skips it
+    progress = checkpoint.from_event(event, context)
+    slot_builder = slot_builder_instance(context, state=state, checkpoint=progress)
+    lex_bot_builder = lex_builder_instance(context, max_workers=max_workers,
+                                           slot_builder=slot_builder, state=state,
+                                           alias=_alias(event), checkpoint=progress)
+    if _graph_scheduling(event):
+        slot_types = SlotType.create_slot_types(resources.get('slotTypes'),
+                                                prefix=_name_prefix(event))
+        lex_bot_builder.delete(bot, slot_types=slot_types)
+        _clear_checkpoint(progress)
+        return
+
     lex_bot_builder.delete(bot)
 
     slot_types = event.get('ResourceProperties').get('slotTypes')
     slot_types = [] if slot_types is None else slot_types
 
-    for slot_type in slot_types:
-        name = _name_prefix(event) + slot_type
-        slot_builder.delete_slot_type(name)
+    # last, once no intent uses them
+    _delete_slot_types(slot_builder,
+                       [_name_prefix(event) + slot_type for slot_type in slot_types],
+                       max_workers)
+    _clear_checkpoint(progress)
+
+
+def _metrics_enabled(event):
+    resource_properties = event.get('ResourceProperties', {})
+    return str(resource_properties.get('metrics', True)).lower() != 'false'
+
+
+def _metrics_request_sizes(event):
+    resource_properties = event.get('ResourceProperties', {})
+    return str(resource_properties.get('metricsRequestBytes', False)).lower() == 'true'
+
+
+def _cache_aws_details(event, context):
+    """Take the account id from the function or service token ARN so that
+    the builders do not need to look it up with STS"""
+    service_token = event.get('ResourceProperties', {}).get('ServiceToken',
+                                                            event.get('ServiceToken'))
+    for arn in [getattr(context, 'invoked_function_arn', None), service_token]:
+        if lex_helper.cache_aws_details(arn):
+            return
+
+
+def _log_sample_rate(event):
+    resource_properties = event.get('ResourceProperties', {})
+    return payload_log.sample_rate(resource_properties.get('logSampleRate'))
 
 
 def lambda_handler(event, context):
@@ -199,6 +544,18 @@ def lambda_handler(event, context):
     global logger  # pylint: disable=invalid-name,global-statement
 
     logger = aws_helper.log_config(event)
-    logger.info('event: %s', json.dumps(event, indent=4, sort_keys=True, default=str))
-    return aws_helper.cfn_handler(event, context, create, update, delete, logger,
-                                  INIT_FAILED)
+    payload_log.PAYLOADS.reset(sample_rate=_log_sample_rate(event))
+    payload_log.log_payload(logger, 'event', event)
+    _cache_aws_details(event, context)
+    retry.STATS.reset()
+    metrics.METRICS.reset(enabled=_metrics_enabled(event),
+                          request_sizes=_metrics_request_sizes(event))
+    try:
+        if fanout.is_worker(event):
+            return worker(event, context)
+        return aws_helper.cfn_handler(event, context, create, update, delete, logger,
+                                      INIT_FAILED, on_continue=continuation.continue_request,
+                                      on_failure=_forget_failed_request)
+    finally:
+        logger.info('Lex retries: %s', retry.STATS.snapshot())
+        metrics.METRICS.emit_summary()
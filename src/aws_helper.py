@@ -8,7 +8,10 @@ import logging
 import threading
 import os
 import json
-from botocore.vendored import requests
+
+# pylint: disable=import-error
+import cfn_response
+# pylint: enable=import-error
 
 
 def log_config(event, loglevel=None, botolevel=None):
@@ -60,18 +63,10 @@ def send_cfn_confirmation(event, context, responseStatus, responseData,
 
     logger.info("Response body:\n" + json_responseBody)
 
-    headers = {
-        'content-type': '',
-        'content-length': str(len(json_responseBody))
-    }
-
     try:
-        response = requests.put(responseUrl,
-                                data=json_responseBody,
-                                headers=headers)
-        logger.info("CloudFormation returned status code: " + response.reason)
+        cfn_response.ResponseSender(logger, context).send(responseUrl, json_responseBody)
     except Exception as e:
-        logger.error("send(..) failed executing requests.put(..): " + str(e))
+        logger.error("send(..) failed putting the response to cfn: " + str(e))
         raise
 
 
@@ -83,7 +78,8 @@ def timeout(event, context, logger):
 
 
 # Handler function
-def cfn_handler(event, context, create, update, delete, logger, init_failed):
+def cfn_handler(event, context, create, update, delete, logger, init_failed,
+                on_continue=None, on_failure=None):
     logger.info("Lambda RequestId: %s CloudFormation RequestId: %s" %
                 (context.aws_request_id, event['RequestId']))
 
@@ -100,7 +96,6 @@ def cfn_handler(event, context, create, update, delete, logger, init_failed):
     elif event['RequestType'] == 'Update':
         physicalResourceId = event['PhysicalResourceId']
 
-    logger.debug("EVENT: " + str(event))
     # handle init failures
     if init_failed:
         send_cfn_confirmation(event, context, "FAILED", responseData, physicalResourceId,
@@ -128,9 +123,18 @@ def cfn_handler(event, context, create, update, delete, logger, init_failed):
                               physicalResourceId, logger=logger)
 
     # Catch any exceptions, log the stacktrace, send a failure back to
-    # CloudFormation and then raise an exception
+    # CloudFormation and then raise an exception. on_continue returns True
+    # when the work carries on in another invocation, which will respond.
+    # Otherwise on_failure cleans up after the failed request
     except Exception as e:
+        if on_continue is not None and on_continue(event, context, e, logger):
+            logger.info("Not responding to cfn, another invocation continues the work")
+            return
         logger.error(e, exc_info=True)
+        if on_failure is not None:
+            on_failure(event, context, e, logger)
         send_cfn_confirmation(event, context, "FAILED", responseData, physicalResourceId,
                               reason=e, logger=logger)
         raise
+    finally:
+        t.cancel()
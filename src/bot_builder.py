@@ -3,35 +3,54 @@
 """ Provision AWS Lex resources using python SDK
 """
 
-# import time
+import time
 # import boto3
-from botocore.exceptions import ClientError
 
 from intent_builder import IntentBuilder
-# from slot_builder import SlotBuilder
+from slot_builder import SlotBuilder
 from lex_helper import LexHelper
+from parallel import run_concurrently
+from payload_log import log_payload
+from retry import Deadline
+from scheduler import DependencyGraph, run_graph, BOT, INTENT, SLOT_TYPE
+from utils import client_error, ContinuationRequired, ProvisioningError
 # from models.intent import Intent
 
 
 class LexBotBuilder(LexHelper):
 
     MAX_DELETE_TRIES = 5
-    RETRY_SLEEP = 5
     LOCALE = 'en-US'
+    # get_bot polling while a build runs: starts fast, then backs off
+    BUILD_POLL_INITIAL = 1.0
+    BUILD_POLL_FACTOR = 1.5
+    BUILD_POLL_MAX = 15.0
+    BUILD_READY = ('READY', 'READY_BASIC_TESTING')
+    BUILD_FAILED = ('FAILED', 'NOT_BUILT')
 
     """Create/Update different elements that make up a Lex bot"""
-    def __init__(self, logger, context, lex_sdk=None, intent_builder=None):
+    def __init__(self, logger, context, lex_sdk=None, intent_builder=None, max_workers=1,
+                 slot_builder=None, wait_for_build=True, state=None, alias=None,
+                 checkpoint=None):
         self._logger = logger
         self._context = context
+        self._max_workers = max_workers
+        # an alias is only moved to a version that finished building
+        self._wait_for_build = wait_for_build or alias is not None
+        self._alias = alias
+        self._state = state
+        self._checkpoint = checkpoint
         if lex_sdk is None:
             self._lex_sdk = self._get_lex_sdk()
         else:
             self._lex_sdk = lex_sdk
         if intent_builder is None:
 
-            self._intent_builder = IntentBuilder(self._logger, self._context, lex_sdk=self._lex_sdk)
+            self._intent_builder = IntentBuilder(self._logger, self._context, lex_sdk=self._lex_sdk,
+                                                 state=state, checkpoint=checkpoint)
         else:
             self._intent_builder = intent_builder
+        self._slot_builder = slot_builder
 
     def _replace_intent_version(self, bot_definition, intents):
         for intent in bot_definition['intents']:
@@ -67,37 +86,152 @@ class LexBotBuilder(LexHelper):
 
         return properties
 
-    def put(self, bot):
-        """create bot"""
-        intent_versions = self._put_intents(bot.name, bot.intents)
-        self._logger.info(intent_versions)
+    def put(self, bot, slot_types=None, changed_intents=None):
+        """create bot
+
+        When slot_types are given they are provisioned with the intents
+        using the dependency graph instead of ahead of all intents. When
+        changed_intents names are given only those intents are put, the
+        others keep their current version.
+        """
+        self._reconcile_permissions(bot, changed_intents)
+        if slot_types is not None:
+            return self._put_graph(bot, slot_types, changed_intents)
+
+        intent_versions = self._put_intents(bot.name, bot.intents, changed_intents)
+        log_payload(self._logger, 'Intent versions', intent_versions)
 
         bot_response = self._put_bot(bot, intent_versions)
         return bot_response
 
-    def delete(self, bot):
-        """delete bot"""
+    def put_intents(self, bot, changed_intents=None, permissions_reconciled=False):
+        """Put the intents of bot without the bot, returns their versions in
+        the same order, e.g. for a shard of a bot put by a fan-out worker
+
+        With permissions_reconciled the caller has already called
+        reconcile_permissions and no codehook permission is added
+        """
+        if permissions_reconciled:
+            self._intent_builder.assume_granted(self._intents_to_put(bot, changed_intents))
+        else:
+            self._reconcile_permissions(bot, changed_intents)
+        return self._put_intents(bot.name, bot.intents, changed_intents)
+
+    def reconcile_permissions(self, bot, changed_intents=None):
+        """Add the missing codehook permissions of the intents that will be
+        put, e.g. once by the coordinator of a fan-out before the workers"""
+        self._reconcile_permissions(bot, changed_intents)
+
+    def put_bot(self, bot, intent_versions):
+        """Put the bot with intent versions that were put separately"""
+        return self._put_bot(bot, intent_versions)
+
+    def delete(self, bot, slot_types=None):
+        """delete bot
+
+        The bot is deleted first, then its intents concurrently, retrying
+        while Lex still has them in use by the deleted bot. When slot_types
+        are given they are deleted with the intents by walking the
+        dependency graph in reverse
+        """
         # TODO what about deleting published version(s) of the bot?
-        self._delete_bot(bot.name)
-        self._delete_intents(bot.name, bot.intents)
+        if slot_types is not None:
+            self._delete_graph(bot, slot_types)
+        else:
+            self._delete_bot(bot.name)
+            self._delete_intents(bot.name, bot.intents)
 
         self._logger.info('Successfully deleted bot and associated resources')
 
-    def _put_intents(self, bot_name, intents):
-        intent_versions = []
-        for intent in intents:
-            intent_versions.append(
-                self._intent_builder.put_intent(intent)
-            )
+    def _get_slot_builder(self):
+        if self._slot_builder is None:
+            self._slot_builder = SlotBuilder(self._logger, self._context, lex_sdk=self._lex_sdk,
+                                             state=self._state, checkpoint=self._checkpoint)
+        return self._slot_builder
+
+    def delete_intents(self, intent_names, leave_in_use=False):
+        """Delete intents no longer used by the bot, with leave_in_use the
+        ones older bot versions still use are left in place"""
+        self._intent_builder.delete_intents(intent_names, max_workers=self._max_workers,
+                                            leave_in_use=leave_in_use)
+
+    def _put_intent(self, intent, changed_intents):
+        if changed_intents is None or intent.intent_name in changed_intents:
+            return self._intent_builder.put_intent(intent)
+        return self._intent_builder.current_version(intent)
+
+    def _reconcile_permissions(self, bot, changed_intents=None):
+        """Add the missing codehook permissions of the intents that will be put"""
+        self._intent_builder.reconcile_permissions(self._intents_to_put(bot, changed_intents),
+                                                   max_workers=self._max_workers)
+
+    # pylint: disable=no-self-use
+    def _intents_to_put(self, bot, changed_intents):
+        return [intent for intent in bot.intents
+                if changed_intents is None or intent.intent_name in changed_intents]
+
+    def _put_graph(self, bot, slot_types, changed_intents=None):
+        slot_builder = self._get_slot_builder()
+        slot_types_by_name = dict((slot_type.name, slot_type) for slot_type in slot_types)
+        intents_by_name = dict((intent.intent_name, intent) for intent in bot.intents)
+
+        def put_resource(key, dependency_results):
+            resource_type, name = key
+            if resource_type == SLOT_TYPE:
+                return slot_builder.put_slot_type(slot_types_by_name[name])
+            if resource_type == INTENT:
+                return self._put_intent(intents_by_name[name], changed_intents)
+
+            intent_versions = [dependency_results[(INTENT, intent.intent_name)]
+                               for intent in bot.intents]
+            log_payload(self._logger, 'Intent versions', intent_versions)
+            return self._put_bot(bot, intent_versions)
+
+        graph = DependencyGraph.create_graph(bot, slot_types)
+        results = run_graph(graph, put_resource, max_workers=self._max_workers,
+                            deadline=Deadline(self._context))
+        return results[(BOT, bot.name)]
+
+    def _delete_graph(self, bot, slot_types):
+        slot_builder = self._get_slot_builder()
+
+        def delete_resource(key, _):
+            resource_type, name = key
+            if resource_type == BOT:
+                self._delete_bot(name)
+            elif resource_type == INTENT:
+                self._intent_builder.delete_intents([name])
+            else:
+                slot_builder.delete_slot_type(name)
+
+        graph = DependencyGraph.create_graph(bot, slot_types).reversed()
+        run_graph(graph, delete_resource, max_workers=self._max_workers,
+                  deadline=Deadline(self._context))
+
+    def _put_intents(self, bot_name, intents, changed_intents=None):
+        """Put intents using up to max_workers threads
+
+        The returned intent versions are in the same order as intents
+        """
+        self._logger.info('Put %s intents for %s with %s workers',
+                          len(intents), bot_name, self._max_workers)
+        if changed_intents is None:
+            put_intent = self._intent_builder.put_intent
+        else:
+            def put_intent(intent):
+                return self._put_intent(intent, changed_intents)
 
-        return intent_versions
+        return run_concurrently(put_intent,
+                                intents,
+                                max_workers=self._max_workers,
+                                key=lambda intent: intent.intent_name)
 
     def _delete_intents(self, bot_name, intents):
         intent_names = [intent.intent_name for intent in intents]
         # todo fix this so it just passes the intent object
 
-        self._logger.info(intent_names)
-        self._intent_builder.delete_intents(intent_names)
+        log_payload(self._logger, 'Delete intents', intent_names)
+        self._intent_builder.delete_intents(intent_names, max_workers=self._max_workers)
 
     def _bot_exists(self, name, versionOrAlias='$LATEST'):
         return self._get_resource(self._lex_sdk.get_bot,
@@ -105,6 +239,11 @@ class LexBotBuilder(LexHelper):
                                   {'name': name, 'versionOrAlias': versionOrAlias})
 
     def _create_bot(self, bot_name, bot_properties):
+        creation_response = self._put_with_cached_checksum(
+            self._lex_sdk.put_bot, 'put_bot', self._cached_state(BOT, bot_name), bot_properties)
+        if creation_response is not None:
+            return creation_response, creation_response['checksum']
+
         bot_exists, checksum = self._bot_exists(bot_name)
         if bot_exists:
             creation_response = self._update_lex_resource(
@@ -112,23 +251,44 @@ class LexBotBuilder(LexHelper):
             return creation_response, creation_response['checksum']
 
         else:
-            self._logger.info(bot_properties)
+            log_payload(self._logger, 'Bot properties', bot_properties)
             creation_response = self._create_lex_resource(
                 self._lex_sdk.put_bot, 'put_bot', bot_properties)
 
             return creation_response, creation_response['checksum']
 
     def _put_bot(self, bot, intent_versions):
-        """Create/Update bot"""
-        self._logger.info('Put bot intent_versions %s', bot.name)
-        self._logger.info(intent_versions)
+        """Create/Update bot, wait for the build and create a bot version
+
+        Without wait_for_build the bot is left building and $LATEST is
+        returned. A build that fails, or that outlasts the lambda, raises
+        (see _wait_for_bot_build). With an alias, the alias
+        is switched to the new version once it is READY and the version it
+        pointed at before is returned as previousVersion.
+        """
+        log_payload(self._logger, 'Put bot {0}'.format(bot.name), intent_versions)
 
         bot_properties = self._bot_put_properties(bot.name, bot.messages, **bot.attrs)
         bot_properties.update({"intents": intent_versions})
 
-        self._logger.info("Bot properties for AWS %s", bot_properties)
+        log_payload(self._logger, 'Bot properties for AWS', bot_properties)
+
+        started = time.time()
+        # an earlier invocation of this request may have put it already
+        put_response = self._checkpointed(BOT, bot.name)
+        if put_response is not None:
+            checksum = put_response['checksum']
+        else:
+            put_response, checksum = self._create_bot(bot.name, bot_properties)
+            self._complete(BOT, bot.name, checksum)
+        if not self._wait_for_build:
+            self._save_state(BOT, bot.name, checksum)
+            return self._build_response(
+                {'name': bot.name, 'version': '$LATEST'}, put_response.get('status'), started)
 
-        _, checksum = self._create_bot(bot.name, bot_properties)
+        bot_response = self._wait_for_bot_build(bot.name, put_response)
+        status = bot_response.get('status')
+        checksum = bot_response.get('checksum', checksum)
 
         version_response = self._create_lex_resource(
             self._lex_sdk.create_bot_version, 'create_bot_version',
@@ -136,27 +296,100 @@ class LexBotBuilder(LexHelper):
                 'name': bot.name,
                 'checksum': checksum
             })
+        self._save_state(BOT, bot.name, checksum, version_response.get('version'))
+
+        log_payload(self._logger, 'Created bot version {0}'.format(bot.name),
+                    version_response)
+
+        response = self._build_response(version_response, status, started)
+        if self._alias is not None:
+            # the new version builds too, clients of the alias must not see it building
+            self._wait_for_bot_build(bot.name, version_response,
+                                     version=version_response['version'])
+            response.update(self._put_alias(bot.name, version_response['version']))
+        return response
+
+    def _put_alias(self, bot_name, version):
+        """Point the alias at version, returns the alias and the version it
+        pointed at before"""
+        current = self._describe_resource(self._lex_sdk.get_bot_alias, 'get_bot_alias',
+                                          {'name': self._alias, 'botName': bot_name})
+        previous_version = None if current is None else current['botVersion']
+        if previous_version == version:
+            self._logger.info('Alias %s of %s already points at version %s',
+                              self._alias, bot_name, version)
+        else:
+            properties = {'name': self._alias, 'botName': bot_name, 'botVersion': version}
+            if current is not None:
+                properties['checksum'] = current['checksum']
+            self._create_lex_resource(self._lex_sdk.put_bot_alias, 'put_bot_alias', properties)
+            self._logger.info('Switched alias %s of %s from version %s to %s',
+                              self._alias, bot_name, previous_version, version)
+        return {'alias': self._alias, 'previousVersion': previous_version}
+
+    def _delete_alias(self, bot_name):
+        """A bot can not be deleted while it has an alias"""
+        try:
+            self._call(self._lex_sdk.delete_bot_alias, 'delete_bot_alias',
+                       name=self._alias, botName=bot_name)
+            self._logger.info('deleted alias %s of bot %s', self._alias, bot_name)
+        except client_error() as ex:
+            if not self._not_found(ex, 'delete_bot_alias'):
+                raise
+
+    def _build_response(self, response, status, started):
+        response = dict(response)
+        response['buildStatus'] = status
+        response['buildSeconds'] = round(time.time() - started, 1)
+        return response
+
+    def _wait_for_bot_build(self, bot_name, bot_response, version='$LATEST'):
+        """Poll get_bot of version until the build is ready
+
+        A failed build raises ProvisioningError. When the lambda runs out of
+        time first, ContinuationRequired is raised if the request has a
+        checkpoint, so the next invocation waits for the checkpointed bot,
+        and ProvisioningError otherwise
+        """
+        deadline = Deadline(self._context)
+        interval = self.BUILD_POLL_INITIAL
+        while bot_response.get('status') not in self.BUILD_READY:
+            status = bot_response.get('status')
+            if status in self.BUILD_FAILED:
+                raise ProvisioningError('Bot {0} build {1}: {2}'.format(
+                    bot_name, status, bot_response.get('failureReason')))
+            self._check_time(interval)
+            if not deadline.allows(interval):
+                message = 'Bot {0} still {1} at the lambda deadline'.format(bot_name, status)
+                if self._checkpoint is not None:
+                    raise ContinuationRequired(message)
+                raise ProvisioningError(message)
+
+            self._logger.info('Bot %s is %s, checking again in %s seconds',
+                              bot_name, status, interval)
+            time.sleep(interval)
+            interval = min(self.BUILD_POLL_MAX, interval * self.BUILD_POLL_FACTOR)
+            bot_response = self._call(self._lex_sdk.get_bot, 'get_bot',
+                                      name=bot_name, versionOrAlias=version)
 
-        self._logger.info("Created bot version %s", bot.name)
-        self._logger.info(version_response)
-
-        return version_response
+        return bot_response
 
     def _delete_bot(self, bot_name):
-        '''Delete bot'''
+        '''Delete bot, Lex finishes removing it in the background'''
+        self._check_time()
+        if self._deleted(BOT, bot_name):
+            return
         self._logger.info('deleting bot: %s', bot_name)
-        while True:
-            try:
-                bot_exists, _ = self._bot_exists(bot_name)
-                if(bot_exists):
-                    self._delete_lex_resource(self._lex_sdk.delete_bot, 'delete_bot',
-                                              name=bot_name)
-
-                    self._logger.info('deleted bot: %s', bot_name)
-                    break
-                else:
-                    break
-
-            except ClientError:
-                self._logger.warning('Lex can not call delete_bot on deleted bot %s.',
-                                     bot_name)
+        try:
+            bot_exists, _ = self._bot_exists(bot_name)
+        except client_error() as ex:
+            self._logger.warning('Could not get bot %s before deleting it: %s', bot_name, ex)
+            bot_exists = True
+
+        if bot_exists:
+            if self._alias is not None:
+                self._delete_alias(bot_name)
+            self._delete_lex_resource(self._lex_sdk.delete_bot, 'delete_bot', name=bot_name)
+            self._logger.info('deleted bot: %s', bot_name)
+        self._forget_state(BOT, bot_name)
+        self._complete(BOT, bot_name, None)
@@ -0,0 +1,112 @@
+""" Send the custom resource response to CloudFormation
+
+The response is a PUT of a json body to the pre-signed S3 url in the
+ResponseURL of the event. If it never arrives CloudFormation waits an hour
+before failing the stack, so the put is retried with backoff on connection
+errors, timeouts and 5xx or 429 responses, each attempt bounded by connect
+and read timeouts and by the time left in the invocation. The HTTP session
+is kept across warm invocations so its connections are reused.
+"""
+import random
+import threading
+import time
+
+# pylint: disable=import-error
+from retry import Deadline
+# pylint: enable=import-error
+
+CONNECT_TIMEOUT = 3.0
+READ_TIMEOUT = 10.0
+MAX_ATTEMPTS = 4
+BASE_DELAY = 0.5
+# time kept back so the last attempt can still be logged
+SAFETY_MARGIN_SECONDS = 0.2
+# statuses worth trying again, any other error status fails straight away
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_SESSION = {}
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session():
+    """requests session shared by every response, created on first use"""
+    with _SESSION_LOCK:
+        if 'session' not in _SESSION:
+            import requests  # pylint: disable=import-outside-toplevel
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=2)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _SESSION['session'] = session
+        return _SESSION['session']
+
+
+def clear_session():
+    with _SESSION_LOCK:
+        session = _SESSION.pop('session', None)
+    if session is not None:
+        session.close()
+
+
+class ResponseError(Exception):
+    """Raised when the response could not be delivered"""
+
+
+class ResponseSender(object):
+    """ puts a response body to a ResponseURL """
+
+    def __init__(self, logger, context=None, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY,
+                 sleep=time.sleep):
+        self._logger = logger
+        self._deadline = Deadline(context, margin=SAFETY_MARGIN_SECONDS)
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._sleep = sleep
+
+    def send(self, url, body):
+        """PUT body to url, returns the HTTP status code"""
+        import requests  # pylint: disable=import-outside-toplevel
+        headers = {'content-type': '', 'content-length': str(len(body))}
+        started = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._timeout()
+            attempt_started = time.time()
+            try:
+                response = get_session().put(url, data=body, headers=headers,
+                                             timeout=timeout)
+                error = None if response.status_code not in RETRY_STATUSES \
+                    else 'status {0}'.format(response.status_code)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                response, error = None, ex
+            self._logger.info('CloudFormation response attempt %s took %.3f seconds: %s',
+                              attempt, time.time() - attempt_started,
+                              error or response.status_code)
+
+            if error is None:
+                if response.status_code >= 400:
+                    raise ResponseError('CloudFormation response rejected with status '
+                                        '{0}: {1}'.format(response.status_code,
+                                                          response.text[:200]))
+                self._logger.info('CloudFormation response sent in %.3f seconds after %s '
+                                  'attempts', time.time() - started, attempt)
+                return response.status_code
+
+            delay = random.uniform(0, self._base_delay * 2 ** (attempt - 1))
+            if attempt >= self._max_attempts or \
+                    not self._deadline.allows(delay + self._connect_timeout):
+                raise ResponseError('CloudFormation response not sent after {0} attempts: '
+                                    '{1}'.format(attempt, error))
+            self._sleep(delay)
+
+    def _timeout(self):
+        """(connect, read) timeouts, shortened to fit in the invocation"""
+        remaining = self._deadline.remaining()
+        if remaining is None:
+            return (self._connect_timeout, self._read_timeout)
+        remaining = max(0.1, remaining)
+        return (min(self._connect_timeout, remaining), min(self._read_timeout, remaining))
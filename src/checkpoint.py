@@ -0,0 +1,163 @@
+""" Progress of a provisioning request, kept across invocations
+
+Every slot type and intent put for a request is checkpointed with its
+checksum and version under the StackId and LogicalResourceId of the request
+and a fingerprint of its properties. When the same request runs again, e.g.
+after the lambda timed out, the resources already done are skipped if Lex
+still has them with the checksum they were checkpointed with.
+
+The records are cleared once the request succeeds or fails. DynamoDB items
+also carry an expires attribute, for a table with time to live enabled on
+it to remove records of requests that never got that far.
+
+The store is chosen with the checkpointStore resource property and takes
+the same uris as stateStore:
+
+    file:///tmp/lex-checkpoints.json
+    sqlite:///tmp/lex-checkpoints.db
+    dynamodb://table-name
+"""
+import json
+import threading
+import time
+
+# pylint: disable=import-error
+import fingerprint
+import state_store
+from retry import Deadline
+from utils import ContinuationRequired, ValidationError
+# pylint: enable=import-error
+
+# resource type under which checkpoints are kept in a state store
+CHECKPOINT = 'checkpoint'
+# a CloudFormation custom resource request times out after an hour
+EXPIRES_SECONDS = 24 * 60 * 60
+
+
+class DynamoDbCheckpointStore(state_store.DynamoDbStateStore):
+    """ checkpoints kept as a json document attribute of a DynamoDB item """
+
+    def get(self, resource_type, name):
+        item = self._get_item(resource_type, name)
+        return None if item is None else json.loads(item['document']['S'])
+
+    def put(self, resource_type, name, record):
+        self._put_item(resource_type, name,
+                       {'document': {'S': json.dumps(record)},
+                        'expires': {'N': str(int(time.time()) + EXPIRES_SECONDS)}})
+
+
+class Checkpoint(object):
+    """ resources completed for one request
+
+    Each completed resource is its own record in the store, so completing
+    one writes a few bytes whatever the size of the bot
+    """
+
+    def __init__(self, store, key, request, deadline=None):
+        self._store = store
+        # records made for different resource properties never match
+        self._key = '{0}#{1}'.format(key, fingerprint.fingerprint(request))
+        # with a deadline no resource is started once it has passed
+        self._deadline = deadline
+        self._lock = threading.Lock()
+        # resource key -> record of the completed resources seen by this
+        # invocation, which clear deletes
+        self._completed = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._completed)
+
+    def check_time(self, seconds=0):
+        """Raise ContinuationRequired if seconds of work would pass the deadline"""
+        if self._deadline is not None and not self._deadline.allows(seconds):
+            raise ContinuationRequired('{0} resources done, out of time'.format(len(self)))
+
+    def completed(self, resource_type, name):
+        """checksum and version of a completed resource, None if not done"""
+        resource_key = _resource_key(resource_type, name)
+        with self._lock:
+            record = self._completed.get(resource_key)
+        if record is None:
+            record = self._store.get(CHECKPOINT, self._record_key(resource_key))
+            if record is None:
+                return None
+            with self._lock:
+                self._completed[resource_key] = record
+        return dict(record)
+
+    def complete(self, resource_type, name, checksum, version=None):
+        resource_key = _resource_key(resource_type, name)
+        record = {'checksum': checksum, 'version': version}
+        self._store.put(CHECKPOINT, self._record_key(resource_key), record)
+        with self._lock:
+            self._completed[resource_key] = record
+
+    def clear(self, resources=()):
+        """Forget the progress once the request is done
+
+        Deletes the records this invocation saw and those of resources,
+        (resource type, name) pairs, e.g. intents completed by fan-out workers
+        """
+        with self._lock:
+            resource_keys = set(self._completed)
+            self._completed = {}
+        resource_keys.update(_resource_key(resource_type, name)
+                             for resource_type, name in resources)
+        for resource_key in resource_keys:
+            self._store.delete(CHECKPOINT, self._record_key(resource_key))
+
+    def _record_key(self, resource_key):
+        return '{0}#{1}'.format(self._key, resource_key)
+
+
+def _resource_key(resource_type, name):
+    return '{0}#{1}'.format(resource_type, name)
+
+
+def checkpoint_key(event):
+    """Records of a request that is run again keep the same key, whatever
+    its RequestId, the Checkpoint adds the fingerprint of its properties"""
+    return '{0}#{1}'.format(event['StackId'], event['LogicalResourceId'])
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def store_from_uri(uri):
+    """The store for a checkpointStore property, None when it is not set
+
+    File and SQLite stores are shared with stateStore for the same uri
+    """
+    if not uri:
+        return None
+    scheme, separator, location = uri.partition('://')
+    if scheme != 'dynamodb' or not separator:
+        return state_store.from_uri(uri)
+
+    with _STORES_LOCK:
+        if uri not in _STORES:
+            _STORES[uri] = DynamoDbCheckpointStore(location)
+        return _STORES[uri]
+
+
+def from_event(event, context=None):
+    """The checkpoint of a request, None without a checkpointStore
+
+    With continueBelowSeconds the checkpoint stops new work once less time
+    than that is left in the invocation
+    """
+    resource_properties = event.get('ResourceProperties', {})
+    store = store_from_uri(resource_properties.get('checkpointStore'))
+    continue_below = resource_properties.get('continueBelowSeconds')
+    if store is None:
+        if continue_below is not None:
+            raise ValidationError('continueBelowSeconds needs a checkpointStore')
+        return None
+
+    request = dict((key, event.get(key)) for key in
+                   ('RequestType', 'ResourceProperties', 'OldResourceProperties'))
+    deadline = None if continue_below is None else Deadline(context, float(continue_below))
+    return Checkpoint(store, checkpoint_key(event), request, deadline=deadline)
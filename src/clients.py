@@ -0,0 +1,103 @@
+""" Shared boto3 clients
+
+Clients are created once per process and reused by every builder, worker
+thread and warm invocation so that session setup, endpoint resolution and
+TLS connections are only paid for on the first call. boto3 itself is only
+imported when the first client is created, which keeps it off the cold
+start of invocations that never call AWS.
+"""
+import threading
+
+# default connections kept per client, raised to match the provisioning
+# concurrency with ensure_pool_size
+MAX_POOL_CONNECTIONS = 10
+MAX_ATTEMPTS = 3
+READ_TIMEOUT = 60
+# calls on these clients go through retry.RetryPolicy, which owns their
+# retries, so botocore makes a single attempt
+POLICY_RETRIED = ('lex-models', 'lambda')
+
+_CLIENTS = {}
+_LOCK = threading.Lock()
+_SETTINGS = {'session': None, 'pool_size': MAX_POOL_CONNECTIONS}
+
+
+def client_config(max_pool_connections=MAX_POOL_CONNECTIONS, read_timeout=READ_TIMEOUT,
+                  total_max_attempts=None):
+    """botocore config shared by all clients, total_max_attempts includes
+    the first attempt"""
+    from botocore.config import Config  # pylint: disable=import-outside-toplevel
+    retries = {'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS}
+    if total_max_attempts is not None:
+        retries = {'mode': 'standard', 'total_max_attempts': total_max_attempts}
+    return Config(max_pool_connections=max_pool_connections,
+                  tcp_keepalive=True,
+                  read_timeout=read_timeout,
+                  retries=retries)
+
+
+def ensure_pool_size(max_workers):
+    """Make sure clients have a connection for every worker
+
+    Clients created with a smaller pool are replaced on their next use
+    """
+    with _LOCK:
+        _SETTINGS['pool_size'] = max(_SETTINGS['pool_size'], max_workers)
+
+
+def get_client(service_name):
+    """Return the shared client for service_name, creating it if needed"""
+    with _LOCK:
+        client, pool_size = _CLIENTS.get(service_name, (None, 0))
+        if client is None or pool_size < _SETTINGS['pool_size']:
+            if _SETTINGS['session'] is None:
+                import boto3  # pylint: disable=import-outside-toplevel
+                _SETTINGS['session'] = boto3.session.Session()
+            pool_size = _SETTINGS['pool_size']
+            total_max_attempts = 1 if service_name in POLICY_RETRIED else None
+            client = _SETTINGS['session'].client(
+                service_name, config=client_config(pool_size,
+                                                   total_max_attempts=total_max_attempts))
+            _CLIENTS[service_name] = (client, pool_size)
+        return client
+
+
+def single_use_client(service_name, read_timeout, total_max_attempts=1):
+    """A client that is not shared, for calls that need their own timeout
+    and retries, e.g. a synchronous invoke that must not outlast the caller.
+    A registered stand-in is returned as it is"""
+    with _LOCK:
+        client, pool_size = _CLIENTS.get(service_name, (None, 0))
+        if client is not None and pool_size == float('inf'):
+            return client
+        if _SETTINGS['session'] is None:
+            import boto3  # pylint: disable=import-outside-toplevel
+            _SETTINGS['session'] = boto3.session.Session()
+        session = _SETTINGS['session']
+    return session.client(service_name,
+                          config=client_config(1, read_timeout, total_max_attempts))
+
+
+class LazyClient(object):
+    """ the shared client for a service, created when an operation is first
+    looked up rather than when a builder is created """
+
+    def __init__(self, service_name):
+        self._service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(get_client(self._service_name), name)
+
+
+def register_client(service_name, client):
+    """Use client for service_name, e.g. a local stand-in for tests"""
+    with _LOCK:
+        _CLIENTS[service_name] = (client, float('inf'))
+
+
+def clear_clients():
+    """Drop all shared clients and settings"""
+    with _LOCK:
+        _CLIENTS.clear()
+        _SETTINGS['session'] = None
+        _SETTINGS['pool_size'] = MAX_POOL_CONNECTIONS
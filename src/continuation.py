@@ -0,0 +1,106 @@
+""" Carry a request that does not fit in one invocation over to the next
+
+With the continueBelowSeconds resource property set, no new resource is
+started once less time than that is left. The handler then invokes this
+function again asynchronously with the same event and a continuation token,
+and returns without responding to CloudFormation. The work done so far is
+in the checkpoint (see checkpoint.py), so the next invocation skips it and
+the last one sends the response.
+"""
+import json
+import logging
+import time
+
+# pylint: disable=import-error
+import clients
+from retry import Deadline, RetryPolicy
+from utils import ContinuationRequired, ProvisioningError
+# pylint: enable=import-error
+
+# event key of the continuation token
+TOKEN_KEY = 'Continuation'
+# invocations a request may take before it fails
+MAX_INVOCATIONS = 20
+
+
+class LambdaInvoker(object):
+    """ invokes this lambda function asynchronously, retrying throttles
+    until the lambda deadline """
+
+    def __init__(self, sleep=time.sleep):
+        self._sleep = sleep
+
+    def invoke(self, event, context):
+        retry_policy = RetryPolicy(logging.getLogger(__name__), deadline=Deadline(context),
+                                   sleep=self._sleep)
+        retry_policy.call(clients.get_client('lambda').invoke, 'invoke',
+                          FunctionName=context.invoked_function_arn,
+                          InvocationType='Event',
+                          Payload=json.dumps(event, default=str))
+
+
+class LocalInvoker(object):
+    """ keeps continued events to run in this process, e.g. in tests """
+
+    def __init__(self, handler):
+        self._handler = handler
+        self.events = []
+
+    def invoke(self, event, context):  # pylint: disable=unused-argument
+        self.events.append(event)
+
+    def run(self, new_context):
+        """Run continued events until none are left, returns how many ran"""
+        invocations = 0
+        while self.events:
+            invocations += 1
+            self._handler(self.events.pop(0), new_context())
+        return invocations
+
+
+_INVOKER = [LambdaInvoker()]
+
+
+def register_invoker(invoker):
+    """Use invoker to continue requests instead of invoking lambda"""
+    _INVOKER[0] = LambdaInvoker() if invoker is None else invoker
+
+
+def invocation(event):
+    """Number of the invocation handling event, starting at 1"""
+    return event.get(TOKEN_KEY, {}).get('invocation', 1)
+
+
+def required(ex):
+    """True if ex only means the work ran out of time"""
+    if isinstance(ex, ContinuationRequired):
+        return True
+    if isinstance(ex, ProvisioningError) and ex.failures:
+        return all(required(failure) for failure in ex.failures.values())
+    return False
+
+
+def continue_request(event, context, ex, logger):
+    """Hand the rest of the request to another invocation
+
+    Returns True if it was handed over, the caller then must not respond
+    to CloudFormation. False if the invoke failed, so that the caller
+    responds FAILED
+    """
+    if not required(ex):
+        return False
+    next_invocation = invocation(event) + 1
+    if next_invocation > MAX_INVOCATIONS:
+        logger.error('Request still not done after %s invocations', MAX_INVOCATIONS)
+        return False
+
+    logger.info('%s, continuing in invocation %s', ex, next_invocation)
+    try:
+        _INVOKER[0].invoke(dict(event, **{TOKEN_KEY: {'invocation': next_invocation}}),
+                           context)
+    except Exception as invoke_error:  # pylint: disable=broad-except
+        # the caller responds FAILED rather than leaving the stack waiting
+        logger.error('Could not continue in invocation %s: %s', next_invocation,
+                     invoke_error)
+        return False
+    return True
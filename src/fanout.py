@@ -0,0 +1,148 @@
+""" Spread the intents of a large bot over several invocations
+
+With the workers resource property above 1 the invocation handling the
+CloudFormation request becomes a coordinator. It puts the slot types,
+splits the intents into that many shards and invokes this function once per
+shard, synchronously and in parallel. Each worker puts its intents and
+returns their versions; the coordinator then puts the bot with all of them
+and reports how long every worker took.
+
+A worker has the time the coordinator has left, less WORKER_RETURN_SECONDS
+to hand its result back, and the invoke is not retried, so a worker never
+outlasts the coordinator. With continueBelowSeconds a worker that runs out
+of time returns what it checkpointed and the coordinator continues the
+request, the next invocation fans out again and skips the intents done.
+"""
+import json
+import time
+
+# pylint: disable=import-error
+import clients
+from parallel import run_concurrently
+from retry import Deadline
+from utils import ContinuationRequired, ProvisioningError
+# pylint: enable=import-error
+
+# event key holding the work of a worker invocation
+WORKER_KEY = 'LexWorker'
+# seconds a worker leaves the coordinator to take in its result
+WORKER_RETURN_SECONDS = 5
+# read timeout of a worker invoke when the coordinator has no deadline
+WORKER_TIMEOUT_SECONDS = 300
+
+
+class LambdaWorkerInvoker(object):
+    """ invokes this lambda function and waits for the worker result """
+
+    def invoke(self, payload, context, timeout=None):
+        # not retried, a worker invoked twice would put its intents twice
+        client = clients.single_use_client('lambda', timeout or WORKER_TIMEOUT_SECONDS)
+        response = client.invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(payload, default=str))
+        result = json.loads(response['Payload'].read())
+        if response.get('FunctionError'):
+            raise ProvisioningError('Worker failed: {0}'.format(result.get('errorMessage')))
+        return result
+
+
+class LocalWorkerInvoker(object):
+    """ runs workers in this process, e.g. in tests """
+
+    def __init__(self, handler, new_context):
+        self._handler = handler
+        self._new_context = new_context
+
+    def invoke(self, payload, context, timeout=None):  # pylint: disable=unused-argument
+        # through json, as the payload of a real invoke would be
+        return self._handler(json.loads(json.dumps(payload, default=str)),
+                             self._new_context())
+
+
+_INVOKER = [LambdaWorkerInvoker()]
+
+
+def register_invoker(invoker):
+    """Use invoker to run workers instead of invoking lambda"""
+    _INVOKER[0] = LambdaWorkerInvoker() if invoker is None else invoker
+
+
+def is_worker(event):
+    return WORKER_KEY in event
+
+
+def shard(names, shards):
+    """Split names round robin into at most shards non-empty lists"""
+    shards = max(1, min(shards, len(names)))
+    return [names[index::shards] for index in range(shards)]
+
+
+class WorkerContext(object):
+    """ the lambda context of a worker, with no more time than the
+    coordinator gave it """
+
+    def __init__(self, context, deadline):
+        self._context = context
+        self._deadline = deadline
+
+    def get_remaining_time_in_millis(self):
+        remaining = None if self._deadline is None else (self._deadline - time.time()) * 1000
+        get_remaining = getattr(self._context, 'get_remaining_time_in_millis', None)
+        own = get_remaining() if callable(get_remaining) else None
+        if not isinstance(own, (int, float)):
+            return remaining
+        return own if remaining is None else min(own, remaining)
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
+def worker_context(event, context):
+    """context bounded by the deadline the coordinator set for the worker"""
+    return WorkerContext(context, event[WORKER_KEY].get('deadline'))
+
+
+def worker_event(event, index, intent_names, changed_intents=None, deadline=None):
+    """The event for the worker provisioning intent_names"""
+    work = {'shard': index, 'intents': intent_names,
+            'changedIntents': None if changed_intents is None else list(changed_intents),
+            'deadline': deadline}
+    payload = dict((key, value) for key, value in event.items() if key != 'ResponseURL')
+    payload[WORKER_KEY] = work
+    return payload
+
+
+def run_workers(event, context, intent_names, shards, changed_intents=None):
+    """Provision intent_names with one worker per shard
+
+    Returns intent name -> intent version, and the timing of every worker.
+    Raises ContinuationRequired if a worker ran out of time
+    """
+    remaining = Deadline(context).remaining()
+    deadline = None if remaining is None else time.time() + remaining - WORKER_RETURN_SECONDS
+    payloads = [worker_event(event, index, names, changed_intents, deadline)
+                for index, names in enumerate(shard(intent_names, shards))]
+
+    def run_worker(payload):
+        started = time.time()
+        timeout = None if deadline is None else max(1, deadline - started + WORKER_RETURN_SECONDS)
+        result = _INVOKER[0].invoke(payload, context, timeout=timeout)
+        result['roundTripSeconds'] = round(time.time() - started, 3)
+        return result
+
+    results = run_concurrently(run_worker, payloads, max_workers=len(payloads),
+                               key=lambda payload: 'shard {0}'.format(
+                                   payload[WORKER_KEY]['shard']),
+                               fail_fast=False)
+    continued = [result['shard'] for result in results if result.get('continuation')]
+    if continued:
+        raise ContinuationRequired('Workers of shards {0} out of time'.format(continued))
+    versions = {}
+    for result in results:
+        versions.update((version['intentName'], version['intentVersion'])
+                        for version in result['intentVersions'])
+    timings = [{'shard': result['shard'], 'intents': len(result['intentVersions']),
+                'seconds': result['seconds'], 'roundTripSeconds': result['roundTripSeconds']}
+               for result in results]
+    return versions, timings
@@ -0,0 +1,67 @@
+""" Canonical fingerprints of the definitions sent to Lex
+
+Lex returns more than we send (checksum, version, dates, defaults) so the
+response is projected onto the shape of the request before comparing.
+"""
+import hashlib
+import json
+
+# keys Lex uses to track a resource rather than describe it
+IGNORED_KEYS = ('checksum', 'version', 'createVersion', 'processBehavior')
+
+
+def fingerprint(request):
+    """sha256 of the canonical json of a put request"""
+    canonical = json.dumps(_strip(request), sort_keys=True, separators=(',', ':'),
+                           default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def unchanged(request, response, normalize=None):
+    """True if response already holds everything in request
+
+    normalize is applied to both sides before comparing, e.g. to ignore
+    the order of slot type values
+    """
+    if response is None:
+        return False
+    request = _strip(request)
+    current = project(request, response)
+    if normalize is not None:
+        request, current = normalize(request), normalize(current)
+    return fingerprint(request) == fingerprint(current)
+
+
+def project(request, response):
+    """Keep only the parts of response that have a counterpart in request"""
+    if isinstance(request, dict):
+        if not isinstance(response, dict):
+            return response
+        projected = {}
+        for key, value in request.items():
+            if key not in response and value in ([], {}):
+                # Lex leaves out empty collections
+                projected[key] = value
+            else:
+                projected[key] = project(value, response.get(key))
+        return projected
+
+    if isinstance(request, list) and isinstance(response, list) \
+            and len(request) == len(response):
+        return [project(item, current) for item, current in zip(request, response)]
+
+    return response
+
+
+def normalize_slot_type(request):
+    """Slot type values and synonyms are unordered"""
+    normalized = dict(request)
+    values = normalized.get('enumerationValues') or []
+    normalized['enumerationValues'] = sorted(
+        [dict(value, synonyms=sorted(value.get('synonyms') or [])) for value in values],
+        key=lambda value: value.get('value'))
+    return normalized
+
+
+def _strip(request):
+    return dict((key, value) for key, value in request.items() if key not in IGNORED_KEYS)
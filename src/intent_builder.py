@@ -1,17 +1,25 @@
 """ Provision AWS Lex resources using python SDK
 """
-from botocore.exceptions import ClientError
+import json
+from collections import OrderedDict
+
+import fingerprint
 from lex_helper import LexHelper
-from utils import ValidationError
+from parallel import run_concurrently
+from payload_log import log_payload
+from scheduler import INTENT
+from utils import client_error, ValidationError
 
 
 class IntentBuilder(LexHelper, object):
-
-    RETRY_SLEEP = 5
-
-    def __init__(self, logger, context, lex_sdk=None, lambda_sdk=None):
+    def __init__(self, logger, context, lex_sdk=None, lambda_sdk=None, state=None,
+                 checkpoint=None):
         self._logger = logger
         self._context = context
+        self._state = state
+        self._checkpoint = checkpoint
+        # (function arn, statement id) of codehook permissions known to exist
+        self._granted = set()
         if lex_sdk is None:
             self._lex_sdk = self._get_lex_sdk()
         else:
@@ -28,51 +36,131 @@ class IntentBuilder(LexHelper, object):
         Currently only supports intents that use the same lambda for both
         code hooks (i.e. 'dialogCodeHook' and 'fulfillmentActivity')
         """
+        record = self._checkpointed(INTENT, intent.intent_name)
+        if record is not None and record.get('version'):
+            return {"intentName": intent.intent_name,
+                    "intentVersion": record['version']}
+
         self._logger.info('put intent')
 
         self._add_permission_to_lex_to_codehook(intent)
         # TODO if the intent does not need to invoke a lambda, create it
-        exists, checksum = self._intent_exists(intent.intent_name)
-        if exists is False:
-            new_intent = self._create_lex_resource(
-                self._lex_sdk.put_intent,
-                'put_intent',
-                self.put_intent_request(intent)
-            )
-            checksum = new_intent['checksum']
+        request = self.put_intent_request(intent)
+        cached = self._cached_state(INTENT, intent.intent_name)
+        new_intent = self._put_with_cached_checksum(self._lex_sdk.put_intent, 'put_intent',
+                                                    cached, request)
+        if new_intent is not None and new_intent['version'] != '$LATEST':
+            # unchanged since the last deploy and already versioned
+            self._complete(INTENT, intent.intent_name, new_intent['checksum'],
+                           new_intent['version'])
+            return {"intentName": intent.intent_name,
+                    "intentVersion": new_intent['version']}
+
+        if new_intent is None:
+            current = self._describe_intent(intent.intent_name)
+            if current is None:
+                new_intent = self._create_lex_resource(
+                    self._lex_sdk.put_intent,
+                    'put_intent',
+                    request
+                )
 
-        else:
-            new_intent = self._update_lex_resource(
-                self._lex_sdk.put_intent,
-                'put_intent',
-                checksum,
-                self.put_intent_request(intent)
-            )
-            checksum = new_intent['checksum']
-
-        version_response = self._lex_sdk.create_intent_version(
-            name=intent.intent_name,
-            checksum=checksum)
-
-        self._logger.info('Created new intent: %s', version_response)
+            elif fingerprint.unchanged(request, current):
+                # no put, but $LATEST may never have been versioned, e.g. if
+                # an earlier create_intent_version failed. Lex returns the
+                # existing version when $LATEST has not changed since
+                self._logger.info('Intent %s unchanged, not putting it', intent.intent_name)
+                new_intent = current
+
+            else:
+                new_intent = self._update_lex_resource(
+                    self._lex_sdk.put_intent,
+                    'put_intent',
+                    current['checksum'],
+                    request
+                )
+        checksum = new_intent['checksum']
+
+        version_response = self._call(self._lex_sdk.create_intent_version,
+                                      'create_intent_version',
+                                      name=intent.intent_name,
+                                      checksum=checksum)
+
+        log_payload(self._logger, 'Created new intent', version_response)
+        self._save_state(INTENT, intent.intent_name, checksum, version_response['version'],
+                         request)
+        self._complete(INTENT, intent.intent_name, checksum, version_response['version'])
         return {"intentName": version_response['name'],
                 "intentVersion": version_response['version']}
 
-    def delete_intents(self, intents, max_attempts=2):
-        '''Delete all intents in our tuple'''
+    def current_version(self, intent):
+        """Version of an intent the update did not change, put it if it does
+        not exist
 
-        self._logger.info('delete all intents')
-        for intent in intents:
-            if(self._intent_exists(intent)):
-                self._delete_lex_resource(self._lex_sdk.delete_intent,
-                                          'delete_intent',
-                                          name=intent)
+        The version comes from create_intent_version with the $LATEST
+        checksum, which returns the existing version unless $LATEST was
+        never versioned
+        """
+        cached = self._cached_state(INTENT, intent.intent_name)
+        if cached is not None and cached.get('checksum'):
+            try:
+                return self._create_intent_version(intent.intent_name, cached['checksum'])
+            except client_error() as ex:
+                if ex.response['Error']['Code'] not in self.STALE_CHECKSUM_ERRORS:
+                    raise
+                self._logger.info('Cached checksum of %s is stale', intent.intent_name)
+
+        current = self._describe_intent(intent.intent_name)
+        if current is None:
+            return self.put_intent(intent)
+        return self._create_intent_version(intent.intent_name, current['checksum'])
+
+    def _create_intent_version(self, name, checksum):
+        version_response = self._call(self._lex_sdk.create_intent_version,
+                                      'create_intent_version', name=name, checksum=checksum)
+        self._logger.info('Using version %s of unchanged intent %s',
+                          version_response['version'], name)
+        return {"intentName": name, "intentVersion": version_response['version']}
+
+    def delete_intents(self, intents, max_workers=1, leave_in_use=False):
+        '''Delete intents by name using up to max_workers threads
+
+        With leave_in_use, intents still used by older bot versions are left
+        in place rather than retried, e.g. intents an update removed
+        '''
+
+        self._logger.info('delete %s intents', len(intents))
+        run_concurrently(lambda intent: self._delete_intent(intent, leave_in_use),
+                         intents,
+                         max_workers=max_workers,
+                         fail_fast=False)
+
+    def _delete_intent(self, intent, leave_in_use=False):
+        self._check_time()
+        if self._deleted(INTENT, intent):
+            return
+        intent_exists, _ = self._intent_exists(intent)
+        if intent_exists:
+            # the bot that used the intent can take a while to go
+            if not self._delete_lex_resource(self._lex_sdk.delete_intent,
+                                             'delete_intent',
+                                             max_attempts=self.IN_USE_DELETE_TRIES,
+                                             leave_in_use=leave_in_use,
+                                             name=intent):
+                return
+        self._forget_state(INTENT, intent)
+        self._complete(INTENT, intent, None)
 
     def _intent_exists(self, name, versionOrAlias='$LATEST'):
         return self._get_resource(self._lex_sdk.get_intent,
                                   'get_intent',
                                   {'name': name, 'version': versionOrAlias})
 
+    def _describe_intent(self, name, versionOrAlias='$LATEST'):
+        return self._describe_resource(self._lex_sdk.get_intent,
+                                       'get_intent',
+                                       {'name': name, 'version': versionOrAlias})
+
     def _create_message(self, messageKey, content, max_attempts=None):
         message = {
             messageKey: {
@@ -221,22 +309,81 @@ class IntentBuilder(LexHelper, object):
         self._put_request_followUp(request, plaintext, max_attempts)
         self._put_request_conclusion(request, plaintext)
 
-        self._logger.info(request)
+        log_payload(self._logger, 'put_intent request', request)
 
         return request
 
+    def reconcile_permissions(self, intents, max_workers=1):
+        """Let Lex invoke the codehooks of intents
+
+        Intents are grouped by codehook, the policy of each function is read
+        once and only missing statements are added. Functions are done in
+        parallel, the statements of one function one at a time because they
+        all change the same policy.
+        """
+        intents_by_function = OrderedDict()
+        for intent in intents:
+            if intent.codehook_arn:
+                intents_by_function.setdefault(intent.codehook_arn, []).append(intent)
+
+        def reconcile(function_arn):
+            self._reconcile_function_permissions(function_arn,
+                                                 intents_by_function[function_arn])
+
+        run_concurrently(reconcile,
+                         list(intents_by_function),
+                         max_workers=max_workers,
+                         fail_fast=False)
+
+    def assume_granted(self, intents):
+        """Take the codehook permissions of intents as granted, e.g. by the
+        coordinator of a fan-out, so putting them does not add_permission"""
+        for intent in intents:
+            if intent.codehook_arn:
+                self._granted.add((intent.codehook_arn, self._statement_id(intent)))
+
+    def _reconcile_function_permissions(self, function_arn, intents):
+        existing = self._policy_statement_ids(function_arn)
+        for intent in intents:
+            statement_id = self._statement_id(intent)
+            if statement_id in existing:
+                self._granted.add((function_arn, statement_id))
+            else:
+                self._add_permission_to_lex_to_codehook(intent)
+
+    def _policy_statement_ids(self, function_arn):
+        try:
+            response = self._call(self._lambda_sdk.get_policy, 'get_policy',
+                                  FunctionName=function_arn)
+        except client_error() as ex:
+            if ex.response['Error']['Code'] == 'ResourceNotFoundException':
+                return set()
+            raise
+        policy = json.loads(response['Policy'])
+        statement_ids = set(statement.get('Sid') for statement in policy.get('Statement', []))
+        self._logger.info('Codehook %s has %s policy statements',
+                          function_arn, len(statement_ids))
+        return statement_ids
+
+    def _statement_id(self, intent):
+        _, aws_region = self._get_aws_details()
+        return 'lex-' + aws_region + '-' + intent.intent_name
+
     def _add_permission_to_lex_to_codehook(self, intent):
         # codehook_uri, intent_name =
         if intent.codehook_arn:
             # If the intent needs to invoke a lambda function, we must give it
             # permission to do so before creating the intent.
             self._logger.info("Codehook arn: %s", intent.codehook_arn)
-            _, aws_region = self._get_aws_details()
 
             # function_name = arn_tokens[5]
-            statement_id = 'lex-' + aws_region + '-' + intent.intent_name
+            statement_id = self._statement_id(intent)
+            if (intent.codehook_arn, statement_id) in self._granted:
+                return
             try:
-                add_permission_response = self._lambda_sdk.add_permission(
+                add_permission_response = self._call(
+                    self._lambda_sdk.add_permission,
+                    'add_permission',
                     FunctionName=intent.codehook_arn,
                     StatementId=statement_id,
                     Action='lambda:invokeFunction',
@@ -247,10 +394,15 @@ class IntentBuilder(LexHelper, object):
                     'Response for adding intent permission to lambda: '
                     + '%s', add_permission_response
                 )
-            except ClientError as ex:
-                if ex.response['Error']['Code'] == 'ResourceConflictException':
-                    self._logger.info(
-                        'Failed to add permission to existing lambda')
-                    self._logger.info(ex)
-                else:
+            except client_error() as ex:
+                if ex.response['Error']['Code'] != 'ResourceConflictException':
+                    raise
+                # a conflict is also raised while another update of the
+                # policy is in progress, so only a statement that is
+                # there counts as granted
+                if statement_id not in self._policy_statement_ids(intent.codehook_arn):
+                    self._logger.error('Failed to add permission %s to %s',
+                                       statement_id, intent.codehook_arn)
                     raise
+                self._logger.info('Permission %s already granted', statement_id)
+            self._granted.add((intent.codehook_arn, statement_id))
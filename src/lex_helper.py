@@ -1,32 +1,193 @@
 import os
-import time
-import traceback
+import threading
 
-import boto3
-from botocore.exceptions import ClientError
+# pylint: disable=import-error
+import clients
+import fingerprint
+from payload_log import log_payload
+from retry import Deadline, RetryPolicy
+from scheduler import BOT, INTENT, SLOT_TYPE
+from utils import client_error
+# pylint: enable=import-error
+
+# resource type -> the get and its version argument that read $LATEST
+_GET_LATEST = {
+    BOT: ('get_bot', 'versionOrAlias'),
+    INTENT: ('get_intent', 'version'),
+    SLOT_TYPE: ('get_slot_type', 'version'),
+}
+
+# account id and region are the same for every call made by this lambda so
+# they are kept for the lifetime of the process, i.e. across warm invocations.
+# They are stored together as one (account id, region) tuple so a reader
+# never sees one without the other, whatever another thread is doing
+_AWS_DETAILS = {}
+_AWS_DETAILS_LOCK = threading.Lock()
+
+
+def cache_aws_details(arn):
+    """Cache the account id and region from an ARN in this account
+
+    e.g. the invoked function ARN or a custom resource ServiceToken.
+    Returns True if the ARN could be used.
+    """
+    return _cache_arn_details(arn) is not None
+
+
+def _cache_arn_details(arn):
+    """Cache and return (account id, region) of an ARN, None if it has none"""
+    if not isinstance(arn, str):
+        return None
+    tokens = arn.split(':')
+    if len(tokens) < 6 or not tokens[4].isdigit():
+        return None
+
+    details = (tokens[4], os.environ.get('AWS_REGION', tokens[3]))
+    with _AWS_DETAILS_LOCK:
+        _AWS_DETAILS['details'] = details
+    return details
+
+
+def clear_aws_details():
+    """Forget the cached account id and region"""
+    with _AWS_DETAILS_LOCK:
+        _AWS_DETAILS.clear()
 
 
 class LexHelper(object):
     MAX_DELETE_TRIES = 5
-    RETRY_SLEEP = 5
+    # intents and slot types are retried while a bot or intent that is being
+    # deleted still uses them, backing off until the lambda deadline
+    IN_USE_DELETE_TRIES = 10
+    # errors from a put with a cached checksum that mean the resource was
+    # changed or deleted outside this provisioner
+    STALE_CHECKSUM_ERRORS = ('PreconditionFailedException',)
     # pylint: disable=no-member
 
     def _get_lex_sdk(self):
-        return boto3.Session().client('lex-models')
+        return clients.LazyClient('lex-models')
 
     def _get_lambda_sdk(self):
-        return boto3.Session().client('lambda')
+        return clients.LazyClient('lambda')
 
-    def _get_resource(self, func, func_name, properties):
+    def _retry_policy(self):
+        if getattr(self, '_retry', None) is None:
+            self._retry = RetryPolicy(self._logger,
+                                      deadline=Deadline(getattr(self, '_context', None)))
+        return self._retry
+
+    def _call(self, func, func_name, retryable=(), max_attempts=None, **kwargs):
+        """Call a Lex or Lambda SDK function with the shared retry policy"""
+        return self._retry_policy().call(func, func_name, retryable=retryable,
+                                         max_attempts=max_attempts, **kwargs)
+
+    def _cached_state(self, resource_type, name):
+        """Last deployed record of a resource, None without a state store"""
+        state = getattr(self, '_state', None)
+        return None if state is None else state.get(resource_type, name)
+
+    def _save_state(self, resource_type, name, checksum, version=None, request=None):
+        """Remember what was deployed, request is the put request as compared
+        by fingerprint"""
+        state = getattr(self, '_state', None)
+        if state is None:
+            return
+        state.put(resource_type, name, {
+            'checksum': checksum,
+            'version': version,
+            'fingerprint': None if request is None else fingerprint.fingerprint(request)
+        })
+
+    def _forget_state(self, resource_type, name):
+        state = getattr(self, '_state', None)
+        if state is not None:
+            state.delete(resource_type, name)
+
+    def _checkpointed(self, resource_type, name):
+        """Checkpoint record of a resource an earlier invocation of this
+        request completed, None if it was not
+
+        Each resource is checked with a get, the record of the bot gets its
+        build status, and is None if Lex has since changed it
+        """
+        checkpoint = getattr(self, '_checkpoint', None)
+        if checkpoint is None:
+            return None
+        self._check_time()
+        record = checkpoint.completed(resource_type, name)
+        if record is None:
+            return None
+        func_name, version_argument = _GET_LATEST[resource_type]
+        current = self._describe_resource(getattr(self._lex_sdk, func_name), func_name,
+                                          {'name': name, version_argument: '$LATEST'})
+        if current is None or current['checksum'] != record['checksum']:
+            self._logger.info('%s %s changed since it was checkpointed', resource_type, name)
+            return None
+        if resource_type == BOT:
+            record = dict(record, status=current.get('status'))
+        self._logger.info('%s %s already done by an earlier invocation', resource_type, name)
+        return record
+
+    def _deleted(self, resource_type, name):
+        """True if an earlier invocation of this request deleted the resource"""
+        checkpoint = getattr(self, '_checkpoint', None)
+        return checkpoint is not None and checkpoint.completed(resource_type, name) is not None
+
+    def _check_time(self, seconds=0):
+        """Raise ContinuationRequired when the checkpoint says to stop"""
+        checkpoint = getattr(self, '_checkpoint', None)
+        if checkpoint is not None:
+            checkpoint.check_time(seconds)
+
+    def _complete(self, resource_type, name, checksum, version=None):
+        checkpoint = getattr(self, '_checkpoint', None)
+        if checkpoint is not None:
+            checkpoint.complete(resource_type, name, checksum, version)
+
+    def _put_with_cached_checksum(self, func, func_name, cached, properties, compared=None):
+        """Put using the checksum from the state store instead of a get
+
+        If the cached fingerprint matches the request, or compared when the
+        fingerprint was taken of another form of it, nothing is put and the
+        cached checksum and version, '$LATEST' without one, are returned.
+        Returns None if there is no cached checksum or it is stale, the
+        caller then gets the checksum from Lex
+        """
+        if cached is None or not cached.get('checksum'):
+            return None
+        request = properties if compared is None else compared
+        if cached.get('fingerprint') == fingerprint.fingerprint(request):
+            self._logger.info('%s unchanged since the last deploy, not calling %s',
+                              properties['name'], func_name)
+            return {'name': properties['name'], 'checksum': cached['checksum'],
+                    'version': cached.get('version') or '$LATEST'}
         try:
-            get_response = func(**properties)
+            response = self._call(func, func_name, checksum=cached['checksum'], **properties)
+            self._logger.info('Updated lex resource using %s with cached checksum', func_name)
+            return response
+        except client_error() as ex:
+            if ex.response['Error']['Code'] not in self.STALE_CHECKSUM_ERRORS:
+                raise
+            self._logger.info('Cached checksum of %s is stale (%s)', properties['name'],
+                              ex.response['Error']['Code'])
+            return None
+
+    def _get_resource(self, func, func_name, properties):
+        get_response = self._describe_resource(func, func_name, properties)
+        if get_response is None:
+            return False, None
 
-            self._logger.info(get_response)
-            checksum = get_response['checksum']
+        return True, get_response['checksum']
 
-            return True, checksum
+    def _describe_resource(self, func, func_name, properties):
+        """Return the full get response or None if the resource does not exist"""
+        try:
+            get_response = self._call(func, func_name, **properties)
+
+            log_payload(self._logger, func_name, get_response)
+            return get_response
 
-        except ClientError as ex:
+        except client_error() as ex:
             http_status_code = None
             if 'ResponseMetadata' in ex.response:
                 response_metadata = ex.response['ResponseMetadata']
@@ -34,16 +195,16 @@ class LexHelper(object):
                     http_status_code = response_metadata['HTTPStatusCode']
             if http_status_code == 404:
                 self._logger.info('%s %s not found', func_name, properties['name'])
-                return False, None
+                return None
 
             self._logger.error('Lex %s call for %s failed', func_name, properties['name'])
             raise ex
 
     def _create_lex_resource(self, func, func_name, properties):
         try:
-            response = func(**properties)
-            self._logger.info(
-                'Created lex resource using %s, response: %s', func_name, response)
+            response = self._call(func, func_name, **properties)
+            log_payload(self._logger, 'Created lex resource using {0}'.format(func_name),
+                        response)
             return response
         except Exception as ex:
             self._logger.error(
@@ -53,9 +214,9 @@ class LexHelper(object):
 
     def _update_lex_resource(self, func, func_name, checksum, properties):
         try:
-            response = func(checksum=checksum, **properties)
-            self._logger.info(
-                'Updated lex resource using %s, response: %s', func_name, response)
+            response = self._call(func, func_name, checksum=checksum, **properties)
+            log_payload(self._logger, 'Updated lex resource using {0}'.format(func_name),
+                        response)
             return response
         except Exception as ex:
             self._logger.error(
@@ -63,31 +224,51 @@ class LexHelper(object):
             self._logger.error(ex)
             raise
 
-    def _delete_lex_resource(self, func, func_name, **properties):
-        '''Delete lex resource'''
+    def _delete_lex_resource(self, func, func_name, max_attempts=None, leave_in_use=False,
+                             **properties):
+        '''Delete lex resource, retrying while it is still in use
+
+        A resource that is already gone is fine, any other error, including
+        one still in use once the attempts run out, is raised so the caller
+        does not record it as deleted. With leave_in_use a resource in use
+        is not retried but logged and left in place, returns False then
+        '''
         self._logger.info('%s : %s', func_name, properties)
-        count = self.MAX_DELETE_TRIES
-        while True:
-            try:
-                func(**properties)
-                self._logger.info('finished %s: %s', func_name, properties)
-                break
-            except ClientError as ex:
-                if self._not_found(ex, func_name):
-                    break
-                if self._try_again(count, func_name):
-                    continue
-                else:
-                    break
-            self._logger.warning('Lex %s call failed', func_name)
-            traceback.print_exc()
+        max_attempts = self.MAX_DELETE_TRIES if max_attempts is None else max_attempts
+        retryable = () if leave_in_use else ('ResourceInUseException',)
+        try:
+            self._call(func, func_name, retryable=retryable,
+                       max_attempts=max_attempts, **properties)
+            self._logger.info('finished %s: %s', func_name, properties)
+        except client_error() as ex:
+            if self._not_found(ex, func_name):
+                return True
+            if leave_in_use and ex.response['Error']['Code'] == 'ResourceInUseException':
+                self._logger.warning('Lex %s left %s in place, older versions still use it',
+                                     func_name, properties)
+                return False
+            self._logger.warning('Lex %s call failed: %s', func_name, ex)
+            raise
+        return True
 
     def _get_aws_details(self):
-        aws_region = os.environ['AWS_REGION']
-        sts = boto3.client('sts')
-        aws_account_id = sts.get_caller_identity()["Arn"].split(':')[4]
+        """(account id, region), read in one lookup"""
+        details = _AWS_DETAILS.get('details')
+        if details is not None:
+            return details
+        context = getattr(self, '_context', None)
+        details = _cache_arn_details(getattr(context, 'invoked_function_arn', None))
+        return self._cache_caller_identity() if details is None else details
 
-        return aws_account_id, aws_region
+    def _cache_caller_identity(self):
+        with _AWS_DETAILS_LOCK:
+            details = _AWS_DETAILS.get('details')
+            if details is None:
+                sts = clients.get_client('sts')
+                details = (sts.get_caller_identity()["Arn"].split(':')[4],
+                           os.environ['AWS_REGION'])
+                _AWS_DETAILS['details'] = details
+            return details
 
     def _get_intent_arn(self, intent_name, prefix=''):
         aws_account_id, aws_region = self._get_aws_details()
@@ -105,19 +286,3 @@ class LexHelper(object):
                               + ' not exist', func_name)
             return True
         return False
-
-    def _try_again(self, count, func_name):
-        count -= 1
-        if count:
-            self._logger.warning(
-                'Lex %s retry: %s. Sleeping for %s seconds',
-                func_name,
-                self.MAX_DELETE_TRIES - count,
-                self.RETRY_SLEEP
-            )
-            time.sleep(self.RETRY_SLEEP)
-            return True
-        else:
-            self._logger.error(
-                'Lex delete_slot_type call max retries')
-            return False
@@ -0,0 +1,128 @@
+""" Lex API call metrics in CloudWatch Embedded Metric Format
+
+Each SDK call is written to stdout as one EMF json line, CloudWatch turns
+them into metrics without a metrics client. A summary line per invocation
+gives the totals.
+"""
+import json
+import sys
+import threading
+import time
+
+NAMESPACE = 'LexProvisioner'
+
+# verbs and suffixes stripped from an operation to get its resource type
+OPERATION_VERBS = ('get_', 'put_', 'create_', 'delete_', 'add_', 'remove_')
+OPERATION_SUFFIXES = ('_versions', '_version', '_aliases', '_alias')
+
+
+def resource_type(operation):
+    """e.g. create_intent_version -> intent, add_permission -> permission"""
+    for verb in OPERATION_VERBS:
+        if operation.startswith(verb):
+            operation = operation[len(verb):]
+            break
+    for suffix in OPERATION_SUFFIXES:
+        if operation.endswith(suffix):
+            return operation[:-len(suffix)]
+    return operation
+
+
+def payload_size(payload):
+    """Size in bytes of a request or response once serialised"""
+    if payload is None:
+        return 0
+    return len(json.dumps(payload, default=str))
+
+
+def response_size(response):
+    """Size in bytes of a response body from its content-length header"""
+    headers = (response or {}).get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    try:
+        return int(headers.get('content-length', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class MetricsRecorder(object):
+    """ records Lex calls and writes them as EMF lines """
+
+    def __init__(self, namespace=NAMESPACE, stream=None, enabled=True, request_sizes=False):
+        self._namespace = namespace
+        self._stream = stream
+        self._lock = threading.Lock()
+        self.enabled = enabled
+        # request sizes mean serialising every request, so they are opt in
+        self.request_sizes = request_sizes
+        self._totals = {}
+
+    def reset(self, enabled=True, request_sizes=False):
+        with self._lock:
+            self.enabled = enabled
+            self.request_sizes = request_sizes
+            self._totals = {}
+
+    def record(self, operation, latency_ms, retries=0, throttles=0, error_code=None,
+               request_bytes=0, response_bytes=0):
+        """Record one SDK call, including any retries it needed"""
+        if not self.enabled:
+            return
+        values = {
+            'Latency': round(latency_ms, 1),
+            'Retries': retries,
+            'Throttles': throttles,
+            'Errors': 0 if error_code is None else 1,
+            'RequestBytes': request_bytes,
+            'ResponseBytes': response_bytes,
+        }
+        line = self._emf({'Operation': operation, 'ResourceType': resource_type(operation)},
+                         values, ErrorCode=error_code)
+
+        with self._lock:
+            totals = self._totals.setdefault(operation, dict.fromkeys(values, 0))
+            totals['Calls'] = totals.get('Calls', 0) + 1
+            for name, value in values.items():
+                totals[name] += value
+            self._write(line)
+
+    def emit_summary(self):
+        """Write the invocation totals as one EMF line"""
+        if not self.enabled:
+            return
+        with self._lock:
+            operations = dict((name, dict(totals)) for name, totals in self._totals.items())
+
+        values = dict((name, sum(totals.get(name, 0) for totals in operations.values()))
+                      for name in ('Calls', 'Latency', 'Retries', 'Throttles', 'Errors',
+                                   'RequestBytes', 'ResponseBytes'))
+        values['Latency'] = round(values['Latency'], 1)
+        line = self._emf({}, values, Operations=operations)
+        with self._lock:
+            self._write(line)
+
+    def _emf(self, dimensions, values, **properties):
+        units = {'Latency': 'Milliseconds', 'RequestBytes': 'Bytes', 'ResponseBytes': 'Bytes'}
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self._namespace,
+                    'Dimensions': [list(dimensions.keys())],
+                    'Metrics': [{'Name': name, 'Unit': units.get(name, 'Count')}
+                                for name in values]
+                }]
+            }
+        }
+        document.update(dimensions)
+        document.update(values)
+        document.update((key, value) for key, value in properties.items() if value is not None)
+        return json.dumps(document, default=str)
+
+    def _write(self, line):
+        stream = sys.stdout if self._stream is None else self._stream
+        stream.write(line + '\n')
+        stream.flush()
+
+
+# metrics for the current invocation, reset by the lambda handler
+METRICS = MetricsRecorder()
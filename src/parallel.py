@@ -0,0 +1,57 @@
+""" Bounded concurrency helpers for provisioning lex resources
+"""
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_EXCEPTION, wait
+
+# pylint: disable=import-error
+from utils import ProvisioningError
+# pylint: enable=import-error
+
+
+def run_concurrently(func, items, max_workers=1, key=str, fail_fast=True):
+    """Call func for every item using at most max_workers threads
+
+    Results are returned in the same order as items. With fail_fast calls
+    that have not started yet are cancelled on the first failure, otherwise
+    every item is attempted. Failures are raised together as a
+    ProvisioningError keyed by key(item). A single worker with fail_fast
+    runs inline and re-raises the original exception.
+    """
+    items = list(items)
+    if max_workers <= 1:
+        return _run_serially(func, items, key, fail_fast)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(func, item) for item in items]
+        _, not_done = wait(futures,
+                           return_when=FIRST_EXCEPTION if fail_fast else ALL_COMPLETED)
+        for future in not_done:
+            future.cancel()
+
+    failures = {}
+    for item, future in zip(items, futures):
+        if not future.cancelled() and future.exception() is not None:
+            failures[key(item)] = future.exception()
+    _raise_failures(failures, len(items))
+
+    return [future.result() for future in futures]
+
+
+def _run_serially(func, items, key, fail_fast):
+    if fail_fast:
+        return [func(item) for item in items]
+
+    results = []
+    failures = {}
+    for item in items:
+        try:
+            results.append(func(item))
+        except Exception as ex:  # pylint: disable=broad-except
+            failures[key(item)] = ex
+    _raise_failures(failures, len(items))
+    return results
+
+
+def _raise_failures(failures, total):
+    if failures:
+        raise ProvisioningError('Failed to provision {0} of {1} resources'.format(
+            len(failures), total), failures)
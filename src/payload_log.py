@@ -0,0 +1,124 @@
+""" Structured logging of events, Lex requests and responses
+
+A bot definition with thousands of utterances makes every request and
+response megabytes of text, so payloads are never formatted eagerly. A
+payload is logged as one json line and only when the level is enabled;
+lists and strings in it are cut down to a summary that keeps the shape of
+the payload. For a sample of the calls the full payload is logged instead,
+at the same level, set with the logSampleRate resource property (0 by
+default, 1 logs all).
+"""
+import json
+import logging
+import random
+import threading
+
+# list items and string characters kept in a summary
+MAX_ITEMS = 10
+MAX_STRING = 256
+# nesting below this depth is replaced by a count
+MAX_DEPTH = 8
+# a summary is cut to this many characters once serialised
+MAX_CHARS = 4096
+
+
+def summarize(payload):
+    """(summary, True if anything was left out) of a json-like payload"""
+    omitted = []
+    return _summarize(payload, 0, omitted), bool(omitted)
+
+
+def _summarize(value, depth, omitted):
+    if isinstance(value, dict):
+        if depth >= MAX_DEPTH:
+            omitted.append(value)
+            return '{{{0} keys}}'.format(len(value))
+        return dict((str(key), _summarize(item, depth + 1, omitted))
+                    for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        if depth >= MAX_DEPTH:
+            omitted.append(value)
+            return '[{0} items]'.format(len(value))
+        items = [_summarize(item, depth + 1, omitted) for item in value[:MAX_ITEMS]]
+        if len(value) > MAX_ITEMS:
+            omitted.append(value)
+            items.append('... {0} more'.format(len(value) - MAX_ITEMS))
+        return items
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    value = str(value)
+    if len(value) > MAX_STRING:
+        omitted.append(value)
+        return '{0}... {1} chars'.format(value[:MAX_STRING], len(value))
+    return value
+
+
+class _Line(object):
+    """ a json log line, serialised when a handler formats the record """
+
+    def __init__(self, document, max_chars=None):
+        self._document = document
+        self._max_chars = max_chars
+
+    def __str__(self):
+        line = json.dumps(self._document, default=str, sort_keys=True)
+        if self._max_chars is not None and len(line) > self._max_chars:
+            line = '{0}... {1} chars'.format(line[:self._max_chars], len(line))
+        return line
+
+
+class PayloadLog(object):
+    """ logs payloads as json lines, summarised unless sampled """
+
+    def __init__(self, sample_rate=0.0, max_chars=MAX_CHARS, rand=random.random):
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self._random = rand
+        self._lock = threading.Lock()
+
+    def reset(self, sample_rate=0.0, max_chars=MAX_CHARS):
+        with self._lock:
+            self.sample_rate = sample_rate
+            self.max_chars = max_chars
+
+    def log(self, logger, message, payload, level=logging.INFO, **fields):
+        """Log payload under message, returns True if anything was logged"""
+        if not logger.isEnabledFor(level):
+            return False
+        document = dict(fields, message=message)
+        if self._sampled():
+            document.update(payload=payload, sampled=True)
+            logger.log(level, '%s', _Line(document))
+            return True
+
+        document['payload'], summarized = summarize(payload)
+        if summarized:
+            document['summarized'] = True
+        logger.log(level, '%s', _Line(document, self.max_chars))
+        return True
+
+    def _sampled(self):
+        with self._lock:
+            sample_rate = self.sample_rate
+        if sample_rate <= 0:
+            return False
+        return sample_rate >= 1 or self._random() < sample_rate
+
+
+def sample_rate(value):
+    """The logSampleRate property as a rate between 0 and 1"""
+    if value is None:
+        return 0.0
+    try:
+        return min(1.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# payload logging for the current invocation, reset by the lambda handler
+PAYLOADS = PayloadLog()
+
+
+def log_payload(logger, message, payload, level=logging.INFO, **fields):
+    """Log a payload with the settings of the current invocation"""
+    return PAYLOADS.log(logger, message, payload, level=level, **fields)
@@ -0,0 +1,76 @@
+""" Work out which slot types and intents an Update adds, changes or removes
+"""
+import json
+
+import slot_values  # pylint: disable=import-error
+
+
+class ResourceDiff(object):
+    """ names of added, changed, removed and unchanged resources """
+
+    def __init__(self, added, changed, removed, unchanged):
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+        self.unchanged = unchanged
+
+    def to_put(self):
+        """ resources that have to be written """
+        return self.added + self.changed
+
+    def __eq__(self, other):
+        if isinstance(self, other.__class__):
+            return self.__dict__ == other.__dict__
+        return False
+
+    def __repr__(self):
+        return 'ResourceDiff(added={0}, changed={1}, removed={2}, unchanged={3})'.format(
+            self.added, self.changed, self.removed, self.unchanged)
+
+    @classmethod
+    def create_diff(cls, old_definitions, new_definitions):
+        """Compare two dicts of resource name to definition
+
+        Names keep the order of new_definitions, removed names the order of
+        old_definitions
+        """
+        added, changed, unchanged = [], [], []
+        for name, definition in new_definitions.items():
+            if name not in old_definitions:
+                added.append(name)
+            elif (slot_values.is_external(definition)
+                  or _canonical(old_definitions[name]) != _canonical(definition)):
+                # the contents of a source can change under the same name
+                changed.append(name)
+            else:
+                unchanged.append(name)
+
+        removed = [name for name in old_definitions if name not in new_definitions]
+        return ResourceDiff(added, changed, removed, unchanged)
+
+
+def diff_slot_types(old_properties, new_properties, old_prefix='', new_prefix=''):
+    """ResourceDiff of the prefixed slot type names"""
+    return ResourceDiff.create_diff(
+        _slot_type_definitions(old_properties, old_prefix),
+        _slot_type_definitions(new_properties, new_prefix))
+
+
+def diff_intents(old_properties, new_properties):
+    """ResourceDiff of the intent names"""
+    return ResourceDiff.create_diff(_intent_definitions(old_properties),
+                                    _intent_definitions(new_properties))
+
+
+def _slot_type_definitions(properties, prefix):
+    slot_types = properties.get('slotTypes') or {}
+    return dict((prefix + name, values) for name, values in slot_types.items())
+
+
+def _intent_definitions(properties):
+    intents = properties.get('intents') or []
+    return dict((intent.get('Name'), intent) for intent in intents)
+
+
+def _canonical(definition):
+    return json.dumps(definition, sort_keys=True, default=str)
@@ -0,0 +1,164 @@
+""" Retry policy shared by every Lex call
+
+Retries use exponential backoff with full jitter and never sleep past the
+lambda deadline taken from the invocation context.
+"""
+import random
+import threading
+import time
+
+# pylint: disable=import-error
+from metrics import METRICS, payload_size, response_size
+from utils import client_error
+# pylint: enable=import-error
+
+THROTTLED = 'throttled'
+TRANSIENT = 'transient'
+
+# error code -> how the error is retried, anything else fails straight away
+ERROR_CLASSIFICATION = {
+    'ThrottlingException': THROTTLED,
+    'TooManyRequestsException': THROTTLED,
+    'LimitExceededException': THROTTLED,
+    'ConflictException': TRANSIENT,
+    'InternalFailure': TRANSIENT,
+    'InternalFailureException': TRANSIENT,
+    'ServiceUnavailable': TRANSIENT,
+    'ServiceUnavailableException': TRANSIENT,
+}
+
+# first backoff ceiling in seconds for each classification
+BASE_DELAYS = {
+    THROTTLED: 1.0,
+    TRANSIENT: 0.5,
+}
+
+# time kept back to report to CloudFormation before the lambda times out
+SAFETY_MARGIN_SECONDS = 5
+
+
+class Deadline(object):
+    """ time left in the current invocation """
+
+    def __init__(self, context, margin=SAFETY_MARGIN_SECONDS):
+        self._context = context
+        self._margin = margin
+
+    def remaining(self):
+        """Seconds left before the margin, None when there is no deadline"""
+        get_remaining = getattr(self._context, 'get_remaining_time_in_millis', None)
+        remaining = get_remaining() if callable(get_remaining) else None
+        if not isinstance(remaining, (int, float)):
+            return None
+        return remaining / 1000.0 - self._margin
+
+    def allows(self, seconds):
+        remaining = self.remaining()
+        return remaining is None or remaining > seconds
+
+
+class RetryStats(object):
+    """ retries and time spent waiting per Lex operation """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, func_name, retries, waited):
+        with self._lock:
+            stats = self._stats.setdefault(func_name, {'calls': 0, 'retries': 0,
+                                                       'waited_seconds': 0.0})
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['waited_seconds'] = round(stats['waited_seconds'] + waited, 3)
+
+    def snapshot(self):
+        with self._lock:
+            return dict((name, dict(stats)) for name, stats in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# stats for the current invocation, reset by the lambda handler
+STATS = RetryStats()
+
+
+class RetryPolicy(object):
+    """ retry a Lex call on throttling and transient errors """
+
+    def __init__(self, logger, deadline=None, max_attempts=5, max_delay=20.0,
+                 classification=None, stats=STATS, sleep=time.sleep, metrics=METRICS):
+        self._logger = logger
+        self._deadline = Deadline(None) if deadline is None else deadline
+        self.max_attempts = max_attempts
+        self._max_delay = max_delay
+        self._classification = ERROR_CLASSIFICATION if classification is None else classification
+        self._stats = stats
+        self._sleep = sleep
+        self._metrics = metrics
+
+    def classify(self, ex, retryable=()):
+        """Classification of a ClientError, None if it should not be retried"""
+        code = ex.response.get('Error', {}).get('Code')
+        if code in retryable:
+            return TRANSIENT
+        return self._classification.get(code)
+
+    def delay(self, classification, attempt):
+        """Full jitter backoff for the given attempt, starting at 1"""
+        ceiling = min(self._max_delay, BASE_DELAYS[classification] * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def call(self, func, func_name, retryable=(), max_attempts=None, **kwargs):
+        """Call func(**kwargs), retrying errors in the classification table
+        and any extra error codes in retryable"""
+        max_attempts = self.max_attempts if max_attempts is None else max_attempts
+        attempt = 0
+        waited = 0.0
+        throttles = 0
+        started = time.time()
+        while True:
+            attempt += 1
+            try:
+                response = func(**kwargs)
+                self._stats.record(func_name, attempt - 1, waited)
+                self._record(func_name, started, attempt, throttles, kwargs, response=response)
+                return response
+            except client_error() as ex:
+                classification = self.classify(ex, retryable)
+                throttles += 1 if classification == THROTTLED else 0
+                delay = None if classification is None else self.delay(classification, attempt)
+                if (delay is None or attempt >= max_attempts
+                        or not self._deadline.allows(delay)):
+                    self._stats.record(func_name, attempt - 1, waited)
+                    self._record(func_name, started, attempt, throttles, kwargs,
+                                 error_code=ex.response.get('Error', {}).get('Code'))
+                    raise
+
+                self._logger.warning('Lex %s %s (%s), retry %s in %.2f seconds',
+                                     func_name, classification,
+                                     ex.response['Error']['Code'], attempt, delay)
+                self._sleep(delay)
+                waited += delay
+            except Exception as ex:
+                # timeouts, connection errors and the like are not retried
+                # here but still count in the metrics
+                self._stats.record(func_name, attempt - 1, waited)
+                self._record(func_name, started, attempt, throttles, kwargs,
+                             error_code=type(ex).__name__)
+                raise
+
+    def _record(self, func_name, started, attempt, throttles, request, response=None,
+                error_code=None):
+        if not self._metrics.enabled:
+            return
+        self._metrics.record(func_name,
+                             (time.time() - started) * 1000,
+                             retries=attempt - 1,
+                             throttles=throttles,
+                             error_code=error_code,
+                             request_bytes=payload_size(request)
+                             if self._metrics.request_sizes else 0,
+                             response_bytes=response_size(response))
@@ -0,0 +1,137 @@
+""" Schedule lex resources so each one starts as soon as its dependencies finish
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# pylint: disable=import-error
+from utils import ProvisioningError
+# pylint: enable=import-error
+
+SLOT_TYPE = 'slot_type'
+INTENT = 'intent'
+BOT = 'bot'
+
+
+class DependencyGraph(object):
+    """ directed acyclic graph of resource keys and the keys they depend on """
+
+    def __init__(self):
+        self._dependencies = OrderedDict()
+
+    def add(self, key, depends_on=()):
+        """ add a key, its dependencies must already be in the graph """
+        for dependency in depends_on:
+            if dependency not in self._dependencies:
+                raise ValueError('Unknown dependency {0} for {1}'.format(dependency, key))
+        self._dependencies[key] = list(depends_on)
+
+    def keys(self):
+        return list(self._dependencies.keys())
+
+    def dependencies(self, key):
+        return self._dependencies[key]
+
+    def reversed(self):
+        """ graph with every edge reversed, used to tear resources down """
+        graph = DependencyGraph()
+        dependants = OrderedDict((key, []) for key in self._dependencies)
+        for key, dependencies in self._dependencies.items():
+            for dependency in dependencies:
+                dependants[dependency].append(key)
+
+        for key in reversed(list(self._dependencies.keys())):
+            graph._dependencies[key] = dependants[key]  # pylint: disable=protected-access
+        return graph
+
+    @classmethod
+    def create_graph(cls, bot, slot_types):
+        """Build the provisioning graph for a bot
+
+        An intent depends on the custom slot types its slots use and the
+        bot depends on all of its intents.
+        """
+        graph = DependencyGraph()
+        slot_type_names = set()
+        for slot_type in slot_types:
+            graph.add((SLOT_TYPE, slot_type.name))
+            slot_type_names.add(slot_type.name)
+
+        intent_keys = []
+        for intent in bot.intents:
+            depends_on = OrderedDict(((SLOT_TYPE, slot.slot_type), None)
+                                     for slot in intent.slots
+                                     if slot.slot_type in slot_type_names)
+            key = (INTENT, intent.intent_name)
+            graph.add(key, depends_on.keys())
+            intent_keys.append(key)
+
+        graph.add((BOT, bot.name), intent_keys)
+        return graph
+
+
+def run_graph(graph, func, max_workers=1, deadline=None):
+    """Run func(key, dependency_results) for every key in graph
+
+    A key is started as soon as all of its dependencies have finished,
+    using at most max_workers threads. Returns a dict of key to result.
+    On the first failure no new keys are started and a ProvisioningError
+    is raised once the running ones finish. With a retry.Deadline no key is
+    started once it has passed and the keys still running are not waited
+    for, a ProvisioningError is raised as the lambda is about to time out.
+    """
+    results = {}
+    failures = OrderedDict()
+    pending = OrderedDict((key, set(graph.dependencies(key))) for key in graph.keys())
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    running = {}
+    try:
+        while pending or running:
+            if not failures and _allows(deadline):
+                for key in [key for key, waiting in pending.items() if not waiting]:
+                    del pending[key]
+                    dependency_results = dict((dependency, results[dependency])
+                                              for dependency in graph.dependencies(key))
+                    running[executor.submit(func, key, dependency_results)] = key
+
+            if not running:
+                break
+
+            done, _ = wait(list(running.keys()), timeout=_remaining(deadline),
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                key = running.pop(future)
+                if future.exception() is not None:
+                    failures[_describe(key)] = future.exception()
+                    continue
+                results[key] = future.result()
+                for waiting in pending.values():
+                    waiting.discard(key)
+    finally:
+        # calls already running on a thread can not be interrupted, past the
+        # deadline they are left to finish while the failure is reported
+        executor.shutdown(wait=not running)
+
+    if failures:
+        raise ProvisioningError('Failed to provision {0} resources'.format(
+            len(failures)), failures)
+    if pending or running:
+        raise ProvisioningError('Lambda deadline reached with {0} resources '
+                                'not provisioned'.format(len(pending) + len(running)))
+    return results
+
+
+def _allows(deadline):
+    return deadline is None or deadline.allows(0)
+
+
+def _remaining(deadline):
+    """Seconds to wait for a running key, None to wait until one finishes"""
+    remaining = None if deadline is None else deadline.remaining()
+    return None if remaining is None else max(0, remaining)
+
+
+def _describe(key):
+    return '{0} {1}'.format(*key) if isinstance(key, tuple) else str(key)
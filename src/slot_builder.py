@@ -1,18 +1,21 @@
 #!/usr/bin/env python
 """ Provision AWS Lex resources using python SDK"""
 
-from botocore.exceptions import ClientError
-
 # pylint: disable=import-error
+import fingerprint
+import slot_values
 from lex_helper import LexHelper
+from scheduler import SLOT_TYPE
 # pylint: enable=import-error
 
 
 class SlotBuilder(LexHelper):
     """ slot builder """
-    def __init__(self, logger, context, lex_sdk=None):
+    def __init__(self, logger, context, lex_sdk=None, state=None, checkpoint=None):
         self._logger = logger
         self._context = context
+        self._state = state
+        self._checkpoint = checkpoint
         if lex_sdk is None:
             self._lex_sdk = self._get_lex_sdk()
         else:
@@ -25,51 +28,89 @@ class SlotBuilder(LexHelper):
 
     def put_slot_type(self, slot_type):
         """ put slot type by name and synonyms """
+        record = self._checkpointed(SLOT_TYPE, slot_type.name)
+        if record is not None:
+            return {'name': slot_type.name, 'checksum': record['checksum'],
+                    'version': '$LATEST'}
+
+        response = self._put_slot_type(slot_type)
+        self._complete(SLOT_TYPE, slot_type.name, response['checksum'])
+        return response
+
+    def _put_slot_type(self, slot_type):
         self._logger.info('Put slot type %s', slot_type.name)
 
         enumeration = []
-        for key in slot_type.slots:
-            value = slot_type.slots[key]
+        values = self._slot_type_values(slot_type)
+        for key in values:
+            value = values[key]
             enumeration.append({'value': key,
                                 'synonyms': value})
+        request = {'name': slot_type.name,
+                   'description': slot_type.name,
+                   'enumerationValues': enumeration,
+                   'valueSelectionStrategy': 'ORIGINAL_VALUE'}
 
-        exists, checksum = self._slot_type_exists(slot_type.name)
-        response = None
-        if exists:
-            response = self._lex_sdk.put_slot_type(name=slot_type.name,
-                                                   description=slot_type.name,
-                                                   enumerationValues=enumeration,
-                                                   checksum=checksum,
-                                                   valueSelectionStrategy='ORIGINAL_VALUE')
-        else:
-            response = self._lex_sdk.put_slot_type(name=slot_type.name,
-                                                   description=slot_type.name,
-                                                   enumerationValues=enumeration,
-                                                   valueSelectionStrategy='ORIGINAL_VALUE')
+        normalized = fingerprint.normalize_slot_type(request)
+        cached = self._cached_state(SLOT_TYPE, slot_type.name)
+        response = self._put_with_cached_checksum(self._lex_sdk.put_slot_type,
+                                                  'put_slot_type', cached, request,
+                                                  compared=normalized)
+        if response is None:
+            current = self._describe_slot_type(slot_type.name)
+            if current is not None:
+                if fingerprint.unchanged(request, current,
+                                         normalize=fingerprint.normalize_slot_type):
+                    self._logger.info("Slot type %s unchanged", slot_type.name)
+                    self._save_state(SLOT_TYPE, slot_type.name, current['checksum'],
+                                     request=normalized)
+                    return current
 
+                response = self._call(self._lex_sdk.put_slot_type, 'put_slot_type',
+                                      checksum=current['checksum'], **request)
+            else:
+                response = self._call(self._lex_sdk.put_slot_type, 'put_slot_type', **request)
+
+        self._save_state(SLOT_TYPE, slot_type.name, response['checksum'], request=normalized)
         self._logger.info("Successfully created slot type %s", slot_type.name)
         return response
 
-    def delete_slot_type(self, name):
-        """ delete slot type by name and synonyms """
+    def _slot_type_values(self, slot_type):
+        """Value -> synonyms, read from the source for external slot types"""
+        if slot_values.is_external(slot_type.slots):
+            values = slot_values.load(slot_type.name, slot_type.slots)
+            self._logger.info('Read %s values for slot type %s from %s',
+                              len(values), slot_type.name,
+                              slot_type.slots[slot_values.SOURCE_KEY])
+            return values
 
-        self._logger.info('Delete slot type %s', name)
-        try:
-            self._lex_sdk.delete_slot_type(name=name)
+        slot_values.validate(slot_type.name, slot_type.slots)
+        return slot_type.slots
 
-        except ClientError as ex:
-            if not self._not_found(ex, 'delete_slot_type'):
-                self._in_use(ex)
+    def delete_slot_type(self, name, leave_in_use=False):
+        """ delete slot type by name and synonyms
 
-    def _in_use(self, ex):
-        func_name = 'delete_slot_type'
-        if ex.response['Error']['Code'] == 'ResourceInUseException':
-            self._logger.info('Lex %s call failed because resource'
-                              + ' in use', func_name)
-            return False
-        return True
+        With leave_in_use a slot type older intent versions still use is
+        left in place rather than retried
+        """
+        self._check_time()
+        if self._deleted(SLOT_TYPE, name):
+            return
+        self._logger.info('Delete slot type %s', name)
+        # intents being deleted can still use the slot type for a while
+        if not self._delete_lex_resource(self._lex_sdk.delete_slot_type, 'delete_slot_type',
+                                         max_attempts=self.IN_USE_DELETE_TRIES,
+                                         leave_in_use=leave_in_use, name=name):
+            return
+        self._forget_state(SLOT_TYPE, name)
+        self._complete(SLOT_TYPE, name, None)
 
     def _slot_type_exists(self, name, versionOrAlias='$LATEST'):
         return self._get_resource(self._lex_sdk.get_slot_type,
                                   'get_slot_type',
                                   {'name': name, 'version': versionOrAlias})
+
+    def _describe_slot_type(self, name, versionOrAlias='$LATEST'):
+        return self._describe_resource(self._lex_sdk.get_slot_type,
+                                       'get_slot_type',
+                                       {'name': name, 'version': versionOrAlias})
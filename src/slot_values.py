@@ -0,0 +1,157 @@
+""" Slot type values read from an external source
+
+Large slot types keep their values in a local file or an S3 object rather
+than in the ResourceProperties, e.g.
+
+    "slotTypes": {"product": {"Source": "s3://bucket/products.csv"}}
+
+CSV rows are a value followed by its synonyms, JSON lines are objects with
+a value and a list of synonyms. Lines are read one at a time, values are
+normalised and de-duplicated, and the result is checked against the Lex
+limits before it is put.
+"""
+import csv
+import io
+import json
+import re
+
+# pylint: disable=import-error
+import clients
+from utils import ValidationError
+# pylint: enable=import-error
+
+SOURCE_KEY = 'Source'
+FORMAT_KEY = 'Format'
+
+CSV = 'csv'
+JSON_LINES = 'jsonl'
+
+# file extension -> format, when no Format is given
+EXTENSIONS = {'.csv': CSV, '.jsonl': JSON_LINES, '.ndjson': JSON_LINES}
+
+# Lex model building limits for a slot type
+MAX_VALUES = 10000
+MAX_VALUE_LENGTH = 140
+MAX_SYNONYM_LENGTH = 140
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def is_external(definition):
+    """True if a slotTypes entry names a source instead of holding values"""
+    return isinstance(definition, dict) and isinstance(definition.get(SOURCE_KEY), str)
+
+
+def _open_file(uri):
+    path = uri[len('file://'):] if uri.startswith('file://') else uri
+    with io.open(path, encoding='utf-8', newline='') as source:
+        for line in source:
+            yield line
+
+
+def _open_s3(uri):
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    response = clients.get_client('s3').get_object(Bucket=bucket, Key=key)
+    for line in response['Body'].iter_lines():
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+# uri scheme -> function returning an iterator of lines, replaceable e.g.
+# with a local stand-in for S3
+OPENERS = {
+    's3': _open_s3,
+    'file': _open_file,
+}
+
+
+def read_lines(uri):
+    """Lines of the source at uri, read lazily"""
+    scheme = uri.split('://', 1)[0] if '://' in uri else 'file'
+    if scheme not in OPENERS:
+        raise ValidationError('Unsupported slot type source {0}'.format(uri))
+    return OPENERS[scheme](uri)
+
+
+def source_format(definition):
+    """Format of a source, from Format or the file extension"""
+    value_format = definition.get(FORMAT_KEY)
+    if value_format is None:
+        for extension, extension_format in EXTENSIONS.items():
+            if definition[SOURCE_KEY].lower().endswith(extension):
+                value_format = extension_format
+    if value_format not in PARSERS:
+        raise ValidationError('Unknown format {0} for slot type source {1}'.format(
+            value_format, definition[SOURCE_KEY]))
+    return value_format
+
+
+def parse_csv(lines):
+    """(value, synonyms) for each row of value,synonym,synonym..."""
+    for row in csv.reader(lines):
+        if row and row[0].strip():
+            yield row[0], row[1:]
+
+
+def parse_json_lines(lines):
+    """(value, synonyms) for each {"value": ..., "synonyms": [...]} line"""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            raise ValidationError('Line {0} is not json: {1}'.format(number, line.strip()))
+        yield entry['value'], entry.get('synonyms') or []
+
+
+PARSERS = {CSV: parse_csv, JSON_LINES: parse_json_lines}
+
+
+def normalize(text):
+    """Trim and collapse whitespace"""
+    return _WHITESPACE.sub(' ', str(text)).strip()
+
+
+def collect(entries):
+    """Value -> synonyms, merging values that only differ by case or spacing
+
+    The first spelling of a value or synonym is kept
+    """
+    values = {}
+    spellings = {}
+    for value, synonyms in entries:
+        value = normalize(value)
+        if not value:
+            continue
+        key = value.lower()
+        value = spellings.setdefault(key, value)
+        merged = values.setdefault(value, [])
+        seen = set(synonym.lower() for synonym in merged)
+        for synonym in synonyms:
+            synonym = normalize(synonym)
+            if synonym and synonym.lower() not in seen:
+                seen.add(synonym.lower())
+                merged.append(synonym)
+    return values
+
+
+def validate(name, values):
+    """Raise ValidationError if values break the Lex slot type limits"""
+    problems = []
+    if len(values) > MAX_VALUES:
+        problems.append('{0} values, at most {1} allowed'.format(len(values), MAX_VALUES))
+    problems.extend('value {0!r} is longer than {1}'.format(value, MAX_VALUE_LENGTH)
+                    for value in values if len(value) > MAX_VALUE_LENGTH)
+    problems.extend('synonym {0!r} is longer than {1}'.format(synonym, MAX_SYNONYM_LENGTH)
+                    for synonyms in values.values() for synonym in synonyms
+                    if len(synonym) > MAX_SYNONYM_LENGTH)
+    if problems:
+        raise ValidationError('Slot type {0}: {1}'.format(name, '; '.join(problems[:10])))
+
+
+def load(name, definition):
+    """Value -> synonyms for a slot type with an external source"""
+    lines = read_lines(definition[SOURCE_KEY])
+    values = collect(PARSERS[source_format(definition)](lines))
+    validate(name, values)
+    return values
@@ -0,0 +1,178 @@
+""" Last deployed state of each Lex resource
+
+A state store remembers the checksum, version and fingerprint of every
+resource this provisioner wrote, so the next deploy can put with the
+cached checksum, or skip a resource whose fingerprint has not changed,
+without a get first. Builders fall back to a get when the cached checksum
+turns out to be stale.
+
+The store is chosen with the stateStore resource property:
+
+    file:///tmp/lex-state.json      json file, for local runs
+    sqlite:///tmp/lex-state.db      SQLite database
+    dynamodb://table-name           DynamoDB table keyed by a string "id"
+"""
+import json
+import os
+import tempfile
+import threading
+
+# pylint: disable=import-error
+import clients
+from utils import ValidationError
+# pylint: enable=import-error
+
+# fields kept for each resource
+FIELDS = ('checksum', 'version', 'fingerprint')
+
+
+def _key(resource_type, name):
+    return '{0}#{1}'.format(resource_type, name)
+
+
+class FileStateStore(object):
+    """ state kept in a json file, rewritten on every change
+
+    The file is read again whenever it changed since it was last read or
+    written, so writes from other processes are seen
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._records = None
+        self._stamp = None
+
+    def get(self, resource_type, name):
+        with self._lock:
+            record = self._load().get(_key(resource_type, name))
+            return None if record is None else dict(record)
+
+    def put(self, resource_type, name, record):
+        with self._lock:
+            self._load()[_key(resource_type, name)] = dict(record)
+            self._save()
+
+    def delete(self, resource_type, name):
+        with self._lock:
+            if self._load().pop(_key(resource_type, name), None) is not None:
+                self._save()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _load(self):
+        stamp = self._file_stamp()
+        if self._records is None or stamp != self._stamp:
+            try:
+                with open(self._path) as state_file:
+                    self._records = json.load(state_file)
+            except (IOError, OSError, ValueError):
+                self._records = {}
+            self._stamp = stamp
+        return self._records
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self._path))
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as state_file:
+            json.dump(self._records, state_file, sort_keys=True)
+        os.replace(temporary, self._path)
+        self._stamp = self._file_stamp()
+
+
+class SqliteStateStore(object):
+    """ state kept in a SQLite table """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS lex_state '
+                                     '(id TEXT PRIMARY KEY, record TEXT NOT NULL)')
+
+    def get(self, resource_type, name):
+        with self._lock:
+            row = self._connection.execute('SELECT record FROM lex_state WHERE id = ?',
+                                           (_key(resource_type, name),)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, resource_type, name, record):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO lex_state (id, record) '
+                                     'VALUES (?, ?)',
+                                     (_key(resource_type, name), json.dumps(record)))
+
+    def delete(self, resource_type, name):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM lex_state WHERE id = ?',
+                                     (_key(resource_type, name),))
+
+
+class DynamoDbStateStore(object):
+    """ state kept in a DynamoDB table with a string partition key "id" """
+
+    def __init__(self, table_name, client=None):
+        self._table_name = table_name
+        self._client = clients.LazyClient('dynamodb') if client is None else client
+
+    def get(self, resource_type, name):
+        item = self._get_item(resource_type, name)
+        if item is None:
+            return None
+        return dict((field, item[field]['S']) for field in FIELDS if field in item)
+
+    def put(self, resource_type, name, record):
+        item = dict((field, {'S': str(record[field])}) for field in FIELDS
+                    if record.get(field) is not None)
+        self._put_item(resource_type, name, item)
+
+    def delete(self, resource_type, name):
+        self._client.delete_item(TableName=self._table_name,
+                                 Key={'id': {'S': _key(resource_type, name)}})
+
+    def _get_item(self, resource_type, name):
+        return self._client.get_item(TableName=self._table_name,
+                                     Key={'id': {'S': _key(resource_type, name)}},
+                                     ConsistentRead=True).get('Item')
+
+    def _put_item(self, resource_type, name, item):
+        item = dict(item, id={'S': _key(resource_type, name)})
+        self._client.put_item(TableName=self._table_name, Item=item)
+
+
+# uri scheme -> backend created with the rest of the uri
+BACKENDS = {
+    'file': FileStateStore,
+    'sqlite': SqliteStateStore,
+    'dynamodb': DynamoDbStateStore,
+}
+
+# one store per uri for the lifetime of the process
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def from_uri(uri):
+    """The state store for a stateStore property, None when it is not set"""
+    if not uri:
+        return None
+    scheme, separator, location = uri.partition('://')
+    if not separator or scheme not in BACKENDS:
+        raise ValidationError('Unsupported state store {0}'.format(uri))
+
+    with _STORES_LOCK:
+        if uri not in _STORES:
+            _STORES[uri] = BACKENDS[scheme](location)
+        return _STORES[uri]
+
+
+def clear_stores():
+    """Forget the stores created by from_uri"""
+    with _STORES_LOCK:
+        _STORES.clear()
@@ -1,2 +1,29 @@
+def client_error():
+    """botocore's ClientError, imported on first use to keep botocore off
+    the cold start. An except clause only evaluates it once an exception
+    is being handled"""
+    from botocore.exceptions import ClientError  # pylint: disable=import-outside-toplevel
+    return ClientError
+
+
 class ValidationError(Exception):
     pass
+
+
+class ProvisioningError(Exception):
+    """Raised when one or more lex resources could not be provisioned.
+
+    failures maps the resource name to the exception raised for it.
+    """
+
+    def __init__(self, message, failures=None):
+        self.failures = {} if failures is None else failures
+        if self.failures:
+            details = ', '.join('{0}: {1}'.format(name, ex)
+                                for name, ex in self.failures.items())
+            message = '{0} ({1})'.format(message, details)
+        super(ProvisioningError, self).__init__(message)
+
+
+class ContinuationRequired(Exception):
+    """Raised when an invocation stops early so another one can carry on"""
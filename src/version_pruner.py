@@ -0,0 +1,193 @@
+""" Delete old versions of a bot and its intents
+
+Every put creates a new version of the bot and of each changed intent, and
+Lex limits how many versions a resource can have. After a successful put
+the newest keepVersions numbered versions of the bot and of each intent are
+kept, with any bot version an alias points at and every intent version a
+kept bot version uses. The rest are deleted concurrently, spaced out by a
+Pacer that slows down while Lex throttles.
+"""
+import threading
+import time
+
+# pylint: disable=import-error
+from lex_helper import LexHelper
+from parallel import run_concurrently
+from retry import Deadline, ERROR_CLASSIFICATION, THROTTLED
+from scheduler import BOT, INTENT
+from utils import client_error
+# pylint: enable=import-error
+
+LATEST = '$LATEST'
+
+# versions kept besides the ones in use when keepVersions is not given
+DEFAULT_KEEP = 3
+
+# list operation and response key for the versions of each resource type
+VERSION_LISTS = {
+    BOT: ('get_bot_versions', 'bots'),
+    INTENT: ('get_intent_versions', 'intents'),
+}
+
+
+class Pacer(object):
+    """ spaces out calls made from several threads
+
+    The interval between calls doubles after a throttled call, up to
+    max_interval, and shrinks back after calls that succeed
+    """
+    THROTTLED_INTERVAL = 0.1
+
+    def __init__(self, interval=0.0, max_interval=5.0, sleep=time.sleep, clock=time.time):
+        self.interval = interval
+        self._min_interval = interval
+        self._max_interval = max_interval
+        self._sleep = sleep
+        self._clock = clock
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next call is due"""
+        with self._lock:
+            now = self._clock()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            self._sleep(start - now)
+
+    def throttled(self):
+        with self._lock:
+            self.interval = min(self._max_interval,
+                                max(self.THROTTLED_INTERVAL, self.interval * 2))
+
+    def succeeded(self):
+        with self._lock:
+            self.interval = max(self._min_interval, self.interval / 2)
+            if self.interval < self.THROTTLED_INTERVAL / 4:
+                self.interval = self._min_interval
+
+    def paced(self, func):
+        """func waiting for its turn and reporting throttling back"""
+        def call(**kwargs):
+            self.wait()
+            try:
+                response = func(**kwargs)
+            except client_error() as ex:
+                if ERROR_CLASSIFICATION.get(ex.response['Error']['Code']) == THROTTLED:
+                    self.throttled()
+                raise
+            self.succeeded()
+            return response
+        return call
+
+
+class VersionPruner(LexHelper):
+    """Delete the versions of a bot and its intents that are no longer needed"""
+
+    def __init__(self, logger, context, lex_sdk=None, keep=DEFAULT_KEEP, max_workers=1,
+                 pacer=None):
+        self._logger = logger
+        self._context = context
+        self._keep = max(1, int(keep))
+        self._max_workers = max_workers
+        self._pacer = Pacer() if pacer is None else pacer
+        self._deadline = Deadline(context)
+        if lex_sdk is None:
+            self._lex_sdk = self._get_lex_sdk()
+        else:
+            self._lex_sdk = lex_sdk
+
+    def prune(self, bot_name, intent_names):
+        """Delete unneeded versions, returns the (type, name, version) deleted
+
+        Bot versions go first as they are what keeps intent versions in use
+        """
+        bot_versions = self._versions(BOT, bot_name)
+        kept_bot_versions = set(bot_versions[-self._keep:]) | self._aliased_versions(bot_name)
+        used_intent_versions = self._used_intent_versions(bot_name, kept_bot_versions)
+
+        stale_intent_versions = []
+        for intent_name in intent_names:
+            versions = self._versions(INTENT, intent_name)
+            kept = set(versions[-self._keep:]) | used_intent_versions.get(intent_name, set())
+            stale_intent_versions.extend((INTENT, intent_name, version)
+                                         for version in versions if version not in kept)
+
+        stale_bot_versions = [(BOT, bot_name, version) for version in bot_versions
+                              if version not in kept_bot_versions]
+        self._logger.info('Deleting %s bot and %s intent versions, keeping %s of each',
+                          len(stale_bot_versions), len(stale_intent_versions), self._keep)
+        deleted = self._delete_versions(stale_bot_versions)
+        return deleted + self._delete_versions(stale_intent_versions)
+
+    def _versions(self, resource_type, name):
+        """Numbered versions of a resource, oldest first"""
+        func_name, response_key = VERSION_LISTS[resource_type]
+        func = getattr(self._lex_sdk, func_name)
+        versions = []
+        properties = {'name': name, 'maxResults': 50}
+        while True:
+            try:
+                response = self._call(func, func_name, **properties)
+            except client_error() as ex:
+                if self._not_found(ex, func_name):
+                    return []
+                raise
+            versions.extend(summary['version'] for summary in response.get(response_key, [])
+                            if summary.get('version', '').isdigit())
+            if not response.get('nextToken'):
+                break
+            properties['nextToken'] = response['nextToken']
+
+        return sorted(versions, key=int)
+
+    def _aliased_versions(self, bot_name):
+        versions = set()
+        properties = {'botName': bot_name, 'maxResults': 50}
+        while True:
+            response = self._call(self._lex_sdk.get_bot_aliases, 'get_bot_aliases',
+                                  **properties)
+            versions.update(alias['botVersion'] for alias in response.get('BotAliases', []))
+            if not response.get('nextToken'):
+                break
+            properties['nextToken'] = response['nextToken']
+        return versions
+
+    def _used_intent_versions(self, bot_name, bot_versions):
+        """intent name -> versions used by the given bot versions or $LATEST"""
+        used = {}
+        for version in sorted(bot_versions | set([LATEST])):
+            bot = self._describe_resource(self._lex_sdk.get_bot, 'get_bot',
+                                          {'name': bot_name, 'versionOrAlias': version})
+            for intent in (bot or {}).get('intents', []):
+                used.setdefault(intent['intentName'], set()).add(intent['intentVersion'])
+        return used
+
+    def _delete_versions(self, versions):
+        deleted = run_concurrently(self._delete_version,
+                                   versions,
+                                   max_workers=self._max_workers,
+                                   key=lambda version: '{1}:{2}'.format(*version),
+                                   fail_fast=False)
+        return [version for version, done in zip(versions, deleted) if done]
+
+    def _delete_version(self, version):
+        """True if the version was deleted"""
+        resource_type, name, number = version
+        if not self._deadline.allows(0):
+            self._logger.warning('No time left to delete %s %s:%s', resource_type, name, number)
+            return False
+
+        func_name = 'delete_{0}_version'.format(resource_type)
+        try:
+            self._call(self._pacer.paced(getattr(self._lex_sdk, func_name)), func_name,
+                       name=name, version=number)
+            return True
+        except client_error() as ex:
+            if ex.response['Error']['Code'] == 'ResourceInUseException':
+                self._logger.info('%s %s:%s is still in use', resource_type, name, number)
+                return False
+            if self._not_found(ex, func_name):
+                return False
+            raise
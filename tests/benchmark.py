@@ -0,0 +1,210 @@
+""" End to end provisioning benchmark
+
+Runs app.create, app.update and app.delete for synthetic bots of growing
+size against FakeLex, FakeLambda and FakeSts with a simulated latency per
+call, and writes one json document with the wall time, API calls and peak
+memory of every run so results can be compared release to release:
+
+    PYTHONPATH=.:src python -m tests.benchmark --intents 10 50 100 --latency 0.05
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+# pylint: disable=import-error
+import app
+import clients
+import lex_helper
+import metrics
+import retry
+from tests.fake_lex import FaultInjector, FakeLambda, FakeLex, FakeSts
+# pylint: enable=import-error
+
+# bumped when the shape of the output changes
+FORMAT_VERSION = 1
+
+PREFIX = 'bench'
+LAMBDA_ARN = 'arn:aws:lambda:us-east-1:123456789012:function:bench-codehook'
+SERVICE_TOKEN = 'arn:aws:lambda:us-east-1:123456789012:function:lex-provisioner'
+
+DEFAULT_INTENTS = (10, 50, 100)
+
+
+class BenchmarkContext(object):
+    """ lambda context with plenty of time left and no function ARN, so
+    the account id is looked up with STS as on a cold start """
+
+    log_stream_name = 'benchmark'
+    aws_request_id = 'benchmark'
+
+    def __init__(self, timeout_seconds=900):
+        self._ends = time.time() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self._ends - time.time()) * 1000)
+
+
+def synthetic_slot_types(slot_types=2, synonyms=3):
+    """slotTypes resource property with values that each have synonyms"""
+    return dict(('type{0}'.format(index),
+                 dict(('value{0}'.format(value),
+                       ['value{0} synonym{1}'.format(value, synonym)
+                        for synonym in range(synonyms)])
+                      for value in range(max(1, synonyms))))
+                for index in range(slot_types))
+
+
+def synthetic_intent(index, slots_per_intent=2, utterances=5, slot_types=2):
+    """One entry of the intents resource property"""
+    slots = []
+    for slot in range(slots_per_intent):
+        name = 'slot{0}'.format(slot)
+        slot_type = PREFIX + 'type{0}'.format(slot % slot_types) if slot_types \
+            else 'AMAZON.Person'
+        slots.append({'Name': name,
+                      'Type': slot_type,
+                      'Prompt': 'What is {0}?'.format(name),
+                      'Utterances': ['it is {%s}' % name, 'I want {%s}' % name]})
+
+    return {'Name': 'intent{0}'.format(index),
+            'CodehookArn': LAMBDA_ARN,
+            'maxAttempts': 3,
+            'Utterances': ['utterance {0} of intent {1}'.format(utterance, index)
+                           for utterance in range(utterances)],
+            'Plaintext': {'confirmation': 'a confirmation',
+                          'rejection': 'a rejection',
+                          'conclusion': 'a conclusion'},
+            'Slots': slots}
+
+
+def synthetic_event(request_type='Create', intents=10, slots_per_intent=2, utterances=5,
+                    slot_types=2, synonyms=3, **resource_properties):
+    """A custom resource event shaped like fixtures/test-create.json"""
+    properties = {
+        'NamePrefix': PREFIX,
+        'ServiceToken': SERVICE_TOKEN,
+        'description': 'synthetic benchmark bot',
+        'locale': 'en-US',
+        'messages': {'clarification': 'clarification statement',
+                     'abortStatement': 'abort statement'},
+        'intents': [synthetic_intent(index, slots_per_intent, utterances, slot_types)
+                    for index in range(intents)],
+        'slotTypes': synthetic_slot_types(slot_types, synonyms),
+    }
+    properties.update(resource_properties)
+    return {'RequestType': request_type,
+            'RequestId': 'benchmark',
+            'ResponseURL': 'http://localhost',
+            'ResourceType': 'Custom::LexBot',
+            'LogicalResourceId': 'LexBot',
+            'StackId': 'arn:aws:cloudformation:us-east-1:123456789012:stack/bench/guid',
+            'ResourceProperties': properties}
+
+
+def update_event(event, changed_fraction=0.1):
+    """Update event changing the utterances of a fraction of the intents"""
+    old_properties = event['ResourceProperties']
+    properties = json.loads(json.dumps(old_properties))
+    intents = properties['intents']
+    for intent in intents[:max(1, int(len(intents) * changed_fraction))] if intents else []:
+        intent['Utterances'] = intent['Utterances'] + ['a new utterance']
+    return dict(event, RequestType='Update', ResourceProperties=properties,
+                OldResourceProperties=old_properties)
+
+
+def _measure(handler, event, context, faults):
+    faults.calls.clear()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        handler(event, context)
+    finally:
+        wall_seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    calls = dict(faults.calls)
+    return {'wall_seconds': round(wall_seconds, 4),
+            'api_calls': sum(calls.values()),
+            'calls': dict(sorted(calls.items())),
+            'peak_memory_bytes': peak}
+
+
+def run_size(size, latency=0.0, throttle_rate=0.0, **resource_properties):
+    """Create, update and delete one synthetic bot, returning the measurements"""
+    faults = FaultInjector(latency=latency, throttle_rate=throttle_rate, seed=0)
+    backends = (FakeLex(faults=faults), FakeLambda(faults=faults), FakeSts(faults=faults))
+    clients.clear_clients()
+    for service_name, backend in zip(('lex-models', 'lambda', 'sts'), backends):
+        clients.register_client(service_name, backend)
+    lex_helper.clear_aws_details()
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    metrics.METRICS.reset(enabled=False)
+    retry.STATS.reset()
+
+    event = synthetic_event(**dict(size, **resource_properties))
+    context = BenchmarkContext()
+    try:
+        result = {'size': size}
+        result['create'] = _measure(app.create, event, context, faults)
+        result['update'] = _measure(app.update, update_event(event), context, faults)
+        result['delete'] = _measure(app.delete, event, context, faults)
+        result['retries'] = retry.STATS.snapshot()
+        return result
+    finally:
+        clients.clear_clients()
+        lex_helper.clear_aws_details()
+
+
+def run(sizes, latency=0.0, throttle_rate=0.0, **resource_properties):
+    """Benchmark every size, returning a json serialisable report"""
+    settings = dict(resource_properties, latency=latency, throttle_rate=throttle_rate)
+    return {'format_version': FORMAT_VERSION,
+            'python': platform.python_version(),
+            'settings': settings,
+            'results': [run_size(size, latency, throttle_rate, **resource_properties)
+                        for size in sizes]}
+
+
+def _arguments(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--intents', type=int, nargs='+', default=list(DEFAULT_INTENTS),
+                        help='intent counts to benchmark')
+    parser.add_argument('--slots-per-intent', type=int, default=2)
+    parser.add_argument('--utterances', type=int, default=5)
+    parser.add_argument('--slot-types', type=int, default=2)
+    parser.add_argument('--synonyms', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds added to every API call')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='fraction of API calls that are throttled')
+    parser.add_argument('--max-workers', type=int, default=app.MAX_WORKERS)
+    parser.add_argument('--scheduling', default=app.SCHEDULING, choices=('staged', 'graph'))
+    parser.add_argument('--output', help='file for the json report, stdout by default')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = _arguments(argv)
+    sizes = [{'intents': intents,
+              'slots_per_intent': arguments.slots_per_intent,
+              'utterances': arguments.utterances,
+              'slot_types': arguments.slot_types,
+              'synonyms': arguments.synonyms} for intents in arguments.intents]
+    report = run(sizes, latency=arguments.latency, throttle_rate=arguments.throttle_rate,
+                 maxWorkers=arguments.max_workers, scheduling=arguments.scheduling)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
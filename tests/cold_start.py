@@ -0,0 +1,108 @@
+""" Lambda cold start benchmark
+
+Starts a fresh interpreter for every run and measures how long importing
+app takes, how long the first real lex-models client takes to create and
+how long a first call on it takes, with a botocore Stubber answering the
+call so nothing is sent. The modules loaded show whether heavy imports such
+as boto3, botocore, requests, asyncio and sqlite3 were deferred:
+
+    PYTHONPATH=.:src python -m tests.cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# bumped when the shape of the output changes
+FORMAT_VERSION = 2
+
+# modules whose import is worth deferring
+HEAVY_MODULES = ('boto3', 'botocore', 'requests', 'asyncio', 'sqlite3')
+# seconds measured in every run
+TIMINGS = ('import_seconds', 'first_client_seconds', 'first_call_seconds')
+BOT_NAME = 'ColdStartBot'
+
+
+def _child():
+    """Runs in the fresh interpreter, prints the measurements as json"""
+    started = time.perf_counter()
+    import app  # noqa: F401 pylint: disable=import-error,import-outside-toplevel,unused-import
+    import_seconds = time.perf_counter() - started
+    loaded = dict((module, module in sys.modules) for module in HEAVY_MODULES)
+
+    # pylint: disable=import-error,import-outside-toplevel
+    import clients
+    from botocore.stub import Stubber
+    # pylint: enable=import-error,import-outside-toplevel
+    started = time.perf_counter()
+    client = clients.get_client('lex-models')
+    first_client_seconds = time.perf_counter() - started
+
+    stubber = Stubber(client)
+    stubber.add_response('get_bot', {'name': BOT_NAME, 'status': 'READY', 'version': '$LATEST',
+                                     'checksum': 'checksum'},
+                         {'name': BOT_NAME, 'versionOrAlias': '$LATEST'})
+    with stubber:
+        started = time.perf_counter()
+        client.get_bot(name=BOT_NAME, versionOrAlias='$LATEST')
+        first_call_seconds = time.perf_counter() - started
+
+    json.dump({'import_seconds': import_seconds,
+               'first_client_seconds': first_client_seconds,
+               'first_call_seconds': first_call_seconds,
+               'modules': len(sys.modules),
+               'heavy_modules_at_import': loaded}, sys.stdout)
+
+
+def measure():
+    """Measurements of one cold start in a new interpreter"""
+    region = os.environ.get('AWS_REGION', 'us-east-1')
+    environment = dict(os.environ, AWS_REGION=region,
+                       AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', region))
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'tests.cold_start', '--child'], env=environment)
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def run(runs=5):
+    """Median and worst of each measurement over runs cold starts"""
+    samples = [measure() for _ in range(runs)]
+    results = dict((timing, _summary(sample[timing] for sample in samples))
+                   for timing in TIMINGS)
+    results.update(runs=runs, modules=samples[-1]['modules'],
+                   heavy_modules_at_import=samples[-1]['heavy_modules_at_import'])
+    return {'format_version': FORMAT_VERSION,
+            'python': sys.version.split()[0],
+            'results': results}
+
+
+def _summary(values):
+    values = list(values)
+    return {'median': round(statistics.median(values), 4), 'max': round(max(values), 4)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='file for the json report, stdout by default')
+    arguments = parser.parse_args(argv)
+
+    if arguments.child:
+        _child()
+        return
+
+    report = run(arguments.runs)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
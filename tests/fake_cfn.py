@@ -0,0 +1,97 @@
+""" Local stand-in for the CloudFormation ResponseURL
+
+An HTTP server that accepts the PUT of a custom resource response, records
+it and answers with the statuses it is told to, optionally after a delay.
+Run it on the port in fixtures/test-create.json to see what sam local
+invoke sends:
+
+    python -m tests.fake_cfn --port 8888
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+
+class FakeCfn(object):
+    """ records response bodies, statuses are answered in order then 200 """
+
+    def __init__(self, port=0, statuses=(), delay=0.0, server_class=ThreadingHTTPServer):
+        self.responses = []
+        self.attempts = 0
+        self._statuses = list(statuses)
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._server = server_class(('127.0.0.1', port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/response'.format(self._server.server_address[1])
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_PUT(self):  # pylint: disable=invalid-name
+                body = self.rfile.read(int(self.headers.get('content-length', 0)))
+                status = fake.record(body)
+                if fake._delay:  # pylint: disable=protected-access
+                    time.sleep(fake._delay)  # pylint: disable=protected-access
+                self.send_response(status)
+                self.send_header('content-length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        return Handler
+
+    def record(self, body):
+        with self._lock:
+            self.attempts += 1
+            status = self._statuses.pop(0) if self._statuses else 200
+            if status < 300:
+                self.responses.append(json.loads(body.decode('utf-8')))
+            return status
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8888)
+    arguments = parser.parse_args(argv)
+
+    fake = FakeCfn(arguments.port, server_class=HTTPServer)
+    original = fake.record
+
+    def record(body):
+        status = original(body)
+        print(body.decode('utf-8'), flush=True)
+        return status
+
+    fake.record = record
+    print('Listening on', fake.url, flush=True)
+    try:
+        fake._server.serve_forever()  # pylint: disable=protected-access
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
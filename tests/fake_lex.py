@@ -0,0 +1,487 @@
+""" In-memory stand-ins for the Lex model building, Lambda, STS and DynamoDB APIs
+
+FakeLex keeps bots, intents and slot types in memory with the checksum,
+versioning and in-use rules of the real service, so builders given
+lex_sdk=FakeLex() (or clients.register_client('lex-models', ...)) can be
+run end to end without AWS. Latency, throttling and failures can be
+injected per operation to exercise the concurrency and retry code.
+"""
+import copy
+import datetime
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from botocore.exceptions import ClientError
+
+BOT = 'bot'
+INTENT = 'intent'
+SLOT_TYPE = 'slot_type'
+
+LATEST = '$LATEST'
+
+# keys of a get_*_versions response for each resource type
+VERSIONS_KEYS = {BOT: 'bots', INTENT: 'intents', SLOT_TYPE: 'slotTypes'}
+
+# http status code returned with each error code
+HTTP_STATUS = {
+    'NotFoundException': 404,
+    'PreconditionFailedException': 412,
+    'ResourceInUseException': 400,
+    'ResourceConflictException': 409,
+    'BadRequestException': 400,
+    'ConflictException': 409,
+    'ThrottlingException': 429,
+    'LimitExceededException': 429,
+    'InternalFailureException': 500,
+}
+
+
+def client_error(code, operation, message=None):
+    """The ClientError botocore raises for an error response"""
+    operation_name = ''.join(part.capitalize() for part in operation.split('_'))
+    return ClientError({'Error': {'Code': code, 'Message': message or code},
+                        'ResponseMetadata': {'HTTPStatusCode': HTTP_STATUS.get(code, 400)}},
+                       operation_name)
+
+
+class FaultInjector(object):
+    """ latency, throttling and failures added to every call """
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, seed=None, sleep=time.sleep):
+        self._latency = latency
+        self._throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self._failures = {}
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def fail(self, operation, code, times=1):
+        """Raise code from the next times calls of operation"""
+        with self._lock:
+            self._failures.setdefault(operation, []).extend([code] * times)
+
+    def before(self, operation):
+        """Count the call, wait for its latency and raise any injected error"""
+        with self._lock:
+            self.calls[operation] += 1
+            failures = self._failures.get(operation)
+            code = failures.pop(0) if failures else None
+            throttled = self._throttle_rate and self._random.random() < self._throttle_rate
+
+        latency = self._latency.get(operation, 0.0) if isinstance(self._latency, dict) \
+            else self._latency
+        if latency:
+            self._sleep(latency)
+        if code is not None:
+            raise client_error(code, operation)
+        if throttled:
+            raise client_error('ThrottlingException', operation)
+
+
+class FakeLex(object):
+    """ the lex-models operations used by the builders """
+
+    def __init__(self, build_status='READY', faults=None, deleting_checks=0,
+                 version_build_checks=0, **fault_options):
+        self.build_status = build_status
+        self.faults = FaultInjector(**fault_options) if faults is None else faults
+        # like Lex, a deleted bot keeps its intents in use for a while: here
+        # for this many delete_intent calls that hit it
+        self.deleting_checks = deleting_checks
+        # like Lex, a new bot version builds for a while: here for this many
+        # get_bot calls of the version
+        self.version_build_checks = version_build_checks
+        # (bot name, version) -> get_bot calls left before it is READY
+        self._version_builds = {}
+        self._lock = threading.RLock()
+        # resource type -> name -> {'$LATEST': definition, '1': definition, ...}
+        self._resources = {BOT: {}, INTENT: {}, SLOT_TYPE: {}}
+        # bot being deleted -> [checks left, names of the intents it uses]
+        self._deleting = {}
+        # bot name -> alias name -> alias
+        self._aliases = {}
+
+    @property
+    def calls(self):
+        return self.faults.calls
+
+    def fail(self, operation, code, times=1):
+        self.faults.fail(operation, code, times)
+
+    def definition(self, resource_type, name, version=LATEST):
+        """Stored definition of a resource, None if it does not exist"""
+        with self._lock:
+            versions = self._resources[resource_type].get(name, {})
+            return copy.deepcopy(versions.get(version))
+
+    def get_bot(self, name, versionOrAlias):
+        return self._get('get_bot', BOT, name, versionOrAlias)
+
+    def get_intent(self, name, version):
+        return self._get('get_intent', INTENT, name, version)
+
+    def get_slot_type(self, name, version):
+        return self._get('get_slot_type', SLOT_TYPE, name, version)
+
+    def put_bot(self, **request):
+        return self._put('put_bot', BOT, request)
+
+    def put_intent(self, **request):
+        return self._put('put_intent', INTENT, request)
+
+    def put_slot_type(self, **request):
+        return self._put('put_slot_type', SLOT_TYPE, request)
+
+    def create_bot_version(self, name, checksum=None):
+        return self._create_version('create_bot_version', BOT, name, checksum)
+
+    def create_intent_version(self, name, checksum=None):
+        return self._create_version('create_intent_version', INTENT, name, checksum)
+
+    def create_slot_type_version(self, name, checksum=None):
+        return self._create_version('create_slot_type_version', SLOT_TYPE, name, checksum)
+
+    def get_bot_versions(self, name, nextToken=None, maxResults=50):
+        return self._get_versions('get_bot_versions', BOT, name, nextToken, maxResults)
+
+    def get_intent_versions(self, name, nextToken=None, maxResults=50):
+        return self._get_versions('get_intent_versions', INTENT, name, nextToken, maxResults)
+
+    def get_slot_type_versions(self, name, nextToken=None, maxResults=50):
+        return self._get_versions('get_slot_type_versions', SLOT_TYPE, name, nextToken,
+                                  maxResults)
+
+    def delete_bot(self, name):
+        self._delete('delete_bot', BOT, name)
+
+    def delete_intent(self, name):
+        self._delete('delete_intent', INTENT, name)
+
+    def delete_slot_type(self, name):
+        self._delete('delete_slot_type', SLOT_TYPE, name)
+
+    def delete_bot_version(self, name, version):
+        self._delete_version('delete_bot_version', BOT, name, version)
+
+    def delete_intent_version(self, name, version):
+        self._delete_version('delete_intent_version', INTENT, name, version)
+
+    def put_bot_alias(self, name, botName, botVersion, checksum=None, description=None):
+        self.faults.before('put_bot_alias')
+        with self._lock:
+            if botVersion not in self._resources[BOT].get(botName, {}):
+                raise client_error('BadRequestException', 'put_bot_alias',
+                                   'bot {0}:{1} does not exist'.format(botName, botVersion))
+            current = self._aliases.get(botName, {}).get(name)
+            if checksum != (current or {}).get('checksum'):
+                raise client_error('PreconditionFailedException', 'put_bot_alias')
+            now = datetime.datetime.utcnow()
+            alias = {'name': name, 'botName': botName, 'botVersion': botVersion,
+                     'description': description, 'checksum': uuid.uuid4().hex,
+                     'createdDate': current['createdDate'] if current else now,
+                     'lastUpdatedDate': now}
+            self._aliases.setdefault(botName, {})[name] = alias
+            return copy.deepcopy(alias)
+
+    def get_bot_alias(self, name, botName):
+        self.faults.before('get_bot_alias')
+        with self._lock:
+            alias = self._aliases.get(botName, {}).get(name)
+            if alias is None:
+                raise client_error('NotFoundException', 'get_bot_alias')
+            return copy.deepcopy(alias)
+
+    def delete_bot_alias(self, name, botName):
+        self.faults.before('delete_bot_alias')
+        with self._lock:
+            if self._aliases.get(botName, {}).pop(name, None) is None:
+                raise client_error('NotFoundException', 'delete_bot_alias')
+
+    def get_bot_aliases(self, botName, nextToken=None, maxResults=50):
+        self.faults.before('get_bot_aliases')
+        with self._lock:
+            aliases = [copy.deepcopy(alias) for _, alias in
+                       sorted(self._aliases.get(botName, {}).items())]
+        start = int(nextToken or 0)
+        response = {'BotAliases': aliases[start:start + maxResults]}
+        if start + maxResults < len(aliases):
+            response['nextToken'] = str(start + maxResults)
+        return response
+
+    def _get(self, operation, resource_type, name, version):
+        self.faults.before(operation)
+        if resource_type == BOT:
+            self._check_version_build(name, version)
+        definition = self.definition(resource_type, name, version)
+        if definition is None:
+            raise client_error('NotFoundException', operation,
+                               '{0} {1}:{2} not found'.format(resource_type, name, version))
+        return definition
+
+    def _put(self, operation, resource_type, request):
+        self.faults.before(operation)
+        request = copy.deepcopy(request)
+        name = request['name']
+        checksum = request.pop('checksum', None)
+        request.pop('createVersion', None)
+        with self._lock:
+            current = self._resources[resource_type].get(name, {}).get(LATEST)
+            if current is None and checksum is not None:
+                raise client_error('PreconditionFailedException', operation,
+                                   '{0} {1} does not exist'.format(resource_type, name))
+            if current is not None and checksum != current['checksum']:
+                raise client_error('PreconditionFailedException', operation,
+                                   'checksum of {0} {1} does not match'.format(
+                                       resource_type, name))
+            if resource_type == INTENT:
+                self._check_slot_types(operation, request)
+            elif resource_type == BOT:
+                self._check_intents(operation, request)
+
+            now = datetime.datetime.utcnow()
+            definition = dict(request,
+                              version=LATEST,
+                              checksum=uuid.uuid4().hex,
+                              createdDate=current['createdDate'] if current else now,
+                              lastUpdatedDate=now)
+            if resource_type == BOT:
+                definition['status'] = self.build_status
+            self._resources[resource_type].setdefault(name, {})[LATEST] = definition
+            return copy.deepcopy(definition)
+
+    def _check_slot_types(self, operation, request):
+        for slot in request.get('slots', []):
+            slot_type = slot['slotType']
+            version = slot.get('slotTypeVersion', LATEST)
+            if not slot_type.startswith('AMAZON.') \
+                    and version not in self._resources[SLOT_TYPE].get(slot_type, {}):
+                raise client_error('BadRequestException', operation,
+                                   'slot type {0} does not exist'.format(slot_type))
+
+    def _check_intents(self, operation, request):
+        for intent in request.get('intents', []):
+            versions = self._resources[INTENT].get(intent['intentName'], {})
+            if intent['intentVersion'] not in versions:
+                raise client_error('BadRequestException', operation,
+                                   'intent {0}:{1} does not exist'.format(
+                                       intent['intentName'], intent['intentVersion']))
+
+    def _create_version(self, operation, resource_type, name, checksum):
+        self.faults.before(operation)
+        with self._lock:
+            versions = self._resources[resource_type].get(name)
+            if not versions:
+                raise client_error('NotFoundException', operation)
+            latest = versions[LATEST]
+            if checksum is not None and checksum != latest['checksum']:
+                raise client_error('PreconditionFailedException', operation)
+
+            numbered = sorted(int(version) for version in versions if version.isdigit())
+            if numbered and versions[str(numbered[-1])]['checksum'] == latest['checksum']:
+                # $LATEST has not changed since the last version
+                return copy.deepcopy(versions[str(numbered[-1])])
+
+            version = str(numbered[-1] + 1 if numbered else 1)
+            versions[version] = dict(latest, version=version)
+            if resource_type == BOT and self.version_build_checks:
+                versions[version]['status'] = 'BUILDING'
+                self._version_builds[(name, version)] = self.version_build_checks
+            return copy.deepcopy(versions[version])
+
+    def _check_version_build(self, name, version):
+        with self._lock:
+            checks = self._version_builds.get((name, version))
+            if checks is None:
+                return
+            if checks > 1:
+                self._version_builds[(name, version)] = checks - 1
+            else:
+                del self._version_builds[(name, version)]
+                self._resources[BOT][name][version]['status'] = 'READY'
+
+    def _get_versions(self, operation, resource_type, name, next_token, max_results):
+        self.faults.before(operation)
+        with self._lock:
+            versions = self._resources[resource_type].get(name)
+            if not versions:
+                raise client_error('NotFoundException', operation)
+            summaries = [{'name': name, 'version': version,
+                          'description': definition.get('description'),
+                          'createdDate': definition['createdDate'],
+                          'lastUpdatedDate': definition['lastUpdatedDate']}
+                         for version, definition in sorted(versions.items(),
+                                                           key=_version_order)]
+
+        start = int(next_token or 0)
+        response = {VERSIONS_KEYS[resource_type]: summaries[start:start + max_results]}
+        if start + max_results < len(summaries):
+            response['nextToken'] = str(start + max_results)
+        return response
+
+    def _delete(self, operation, resource_type, name):
+        self.faults.before(operation)
+        with self._lock:
+            if name not in self._resources[resource_type]:
+                raise client_error('NotFoundException', operation)
+            if self._in_use(resource_type, name):
+                raise client_error('ResourceInUseException', operation,
+                                   '{0} {1} is in use'.format(resource_type, name))
+            versions = self._resources[resource_type].pop(name)
+            if resource_type == BOT and self.deleting_checks:
+                self._deleting[name] = [self.deleting_checks,
+                                        set(intent['intentName'] for bot in versions.values()
+                                            for intent in bot.get('intents', []))]
+
+    def _delete_version(self, operation, resource_type, name, version):
+        self.faults.before(operation)
+        with self._lock:
+            if version == LATEST:
+                raise client_error('BadRequestException', operation)
+            versions = self._resources[resource_type].get(name, {})
+            if version not in versions:
+                raise client_error('NotFoundException', operation)
+            if self._version_in_use(resource_type, name, version):
+                raise client_error('ResourceInUseException', operation,
+                                   '{0} {1}:{2} is in use'.format(resource_type, name, version))
+            del versions[version]
+
+    def _version_in_use(self, resource_type, name, version):
+        if resource_type == BOT:
+            return any(alias['botVersion'] == version
+                       for alias in self._aliases.get(name, {}).values())
+        return any(intent['intentName'] == name and intent['intentVersion'] == version
+                   for versions in self._resources[BOT].values()
+                   for bot in versions.values()
+                   for intent in bot.get('intents', []))
+
+    def _in_use(self, resource_type, name):
+        if resource_type == BOT:
+            return bool(self._aliases.get(name))
+        if resource_type == INTENT:
+            for bot_name, deleting in list(self._deleting.items()):
+                if name in deleting[1]:
+                    deleting[0] -= 1
+                    if deleting[0] <= 0:
+                        del self._deleting[bot_name]
+                    return True
+            return any(intent['intentName'] == name
+                       for versions in self._resources[BOT].values()
+                       for bot in versions.values()
+                       for intent in bot.get('intents', []))
+        if resource_type == SLOT_TYPE:
+            return any(slot['slotType'] == name
+                       for versions in self._resources[INTENT].values()
+                       for intent in versions.values()
+                       for slot in intent.get('slots', []))
+        return False
+
+
+class FakeLambda(object):
+    """ the lambda permission and policy operations used by the intent
+    builder, and asynchronous invokes used to continue a request """
+
+    def __init__(self, faults=None, **fault_options):
+        self.faults = FaultInjector(**fault_options) if faults is None else faults
+        self._lock = threading.Lock()
+        # function name -> statement id -> statement
+        self.policies = {}
+        # (function name, payload) of every asynchronous invoke
+        self.invocations = []
+
+    @property
+    def calls(self):
+        return self.faults.calls
+
+    def add_permission(self, FunctionName, StatementId, **statement):  # noqa: N803 pylint: disable=invalid-name
+        self.faults.before('add_permission')
+        with self._lock:
+            policy = self.policies.setdefault(FunctionName, {})
+            if StatementId in policy:
+                raise client_error('ResourceConflictException', 'add_permission',
+                                   'statement {0} already exists'.format(StatementId))
+            policy[StatementId] = dict(statement, Sid=StatementId)
+            return {'Statement': copy.deepcopy(policy[StatementId])}
+
+    def get_policy(self, FunctionName):  # noqa: N803 pylint: disable=invalid-name
+        self.faults.before('get_policy')
+        with self._lock:
+            policy = self.policies.get(FunctionName)
+            if not policy:
+                raise client_error('ResourceNotFoundException', 'get_policy',
+                                   'no policy for {0}'.format(FunctionName))
+            return {'Policy': json.dumps({'Version': '2012-10-17',
+                                          'Statement': list(policy.values())}),
+                    'RevisionId': uuid.uuid4().hex}
+
+    def remove_permission(self, FunctionName, StatementId):  # noqa: N803 pylint: disable=invalid-name
+        self.faults.before('remove_permission')
+        with self._lock:
+            if StatementId not in self.policies.get(FunctionName, {}):
+                raise client_error('ResourceNotFoundException', 'remove_permission')
+            del self.policies[FunctionName][StatementId]
+
+    def invoke(self, FunctionName, InvocationType, Payload):  # noqa: N803 pylint: disable=invalid-name
+        self.faults.before('invoke')
+        with self._lock:
+            self.invocations.append((FunctionName, json.loads(Payload)))
+        return {'StatusCode': 202 if InvocationType == 'Event' else 200}
+
+
+class FakeSts(object):
+    """ the caller identity lookup used for the account id """
+
+    def __init__(self, account_id='123456789012', faults=None, **fault_options):
+        self.account_id = account_id
+        self.faults = FaultInjector(**fault_options) if faults is None else faults
+
+    @property
+    def calls(self):
+        return self.faults.calls
+
+    def get_caller_identity(self):
+        self.faults.before('get_caller_identity')
+        return {'Account': self.account_id,
+                'Arn': 'arn:aws:sts::{0}:assumed-role/lex-provisioner/bench'.format(
+                    self.account_id)}
+
+
+class FakeDynamoDb(object):
+    """ item operations on tables keyed by a string "id" """
+
+    def __init__(self, faults=None, **fault_options):
+        self.faults = FaultInjector(**fault_options) if faults is None else faults
+        self._lock = threading.Lock()
+        # table name -> id -> item
+        self.tables = {}
+
+    @property
+    def calls(self):
+        return self.faults.calls
+
+    def get_item(self, TableName, Key, ConsistentRead=False):  # noqa: N803 pylint: disable=invalid-name,unused-argument
+        self.faults.before('get_item')
+        with self._lock:
+            item = self.tables.get(TableName, {}).get(Key['id']['S'])
+            return {} if item is None else {'Item': copy.deepcopy(item)}
+
+    def put_item(self, TableName, Item):  # noqa: N803 pylint: disable=invalid-name
+        self.faults.before('put_item')
+        with self._lock:
+            self.tables.setdefault(TableName, {})[Item['id']['S']] = copy.deepcopy(Item)
+        return {}
+
+    def delete_item(self, TableName, Key):  # noqa: N803 pylint: disable=invalid-name
+        self.faults.before('delete_item')
+        with self._lock:
+            self.tables.get(TableName, {}).pop(Key['id']['S'], None)
+        return {}
+
+
+def _version_order(item):
+    version = item[0]
+    return (0, int(version)) if version.isdigit() else (1, 0)
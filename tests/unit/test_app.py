@@ -1,5 +1,6 @@
 """test_app"""
 # pylint: disable=import-error
+import os
 
 import mock  # pylint: disable=unused-import
 import pytest  # pylint: disable=unused-import
@@ -9,8 +10,13 @@ from pytest_mock import mocker  # noqa, flake8 issue  pylint: disable=unused-imp
 
 import app  # pylint: disable=import-error
 import aws_helper  # noqa, flake8 issue pylint: disable=import-error,unused-import
+import clients  # pylint: disable=import-error
+import lex_helper  # pylint: disable=import-error
 from models.intent import Intent
 from models.slot_type import SlotType
+from tests import benchmark
+from tests.fake_lex import FakeLambda, FakeLex, FakeSts
+from utils import ProvisioningError
 
 # pylint: disable=redefined-outer-name
 PREFIX = 'pythontest'
@@ -188,14 +194,14 @@ def _extract_intents(bot_name, resources):
 
 
 def patch_builder(context, builder, monkeypatch):
-    def builder_bot_stub(context):  # pylint: disable=unused-argument
+    def builder_bot_stub(context, **kwargs):  # pylint: disable=unused-argument
         return builder
 
     monkeypatch.setattr(app, "lex_builder_instance", builder_bot_stub)
 
 
 def patch_slot_builder(context, slot_builder, monkeypatch):
-    def builder_slot_stub(context):  # pylint: disable=unused-argument
+    def builder_slot_stub(context, **kwargs):  # pylint: disable=unused-argument
         return slot_builder
 
     monkeypatch.setattr(app, "slot_builder_instance", builder_slot_stub)
@@ -276,6 +282,47 @@ def test_create_puts(mock_intent, mock_bot, cfn_create_event, setup, monkeypatch
     assert response['BotVersion'] == BOT_VERSION
 
 
+def test_create_passes_max_workers(cfn_create_event, setup, monkeypatch):
+    """ test_create_passes_max_workers """
+    context, builder, slot_builder = setup
+    cfn_create_event['ResourceProperties']['maxWorkers'] = '8'
+    builder.put.return_value = {"name": BOT_NAME, "version": '$LATEST'}
+    builder_kwargs = {}
+
+    def builder_bot_stub(context, **kwargs):  # pylint: disable=unused-argument
+        builder_kwargs.update(kwargs)
+        return builder
+
+    monkeypatch.setattr(app, "lex_builder_instance", builder_bot_stub)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    app.create(cfn_create_event, context)
+
+    assert builder_kwargs['max_workers'] == 8
+
+
+def test_create_returns_build_status(cfn_create_event, setup, monkeypatch):
+    """ test_create_returns_build_status """
+    context, builder, slot_builder = setup
+    cfn_create_event['ResourceProperties']['waitForBuild'] = 'false'
+    builder.put.return_value = {"name": BOT_NAME, "version": '$LATEST',
+                                "buildStatus": 'BUILDING', "buildSeconds": 1.5}
+    builder_kwargs = {}
+
+    def builder_bot_stub(context, **kwargs):  # pylint: disable=unused-argument
+        builder_kwargs.update(kwargs)
+        return builder
+
+    monkeypatch.setattr(app, "lex_builder_instance", builder_bot_stub)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    response = app.create(cfn_create_event, context)
+
+    assert builder_kwargs['wait_for_build'] is False
+    assert response['BuildStatus'] == 'BUILDING'
+    assert response['BuildSeconds'] == '1.5'
+
+
 def test_create_put_slottypes(cfn_create_event, setup, monkeypatch):
     """ test_create_put_slottypes_"""
     context, builder, slot_builder = setup
@@ -294,6 +341,49 @@ def test_create_put_slottypes(cfn_create_event, setup, monkeypatch):
     assert response['BotName'] == BOT_NAME
 
 
+def test_create_reports_all_slot_type_failures(cfn_create_event, setup, monkeypatch):
+    """ test_create_reports_all_slot_type_failures """
+    context, builder, slot_builder = setup
+    cfn_create_event['ResourceProperties']['maxWorkers'] = '4'
+    cfn_create_event['ResourceProperties']['slotTypes'].update({
+        'crust': {'stuffed': ['stuffed']},
+        'topping': {'cheese': ['cheese']}
+    })
+
+    def put_slot_type(slot_type):
+        if slot_type.name != PREFIX + 'crust':
+            raise Exception('put failed')
+        return {'name': slot_type.name}
+
+    slot_builder.put_slot_type.side_effect = put_slot_type
+    patch_builder(context, builder, monkeypatch)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    with pytest.raises(ProvisioningError) as excinfo:
+        app.create(cfn_create_event, context)
+
+    assert sorted(excinfo.value.failures.keys()) == [PREFIX + SLOT_TYPE_NAME, PREFIX + 'topping']
+    assert slot_builder.put_slot_type.call_count == 3
+    builder.put.assert_not_called()
+
+
+def test_create_graph_scheduling(cfn_create_event, setup, monkeypatch):
+    """ test_create_graph_scheduling """
+    context, builder, slot_builder = setup
+    cfn_create_event['ResourceProperties']['scheduling'] = 'graph'
+    builder.put.return_value = {"name": BOT_NAME, "version": '$LATEST'}
+    slot_types = SlotType.create_slot_types(SLOT_TYPES, prefix=PREFIX)
+
+    patch_builder(context, builder, monkeypatch)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    response = app.create(cfn_create_event, context)
+
+    slot_builder.put_slot_type.assert_not_called()
+    assert builder.put.call_args[1]['slot_types'] == slot_types
+    assert response['BotName'] == BOT_NAME
+
+
 @mock.patch('models.bot.Bot.create_bot')
 @mock.patch('models.intent.Intent.create_intent')
 def test_update_puts_no_prefix(mock_intent, mock_bot, cfn_create_no_prefix_event, setup, monkeypatch):
@@ -338,10 +428,70 @@ def test_update_puts(mock_intent, mock_bot, cfn_create_event, setup, monkeypatch
     assert response['BotVersion'] == BOT_VERSION
 
 
-@pytest.mark.skip(reason="need to work out in CFN what is currently deployed and new")
-def test_update_deleted_slot(cfn_create_event, setup, monkeypatch):
-    context, _, _ = setup
-    app.update(cfn_create_event, context)
+@pytest.fixture()
+def cfn_update_event():
+    """ Generates Custom CFN update Event"""
+    update_event = cfn_event("Update")
+    update_event['OldResourceProperties'] = cfn_event("Update")['ResourceProperties']
+    return update_event
+
+
+def test_update_only_puts_changes(cfn_update_event, setup, monkeypatch):
+    """ test_update_only_puts_changes """
+    context, builder, slot_builder = setup
+    resources = cfn_update_event['ResourceProperties']
+    resources['intents'][1]['Utterances'] = ['goodbye my friend']
+    resources['slotTypes']['crust'] = {'stuffed': ['stuffed']}
+    builder.put.return_value = {"name": BOT_NAME, "version": '2'}
+
+    patch_builder(context, builder, monkeypatch)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    response = app.update(cfn_update_event, context)
+
+    slot_builder.put_slot_type.assert_called_once_with(
+        SlotType(PREFIX + 'crust', {'stuffed': ['stuffed']}))
+    assert builder.put.call_args[1]['changed_intents'] == ['farewell']
+    builder.delete_intents.assert_called_once_with([], leave_in_use=True)
+    slot_builder.delete_slot_type.assert_not_called()
+    assert response['BotVersion'] == '2'
+
+
+def test_update_deleted_slot(cfn_update_event, setup, monkeypatch):
+    """ test_update_deleted_slot """
+    context, builder, slot_builder = setup
+    resources = cfn_update_event['ResourceProperties']
+    resources.pop('slotTypes')
+    resources['intents'].pop()
+    builder.put.return_value = {"name": BOT_NAME, "version": '2'}
+
+    patch_builder(context, builder, monkeypatch)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    app.update(cfn_update_event, context)
+
+    slot_builder.put_slot_type.assert_not_called()
+    assert builder.put.call_args[1]['changed_intents'] == []
+    builder.delete_intents.assert_called_once_with(['farewell'], leave_in_use=True)
+    slot_builder.delete_slot_type.assert_called_once_with(PREFIX + SLOT_TYPE_NAME,
+                                                          leave_in_use=True)
+
+
+@mock.patch('models.bot.Bot.create_bot')
+def test_update_renamed_bot_creates(mock_bot, cfn_update_event, setup, monkeypatch):
+    """ test_update_renamed_bot_creates """
+    context, builder, slot_builder = setup
+    cfn_update_event['ResourceProperties']['NamePrefix'] = 'renamed'
+    mock_bot.return_value = '1234'
+    builder.put.return_value = {"name": 'renamedLexBot', "version": '$LATEST'}
+
+    patch_builder(context, builder, monkeypatch)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    app.update(cfn_update_event, context)
+
+    builder.put.assert_called_once_with('1234')
+    builder.delete_intents.assert_not_called()
 
 
 @mock.patch('models.bot.Bot.create_bot')
@@ -385,3 +535,128 @@ def test_delete_no_prefix(validate_intent, mock_intent, mock_bot,
 
     builder.delete.assert_called_once_with('1234')
     slot_builder.delete_slot_type.assert_called_once_with(SLOT_TYPE_NAME)
+
+
+@mock.patch('models.bot.Bot.create_bot')
+def test_delete_graph_scheduling(mock_bot, cfn_delete_event, setup, monkeypatch):
+    """ test_delete_graph_scheduling """
+    context, builder, slot_builder = setup
+    cfn_delete_event['ResourceProperties']['scheduling'] = 'graph'
+    mock_bot.return_value = '1234'
+
+    patch_builder(context, builder, monkeypatch)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    app.delete(cfn_delete_event, context)
+
+    builder.delete.assert_called_once_with(
+        '1234', slot_types=SlotType.create_slot_types(SLOT_TYPES, prefix=PREFIX))
+    slot_builder.delete_slot_type.assert_not_called()
+
+
+def test_cache_aws_details_from_service_token(cfn_create_event, mocker):
+    """ test_cache_aws_details_from_service_token """
+    context = mocker.Mock()
+    context.invoked_function_arn = None
+    lex_helper.clear_aws_details()
+
+    app._cache_aws_details(cfn_create_event, context)  # pylint: disable=protected-access
+    account_id, _ = lex_helper.LexHelper()._get_aws_details()  # pylint: disable=protected-access
+    lex_helper.clear_aws_details()
+
+    assert account_id == '123456789123'
+
+
+def test_create_prunes_versions(cfn_create_event, setup, monkeypatch):
+    """ test_create_prunes_versions """
+    context, builder, slot_builder = setup
+    cfn_create_event['ResourceProperties']['keepVersions'] = '2'
+    builder.put.return_value = {"name": BOT_NAME, "version": '3'}
+    pruner = mock.Mock()
+    pruner.prune.side_effect = ProvisioningError('Failed to provision 1 of 2 resources', {})
+
+    patch_builder(context, builder, monkeypatch)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+    monkeypatch.setattr(app, "version_pruner_instance",
+                        lambda context, keep, **kwargs: pruner if keep == 2 else None)
+
+    response = app.create(cfn_create_event, context)
+
+    pruner.prune.assert_called_once_with(BOT_NAME, ['greeting', 'farewell'])
+    assert response['BotVersion'] == '3'
+
+
+def test_create_reports_alias(cfn_create_event, setup, monkeypatch):
+    """ test_create_reports_alias """
+    context, builder, slot_builder = setup
+    cfn_create_event['ResourceProperties']['alias'] = 'live'
+    builder.put.return_value = {"name": BOT_NAME, "version": '2', "buildStatus": 'READY',
+                                "buildSeconds": 30.0, "alias": 'live', "previousVersion": '1'}
+    builder_kwargs = {}
+
+    def builder_bot_stub(context, **kwargs):  # pylint: disable=unused-argument
+        builder_kwargs.update(kwargs)
+        return builder
+
+    monkeypatch.setattr(app, "lex_builder_instance", builder_bot_stub)
+    patch_slot_builder(context, slot_builder, monkeypatch)
+
+    response = app.create(cfn_create_event, context)
+
+    assert builder_kwargs['alias'] == 'live'
+    assert response['BotAlias'] == 'live'
+    assert response['PreviousBotVersion'] == '1'
+
+
+@pytest.fixture()
+def fake_lex(monkeypatch):
+    """ FakeLex, FakeLambda and FakeSts as the shared clients """
+    lex = FakeLex()
+    for service_name, backend in (('lex-models', lex), ('lambda', FakeLambda()),
+                                  ('sts', FakeSts())):
+        clients.register_client(service_name, backend)
+    monkeypatch.setitem(os.environ, 'AWS_REGION', 'us-east-1')
+    yield lex
+    clients.clear_clients()
+    lex_helper.clear_aws_details()
+
+
+def removing_update(event, **resource_properties):
+    """Update dropping the last intent, the second slot type and its slots"""
+    removed_type = benchmark.PREFIX + 'type1'
+    update_event = benchmark.update_event(event, changed_fraction=0)
+    properties = update_event['ResourceProperties']
+    properties['intents'].pop()
+    properties['slotTypes'].pop('type1')
+    for intent in properties['intents']:
+        intent['Slots'] = [slot for slot in intent['Slots'] if slot['Type'] != removed_type]
+    properties.update(resource_properties)
+    return update_event
+
+
+def test_update_leaves_resources_older_versions_use(fake_lex):
+    event = benchmark.synthetic_event(intents=3, slot_types=2, metrics='false')
+    app.create(event, benchmark.BenchmarkContext())
+    fake_lex.calls.clear()
+
+    response = app.update(removing_update(event), benchmark.BenchmarkContext())
+
+    assert response['BotVersion'] == '2'
+    # version 1 of the bot and intents still use them, so one try each
+    assert fake_lex.calls['delete_intent'] == 1
+    assert fake_lex.calls['delete_slot_type'] == 1
+    assert fake_lex.definition('intent', 'intent2') is not None
+    assert fake_lex.definition('slot_type', benchmark.PREFIX + 'type1') is not None
+
+
+def test_update_deletes_removed_resources_once_pruned(fake_lex):
+    event = benchmark.synthetic_event(intents=3, slot_types=2, metrics='false')
+    app.create(event, benchmark.BenchmarkContext())
+
+    response = app.update(removing_update(event, keepVersions='1'),
+                          benchmark.BenchmarkContext())
+
+    assert response['BotVersion'] == '2'
+    assert fake_lex.definition('intent', 'intent2') is None
+    assert fake_lex.definition('slot_type', benchmark.PREFIX + 'type1') is None
+    assert fake_lex.definition('slot_type', benchmark.PREFIX + 'type0') is not None
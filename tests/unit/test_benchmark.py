@@ -0,0 +1,47 @@
+""" benchmark suite tests """
+# pylint: disable=missing-function-docstring
+import json
+
+# pylint: disable=import-error
+import clients
+from tests import benchmark
+# pylint: enable=import-error
+
+
+def test_synthetic_event_sizes():
+    event = benchmark.synthetic_event(intents=3, slots_per_intent=2, utterances=4,
+                                      slot_types=2, synonyms=5)
+    properties = event['ResourceProperties']
+
+    assert len(properties['intents']) == 3
+    assert len(properties['intents'][0]['Slots']) == 2
+    assert len(properties['intents'][0]['Utterances']) == 4
+    assert properties['intents'][0]['Slots'][1]['Type'] == 'benchtype1'
+    assert len(properties['slotTypes']['type0']['value0']) == 5
+
+
+def test_update_event_changes_some_intents():
+    event = benchmark.synthetic_event(intents=20)
+    update = benchmark.update_event(event, changed_fraction=0.1)
+
+    assert update['OldResourceProperties'] == event['ResourceProperties']
+    changed = [new for old, new in zip(event['ResourceProperties']['intents'],
+                                       update['ResourceProperties']['intents']) if old != new]
+    assert len(changed) == 2
+
+
+def test_run_reports_every_request(tmpdir):
+    output = tmpdir.join('report.json')
+
+    benchmark.main(['--intents', '2', '--latency', '0', '--max-workers', '2',
+                    '--output', str(output)])
+
+    report = json.loads(output.read())
+    result, = report['results']
+    assert report['format_version'] == benchmark.FORMAT_VERSION
+    assert result['create']['calls']['put_intent'] == 2
+    assert result['create']['calls']['get_caller_identity'] == 1
+    assert result['update']['calls']['put_intent'] == 1
+    assert result['delete']['calls']['delete_intent'] == 2
+    assert result['delete']['peak_memory_bytes'] > 0
+    assert clients._CLIENTS == {}  # pylint: disable=protected-access
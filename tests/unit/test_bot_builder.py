@@ -7,9 +7,13 @@ import pytest
 # from pytest_mock import mocker
 from unittest.mock import Mock
 
+import checkpoint
+import state_store
 from bot_builder import LexBotBuilder
 from models.bot import Bot
 from models.intent import Intent
+from models.slot_type import SlotType
+from utils import ContinuationRequired, ProvisioningError
 
 
 BOT_NAME = 'pythontestLexBot'
@@ -349,6 +353,127 @@ def test_create_put_intent_called(intent_builder,
         intent_builder_instance.put_intent.assert_called_with(intents[1])
 
 
+@mock.patch('bot_builder.IntentBuilder')
+def test_create_puts_intents_concurrently(intent_builder,
+                                          put_bot_response,
+                                          bot_properties,
+                                          mocker):
+    """ intent versions keep the bot intent order when put concurrently """
+    lex, intents = setup()
+    expected_put_params = put_bot_request(BOT_NAME, intents, MESSAGES)
+
+    with Stubber(lex) as stubber:
+        context = mock_context(mocker)
+        intent_builder_instance = intent_builder.return_value
+        intent_builder_instance.put_intent.side_effect = \
+            lambda intent: {'intentName': intent.intent_name, 'intentVersion': '$LATEST'}
+        stub_not_found_get_request(stubber)
+        stub_put_bot(stubber, put_bot_response, expected_put_params)
+
+        bot_builder = LexBotBuilder(Mock(), context, lex_sdk=lex,
+                                    intent_builder=intent_builder_instance,
+                                    max_workers=4)
+        bot = Bot.create_bot(BOT_NAME,
+                             intents,
+                             MESSAGES,
+                             **bot_properties)
+        response = bot_builder.put(bot)
+
+        assert response['version'] == BOT_VERSION
+        assert intent_builder_instance.put_intent.call_count == 2
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.IntentBuilder')
+def test_create_concurrent_intent_failure(intent_builder, bot_properties, mocker):
+    """ a failing intent fails the whole put before the bot is put """
+    lex, intents = setup()
+
+    def put_intent(intent):
+        if intent.intent_name == 'farewell':
+            raise Exception('put failed')
+        return {'intentName': intent.intent_name, 'intentVersion': '$LATEST'}
+
+    with Stubber(lex) as stubber:
+        context = mock_context(mocker)
+        intent_builder_instance = intent_builder.return_value
+        intent_builder_instance.put_intent.side_effect = put_intent
+
+        bot_builder = LexBotBuilder(Mock(), context, lex_sdk=lex,
+                                    intent_builder=intent_builder_instance,
+                                    max_workers=4)
+        bot = Bot.create_bot(BOT_NAME,
+                             intents,
+                             MESSAGES,
+                             **bot_properties)
+
+        with pytest.raises(ProvisioningError) as excinfo:
+            bot_builder.put(bot)
+
+        assert list(excinfo.value.failures.keys()) == ['farewell']
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.IntentBuilder')
+def test_create_puts_slot_types_with_graph(intent_builder,
+                                           put_bot_response,
+                                           bot_properties,
+                                           mocker):
+    """ slot types are put through the dependency graph """
+    lex, intents = setup()
+    expected_put_params = put_bot_request(BOT_NAME, intents, MESSAGES)
+    slot_types = SlotType.create_slot_types({'pizzasize': {'thin': ['thin']}})
+
+    with Stubber(lex) as stubber:
+        context = mock_context(mocker)
+        intent_builder_instance = stub_put_intent(intent_builder)
+        slot_builder = Mock()
+        stub_not_found_get_request(stubber)
+        stub_put_bot(stubber, put_bot_response, expected_put_params)
+
+        bot_builder = LexBotBuilder(Mock(), context, lex_sdk=lex,
+                                    intent_builder=intent_builder_instance,
+                                    slot_builder=slot_builder)
+        bot = Bot.create_bot(BOT_NAME,
+                             intents,
+                             MESSAGES,
+                             **bot_properties)
+        response = bot_builder.put(bot, slot_types=slot_types)
+
+        assert response['version'] == BOT_VERSION
+        slot_builder.put_slot_type.assert_called_once_with(slot_types[0])
+        assert intent_builder_instance.put_intent.call_count == 2
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.IntentBuilder')
+def test_update_puts_changed_intents(intent_builder, put_bot_response, bot_properties, mocker):
+    """ unchanged intents keep their current version """
+    lex, intents = setup()
+    expected_put_params = put_bot_request(BOT_NAME, intents, MESSAGES, has_checksum=True)
+    expected_put_params['intents'] = [{'intentName': 'greeting', 'intentVersion': '3'},
+                                      {'intentName': 'farewell', 'intentVersion': '$LATEST'}]
+
+    with Stubber(lex) as stubber:
+        context = mock_context(mocker)
+        intent_builder_instance = intent_builder.return_value
+        intent_builder_instance.current_version.return_value = \
+            {'intentName': 'greeting', 'intentVersion': '3'}
+        intent_builder_instance.put_intent.return_value = \
+            {'intentName': 'farewell', 'intentVersion': '$LATEST'}
+        stub_get_request(stubber)
+        stub_put_bot(stubber, put_bot_response, expected_put_params)
+
+        bot_builder = LexBotBuilder(Mock(), context, lex_sdk=lex,
+                                    intent_builder=intent_builder_instance)
+        bot = Bot.create_bot(BOT_NAME, intents, MESSAGES, **bot_properties)
+        bot_builder.put(bot, changed_intents=['farewell'])
+
+        intent_builder_instance.put_intent.assert_called_once_with(intents[1])
+        intent_builder_instance.current_version.assert_called_once_with(intents[0])
+        stubber.assert_no_pending_responses()
+
+
 @mock.patch('bot_builder.IntentBuilder')
 def test_delete_bot_called(intent_builder, put_bot_response, bot_properties, mocker):
     """ delete bot called test """
@@ -419,5 +544,163 @@ def test_delete_bot_intents_called(intent_builder, put_bot_response, mocker):
         bot_builder.delete(bot)
 
         assert intent_builder_instance.delete_intents.call_count == 1
-        intent_builder_instance.delete_intents.assert_called_with(['greeting', 'farewell'])
+        intent_builder_instance.delete_intents.assert_called_with(['greeting', 'farewell'],
+                                                                  max_workers=1)
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.IntentBuilder')
+def test_delete_with_graph(intent_builder, mocker):
+    """ graph delete removes the bot, then intents, then slot types """
+    lex, intents = setup()
+    slot_types = SlotType.create_slot_types({'pizzasize': {'thin': ['thin']}})
+
+    with Stubber(lex) as stubber:
+        intent_builder_instance = intent_builder.return_value
+        slot_builder = Mock()
+
+        stub_get_request(stubber)
+        stubber.add_response('delete_bot', {}, {'name': BOT_NAME})
+
+        bot_builder = LexBotBuilder(Mock(), mocker.Mock(), lex_sdk=lex,
+                                    intent_builder=intent_builder_instance,
+                                    slot_builder=slot_builder)
+        bot = Bot.create_bot(BOT_NAME, intents, {})
+
+        bot_builder.delete(bot, slot_types=slot_types)
+
+        intent_builder_instance.delete_intents.assert_any_call(['greeting'])
+        intent_builder_instance.delete_intents.assert_any_call(['farewell'])
+        slot_builder.delete_slot_type.assert_called_once_with('pizzasize')
+        stubber.assert_no_pending_responses()
+
+
+def stub_building_put(stubber, put_bot_response, statuses):
+    """ stub a put that is followed by get_bot polls returning statuses """
+    expected_put_params = put_bot_request(BOT_NAME, setup()[1], MESSAGES)
+    stub_not_found_get_request(stubber)
+    stubber.add_response('put_bot', dict(put_bot_response, status='BUILDING'),
+                         expected_put_params)
+    for status in statuses:
+        stubber.add_response('get_bot', dict(_get_bot_response(), status=status,
+                                             checksum='rnd value'),
+                             get_bot_request())
+
+
+@mock.patch('bot_builder.time.sleep')
+@mock.patch('bot_builder.IntentBuilder')
+def test_put_bot_waits_for_build(intent_builder, sleep, put_bot_response, bot_properties, mocker):
+    """ bot version is only created once the build is ready """
+    lex, intents = setup()
+
+    with Stubber(lex) as stubber:
+        intent_builder_instance = stub_put_intent(intent_builder)
+        stub_building_put(stubber, put_bot_response, ['BUILDING', 'BUILDING', 'READY'])
+        create_bot_version_response, create_bot_version_params = \
+            put_bot_version_interaction(BOT_NAME, '1')
+        stubber.add_response('create_bot_version',
+                             create_bot_version_response, create_bot_version_params)
+
+        bot_builder = LexBotBuilder(Mock(), mock_context(mocker), lex_sdk=lex,
+                                    intent_builder=intent_builder_instance)
+        bot = Bot.create_bot(BOT_NAME, intents, MESSAGES, **bot_properties)
+        response = bot_builder.put(bot)
+
+        assert response['version'] == '1'
+        assert response['buildStatus'] == 'READY'
+        assert [call[0][0] for call in sleep.call_args_list] == [1.0, 1.5, 2.25]
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.time.sleep')
+@mock.patch('bot_builder.IntentBuilder')
+def test_put_bot_build_failed(intent_builder, sleep, put_bot_response, bot_properties, mocker):
+    """ a failed build fails the put """
+    lex, intents = setup()
+
+    with Stubber(lex) as stubber:
+        intent_builder_instance = stub_put_intent(intent_builder)
+        stub_building_put(stubber, put_bot_response, ['FAILED'])
+
+        bot_builder = LexBotBuilder(Mock(), mock_context(mocker), lex_sdk=lex,
+                                    intent_builder=intent_builder_instance)
+        bot = Bot.create_bot(BOT_NAME, intents, MESSAGES, **bot_properties)
+
+        with pytest.raises(ProvisioningError) as excinfo:
+            bot_builder.put(bot)
+
+        assert 'build FAILED' in str(excinfo.value)
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.time.sleep')
+@mock.patch('bot_builder.IntentBuilder')
+def test_put_bot_stops_waiting_at_deadline(intent_builder, sleep, put_bot_response,
+                                           bot_properties, mocker):
+    """ a build still running when the lambda runs out of time fails the put """
+    lex, intents = setup()
+
+    with Stubber(lex) as stubber:
+        context = mock_context(mocker)
+        context.get_remaining_time_in_millis.return_value = 5500.0
+        intent_builder_instance = stub_put_intent(intent_builder)
+        stub_building_put(stubber, put_bot_response, [])
+
+        bot_builder = LexBotBuilder(Mock(), context, lex_sdk=lex,
+                                    intent_builder=intent_builder_instance)
+        bot = Bot.create_bot(BOT_NAME, intents, MESSAGES, **bot_properties)
+
+        with pytest.raises(ProvisioningError) as excinfo:
+            bot_builder.put(bot)
+
+        assert 'still BUILDING' in str(excinfo.value)
+        sleep.assert_not_called()
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.time.sleep')
+@mock.patch('bot_builder.IntentBuilder')
+def test_put_bot_continues_the_build_wait(intent_builder, sleep, put_bot_response,
+                                          bot_properties, mocker, tmpdir):
+    """ with a checkpoint the next invocation waits for the build """
+    lex, intents = setup()
+    store = state_store.from_uri('file://' + str(tmpdir.join('checkpoints.json')))
+    progress = checkpoint.Checkpoint(store, 'stack#bot#request', {})
+
+    with Stubber(lex) as stubber:
+        context = mock_context(mocker)
+        context.get_remaining_time_in_millis.return_value = 5500.0
+        intent_builder_instance = stub_put_intent(intent_builder)
+        stub_building_put(stubber, put_bot_response, [])
+
+        bot_builder = LexBotBuilder(Mock(), context, lex_sdk=lex,
+                                    intent_builder=intent_builder_instance,
+                                    checkpoint=progress)
+        bot = Bot.create_bot(BOT_NAME, intents, MESSAGES, **bot_properties)
+
+        with pytest.raises(ContinuationRequired):
+            bot_builder.put(bot)
+
+        assert progress.completed('bot', BOT_NAME) is not None
+        sleep.assert_not_called()
+        stubber.assert_no_pending_responses()
+
+
+@mock.patch('bot_builder.IntentBuilder')
+def test_put_bot_without_waiting(intent_builder, put_bot_response, bot_properties, mocker):
+    """ fire and forget leaves the bot building """
+    lex, intents = setup()
+
+    with Stubber(lex) as stubber:
+        intent_builder_instance = stub_put_intent(intent_builder)
+        stub_building_put(stubber, put_bot_response, [])
+
+        bot_builder = LexBotBuilder(Mock(), mock_context(mocker), lex_sdk=lex,
+                                    intent_builder=intent_builder_instance,
+                                    wait_for_build=False)
+        bot = Bot.create_bot(BOT_NAME, intents, MESSAGES, **bot_properties)
+        response = bot_builder.put(bot)
+
+        assert response['version'] == '$LATEST'
+        assert response['buildStatus'] == 'BUILDING'
         stubber.assert_no_pending_responses()
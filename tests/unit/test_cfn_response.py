@@ -0,0 +1,88 @@
+""" CloudFormation response sender tests """
+# pylint: disable=missing-function-docstring
+import json
+import os
+from unittest.mock import Mock
+
+import pytest
+
+# pylint: disable=import-error
+import aws_helper
+import cfn_response
+from cfn_response import ResponseError, ResponseSender
+from tests.fake_cfn import FakeCfn
+# pylint: enable=import-error
+
+BODY = json.dumps({'Status': 'SUCCESS', 'Data': {'BotVersion': '1'}})
+
+
+class Context(object):
+    log_stream_name = 'test'
+
+    def __init__(self, seconds=300):
+        self.seconds = seconds
+
+    def get_remaining_time_in_millis(self):
+        return self.seconds * 1000
+
+
+@pytest.fixture(autouse=True)
+def session():
+    yield
+    cfn_response.clear_session()
+
+
+def test_response_is_put():
+    with FakeCfn() as fake:
+        assert ResponseSender(Mock()).send(fake.url, BODY) == 200
+
+    assert fake.responses == [json.loads(BODY)]
+
+
+def test_server_errors_are_retried():
+    sleeps = []
+    with FakeCfn(statuses=[503, 500]) as fake:
+        ResponseSender(Mock(), sleep=sleeps.append).send(fake.url, BODY)
+
+    assert fake.attempts == 3
+    assert len(sleeps) == 2
+    assert len(fake.responses) == 1
+
+
+def test_client_errors_are_not_retried():
+    with FakeCfn(statuses=[403]) as fake:
+        with pytest.raises(ResponseError):
+            ResponseSender(Mock(), sleep=lambda delay: None).send(fake.url, BODY)
+
+    assert fake.attempts == 1
+
+
+def test_slow_endpoint_times_out_and_gives_up():
+    with FakeCfn(delay=0.5) as fake:
+        sender = ResponseSender(Mock(), read_timeout=0.1, max_attempts=2,
+                                sleep=lambda delay: None)
+        with pytest.raises(ResponseError):
+            sender.send(fake.url, BODY)
+
+    assert fake.attempts == 2
+
+
+def test_no_retry_past_the_lambda_deadline():
+    with FakeCfn(statuses=[503, 503, 503]) as fake:
+        sender = ResponseSender(Mock(), Context(seconds=1), sleep=lambda delay: None)
+        with pytest.raises(ResponseError):
+            sender.send(fake.url, BODY)
+
+    assert fake.attempts == 1
+
+
+def test_send_cfn_confirmation(monkeypatch):
+    monkeypatch.setitem(os.environ, 'CONFIRM', 'True')
+    event = {'StackId': 'stack', 'RequestId': 'request', 'LogicalResourceId': 'LexBot'}
+    with FakeCfn() as fake:
+        aws_helper.send_cfn_confirmation(dict(event, ResponseURL=fake.url), Context(),
+                                         'SUCCESS', {'BotVersion': '1'}, 'physical', Mock())
+
+    assert fake.responses == [dict(event, Status='SUCCESS', PhysicalResourceId='physical',
+                                   Data={'BotVersion': '1'},
+                                   Reason='See details in CloudWatch Log Stream: test')]
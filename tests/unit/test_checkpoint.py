@@ -0,0 +1,147 @@
+""" checkpoint tests """
+# pylint: disable=missing-function-docstring, redefined-outer-name
+import time
+from unittest.mock import Mock
+
+import pytest
+
+# pylint: disable=import-error
+import checkpoint
+import lex_helper
+import state_store
+from checkpoint import Checkpoint, DynamoDbCheckpointStore
+from intent_builder import IntentBuilder
+from models.intent import Intent
+from models.slot_type import SlotType
+from slot_builder import SlotBuilder
+from state_store import FileStateStore
+from tests.fake_lex import FakeDynamoDb, FakeLambda, FakeLex, INTENT, SLOT_TYPE
+# pylint: enable=import-error
+
+LAMBDA_ARN = 'arn:aws:lambda:us-east-1:123456789123:function:GreetingLambda'
+KEY = 'arn:aws:cloudformation:us-east-1:123456789123:stack/lex/1#LexBot'
+REQUEST = {'RequestType': 'Create', 'ResourceProperties': {'intents': []}}
+
+
+@pytest.fixture(autouse=True)
+def aws_details():
+    lex_helper.cache_aws_details(LAMBDA_ARN)
+    yield
+    lex_helper.clear_aws_details()
+    state_store.clear_stores()
+
+
+@pytest.fixture(params=['file', 'dynamodb'])
+def store(request, tmpdir):
+    if request.param == 'file':
+        return FileStateStore(str(tmpdir.join('checkpoints.json')))
+    return DynamoDbCheckpointStore('lex-checkpoints', client=FakeDynamoDb())
+
+
+def test_checkpoint_round_trip(store):
+    Checkpoint(store, KEY, REQUEST).complete(INTENT, 'greeting', 'abc', '2')
+
+    resumed = Checkpoint(store, KEY, REQUEST)
+    assert resumed.completed(INTENT, 'greeting') == {'checksum': 'abc', 'version': '2'}
+    assert resumed.completed(SLOT_TYPE, 'greeting') is None
+
+    resumed.clear()
+    assert Checkpoint(store, KEY, REQUEST).completed(INTENT, 'greeting') is None
+
+
+def test_clear_forgets_resources_done_elsewhere(store):
+    Checkpoint(store, KEY, REQUEST).complete(INTENT, 'greeting', 'abc', '2')
+
+    Checkpoint(store, KEY, REQUEST).clear([(INTENT, 'greeting')])
+
+    assert Checkpoint(store, KEY, REQUEST).completed(INTENT, 'greeting') is None
+
+
+def test_complete_writes_one_small_record(tmpdir):
+    store = Mock()
+    progress = Checkpoint(store, KEY, REQUEST)
+    for index in range(100):
+        progress.complete(INTENT, 'intent{0}'.format(index), 'abc', '1')
+
+    assert store.put.call_count == 100
+    _, _, record = store.put.call_args[0]
+    assert record == {'checksum': 'abc', 'version': '1'}
+
+
+def test_checkpoint_of_other_request_is_ignored(store):
+    Checkpoint(store, KEY, REQUEST).complete(INTENT, 'greeting', 'abc', '2')
+
+    changed = dict(REQUEST, ResourceProperties={'intents': [{'Name': 'greeting'}]})
+    assert Checkpoint(store, KEY, changed).completed(INTENT, 'greeting') is None
+
+
+def test_from_event(tmpdir):
+    uri = 'file://' + str(tmpdir.join('checkpoints.json'))
+    event = dict(REQUEST, StackId='stack', LogicalResourceId='LexBot',
+                 ResourceProperties={'checkpointStore': uri})
+
+    assert checkpoint.from_event(dict(event, ResourceProperties={})) is None
+    checkpoint.from_event(event).complete(SLOT_TYPE, 'size', 'abc')
+    assert checkpoint.from_event(event).completed(SLOT_TYPE, 'size')['checksum'] == 'abc'
+    assert isinstance(checkpoint.store_from_uri('dynamodb://table'), DynamoDbCheckpointStore)
+
+
+def test_rerun_with_another_request_id_resumes(tmpdir):
+    uri = 'file://' + str(tmpdir.join('checkpoints.json'))
+    event = dict(REQUEST, StackId='stack', LogicalResourceId='LexBot', RequestId='first',
+                 ResourceProperties={'checkpointStore': uri})
+    checkpoint.from_event(event).complete(SLOT_TYPE, 'size', 'abc')
+
+    rerun = checkpoint.from_event(dict(event, RequestId='second'))
+    assert rerun.completed(SLOT_TYPE, 'size')['checksum'] == 'abc'
+
+
+def test_resume_skips_completed_resources(tmpdir):
+    lex = FakeLex()
+    store = FileStateStore(str(tmpdir.join('checkpoints.json')))
+    slot_types = [SlotType(name, {'thin': ['skinny']}) for name in ('size', 'crust', 'topping')]
+    intent = Intent('bot', 'greeting', LAMBDA_ARN, ['hello'], [], max_attempts=3,
+                    plaintext={'confirmation': 'ok', 'rejection': 'no'})
+
+    first = Checkpoint(store, KEY, REQUEST)
+    slot_builder = SlotBuilder(Mock(), None, lex_sdk=lex, checkpoint=first)
+    for slot_type in slot_types[:2]:
+        slot_builder.put_slot_type(slot_type)
+    version = IntentBuilder(Mock(), None, lex_sdk=lex, lambda_sdk=FakeLambda(),
+                            checkpoint=first).put_intent(intent)
+    lex.calls.clear()
+    resumed = Checkpoint(store, KEY, REQUEST)
+    slot_builder = SlotBuilder(Mock(), None, lex_sdk=lex, checkpoint=resumed)
+    for slot_type in slot_types:
+        slot_builder.put_slot_type(slot_type)
+    assert IntentBuilder(Mock(), None, lex_sdk=lex, lambda_sdk=FakeLambda(),
+                         checkpoint=resumed).put_intent(intent) == version
+
+    assert lex.calls['put_slot_type'] == 1
+    assert lex.calls['put_intent'] == 0
+    # each completed resource is checked, the third slot type is looked up
+    assert lex.calls['get_slot_type'] == 3
+    assert lex.calls['get_intent'] == 1
+    assert len(resumed) == 4
+
+
+def test_resource_changed_since_checkpointed_is_not_skipped():
+    lex = FakeLex()
+    store = Mock(get=Mock(return_value={'checksum': 'stale', 'version': '7'}))
+    intent = Intent('bot', 'greeting', LAMBDA_ARN, ['hello'], [], max_attempts=3,
+                    plaintext={'confirmation': 'ok', 'rejection': 'no'})
+    builder = IntentBuilder(Mock(), None, lex_sdk=lex, lambda_sdk=FakeLambda(),
+                            checkpoint=Checkpoint(store, KEY, REQUEST))
+    lex.put_intent(**builder.put_intent_request(intent))
+
+    assert builder.put_intent(intent) == {'intentName': 'greeting', 'intentVersion': '1'}
+    assert lex.calls['create_intent_version'] == 1
+
+
+def test_dynamodb_records_expire():
+    dynamodb = FakeDynamoDb()
+    Checkpoint(DynamoDbCheckpointStore('lex-checkpoints', client=dynamodb),
+               KEY, REQUEST).complete(INTENT, 'greeting', 'abc', '2')
+
+    item, = dynamodb.tables['lex-checkpoints'].values()
+    assert int(item['expires']['N']) > time.time() + checkpoint.EXPIRES_SECONDS - 60
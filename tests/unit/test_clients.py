@@ -0,0 +1,69 @@
+""" clients tests """
+# pylint: disable=missing-function-docstring
+import pytest
+
+# pylint: disable=import-error
+import clients
+# pylint: enable=import-error
+
+
+@pytest.fixture(autouse=True)
+def clear_clients():
+    clients.clear_clients()
+    yield
+    clients.clear_clients()
+
+
+def test_client_is_shared():
+    client = clients.get_client('lex-models')
+
+    assert clients.get_client('lex-models') is client
+    assert clients.get_client('lambda') is not client
+
+
+def test_client_config():
+    config = clients.get_client('lex-models').meta.config
+
+    assert config.max_pool_connections == clients.MAX_POOL_CONNECTIONS
+    assert config.tcp_keepalive
+    # retry.RetryPolicy retries Lex and Lambda calls
+    assert config.retries == {'mode': 'standard', 'total_max_attempts': 1}
+    assert clients.get_client('s3').meta.config.retries['mode'] == 'adaptive'
+
+
+def test_pool_grows_with_workers():
+    client = clients.get_client('lex-models')
+    clients.ensure_pool_size(32)
+    bigger = clients.get_client('lex-models')
+
+    assert bigger is not client
+    assert bigger.meta.config.max_pool_connections == 32
+
+    clients.ensure_pool_size(4)
+    assert clients.get_client('lex-models') is bigger
+
+
+def test_registered_client_is_used():
+    stand_in = object()
+    clients.register_client('lex-models', stand_in)
+    clients.ensure_pool_size(64)
+
+    assert clients.get_client('lex-models') is stand_in
+
+
+def test_lazy_client_created_on_first_use():
+    lazy = clients.LazyClient('lex-models')
+    assert clients._CLIENTS == {}  # pylint: disable=protected-access
+
+    stand_in = type('StandIn', (object,), {'get_bot': lambda self: 'bot'})()
+    clients.register_client('lex-models', stand_in)
+
+    assert lazy.get_bot() == 'bot'
+
+
+def test_builders_do_not_create_clients():
+    from bot_builder import LexBotBuilder  # pylint: disable=import-error,import-outside-toplevel
+
+    LexBotBuilder(None, None)
+
+    assert clients._CLIENTS == {}  # pylint: disable=protected-access
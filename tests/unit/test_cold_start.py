@@ -0,0 +1,28 @@
+""" cold start benchmark tests
+
+They start new interpreters, so they only run with COLD_START_TESTS set:
+
+    COLD_START_TESTS=1 PYTHONPATH=.:src pytest tests/unit/test_cold_start.py
+"""
+# pylint: disable=missing-function-docstring
+import os
+
+import pytest
+
+# pylint: disable=import-error
+from tests import cold_start
+# pylint: enable=import-error
+
+pytestmark = pytest.mark.skipif(not os.environ.get('COLD_START_TESTS'),
+                                reason='starts new interpreters, set COLD_START_TESTS to run')
+
+
+def test_heavy_modules_are_not_imported_with_app():
+    result = cold_start.run(runs=1)['results']
+
+    assert result['import_seconds']['median'] > 0
+    assert result['first_client_seconds']['max'] > 0
+    assert result['first_call_seconds']['max'] > 0
+    assert result['heavy_modules_at_import'] == {'boto3': False, 'botocore': False,
+                                                 'requests': False, 'asyncio': False,
+                                                 'sqlite3': False}
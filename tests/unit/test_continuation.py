@@ -0,0 +1,185 @@
+""" continuation tests """
+# pylint: disable=missing-function-docstring, redefined-outer-name
+import os
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+# pylint: disable=import-error
+import app
+import aws_helper
+import clients
+import continuation
+import lex_helper
+import state_store
+from tests import benchmark
+from tests.fake_lex import FakeLambda, FakeLex, FakeSts
+from utils import ContinuationRequired, ProvisioningError
+# pylint: enable=import-error
+
+
+class ShortContext(object):
+    """ lambda context where every Lex call takes a second """
+
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:lex-provisioner'
+    log_stream_name = 'test'
+    aws_request_id = 'test'
+
+    def __init__(self, lex, seconds=80):
+        self._lex = lex
+        self._ends = seconds + sum(lex.calls.values())
+
+    def get_remaining_time_in_millis(self):
+        return (self._ends - sum(self._lex.calls.values())) * 1000
+
+
+@pytest.fixture()
+def lex(monkeypatch):
+    lex = FakeLex()
+    for service_name, backend in (('lex-models', lex), ('lambda', FakeLambda()),
+                                  ('sts', FakeSts())):
+        clients.register_client(service_name, backend)
+    monkeypatch.setitem(os.environ, 'AWS_REGION', 'us-east-1')
+    yield lex
+    clients.clear_clients()
+    continuation.register_invoker(None)
+    lex_helper.clear_aws_details()
+    state_store.clear_stores()
+
+
+def test_required():
+    assert continuation.required(ContinuationRequired('out of time'))
+    assert continuation.required(ProvisioningError('failed', {'a': ContinuationRequired()}))
+    assert not continuation.required(ProvisioningError('failed', {'a': ContinuationRequired(),
+                                                                  'b': ValueError()}))
+    assert not continuation.required(ValueError())
+
+
+def test_continue_request_stops_after_max_invocations():
+    invoker = continuation.LocalInvoker(Mock())
+    continuation.register_invoker(invoker)
+    event = {continuation.TOKEN_KEY: {'invocation': continuation.MAX_INVOCATIONS}}
+
+    try:
+        assert not continuation.continue_request(event, None, ContinuationRequired(), Mock())
+        assert continuation.continue_request({}, None, ContinuationRequired(), Mock())
+    finally:
+        continuation.register_invoker(None)
+    assert invoker.events == [{continuation.TOKEN_KEY: {'invocation': 2}}]
+
+
+def test_lambda_invoke_is_retried_when_throttled(lex):
+    fake_lambda = FakeLambda()
+    fake_lambda.faults.fail('invoke', 'TooManyRequestsException')
+    clients.register_client('lambda', fake_lambda)
+
+    continuation.LambdaInvoker(sleep=lambda _: None).invoke({'RequestId': 'request'}, ShortContext(lex))
+
+    assert fake_lambda.calls['invoke'] == 2
+    assert fake_lambda.invocations == [(ShortContext.invoked_function_arn,
+                                        {'RequestId': 'request'})]
+
+
+class FailingInvoker(continuation.LocalInvoker):
+    def invoke(self, event, context):
+        raise RuntimeError('Rate exceeded')
+
+
+def test_failed_invoke_is_not_a_continuation():
+    continuation.register_invoker(FailingInvoker(Mock()))
+    try:
+        assert not continuation.continue_request({}, None, ContinuationRequired(), Mock())
+    finally:
+        continuation.register_invoker(None)
+
+
+def test_failed_invoke_responds_failed(lex, tmpdir, monkeypatch):
+    responses = []
+    monkeypatch.setattr(aws_helper, 'send_cfn_confirmation',
+                        lambda event, context, status, data, *args, **kwargs:
+                        responses.append(status))
+    continuation.register_invoker(FailingInvoker(app.lambda_handler))
+    event = benchmark.synthetic_event(
+        intents=12, slot_types=2, metrics='false',
+        checkpointStore='file://' + str(tmpdir.join('checkpoints.json')),
+        continueBelowSeconds='60')
+
+    with pytest.raises(Exception):
+        app.lambda_handler(event, ShortContext(lex))
+
+    assert responses == ['FAILED']
+
+
+def test_request_continues_until_done(lex, tmpdir, monkeypatch):
+    responses = []
+    monkeypatch.setattr(aws_helper, 'send_cfn_confirmation',
+                        lambda event, context, status, data, *args, **kwargs:
+                        responses.append((status, data)))
+    invoker = continuation.LocalInvoker(app.lambda_handler)
+    continuation.register_invoker(invoker)
+    event = benchmark.synthetic_event(
+        intents=12, slot_types=2, metrics='false',
+        checkpointStore='file://' + str(tmpdir.join('checkpoints.json')),
+        continueBelowSeconds='60')
+
+    app.lambda_handler(event, ShortContext(lex))
+    assert responses == []
+    assert len(invoker.events) == 1
+
+    invocations = invoker.run(lambda: ShortContext(lex))
+
+    assert invocations >= 2
+    assert [status for status, _ in responses] == ['SUCCESS']
+    assert responses[0][1]['BotVersion'] == '1'
+    assert lex.calls['put_bot'] == 1
+    assert len(lex.definition('bot', benchmark.PREFIX + 'LexBot')['intents']) == 12
+
+
+def test_failed_request_forgets_its_checkpoint(lex, tmpdir, monkeypatch):
+    responses = []
+    monkeypatch.setattr(aws_helper, 'send_cfn_confirmation',
+                        lambda event, context, status, data, *args, **kwargs:
+                        responses.append(status))
+    lex.fail('put_bot', 'BadRequestException')
+    checkpoints = tmpdir.join('checkpoints.json')
+    event = benchmark.synthetic_event(intents=4, slot_types=2, metrics='false',
+                                      checkpointStore='file://' + str(checkpoints))
+
+    with pytest.raises(ClientError):
+        app.lambda_handler(event, ShortContext(lex, 300))
+
+    assert responses == ['FAILED']
+    assert lex.definition('intent', 'intent0') is not None
+    assert 'intent#' not in checkpoints.read()
+    assert 'slot_type#' not in checkpoints.read()
+
+
+def test_delete_continues_until_done(lex, tmpdir, monkeypatch):
+    responses = []
+    monkeypatch.setattr(aws_helper, 'send_cfn_confirmation',
+                        lambda event, context, status, data, *args, **kwargs:
+                        responses.append(status))
+    app.create(benchmark.synthetic_event(intents=12, slot_types=2), ShortContext(lex, 300))
+    intents = ['intent{0}'.format(index) for index in range(12)]
+    slot_types = [benchmark.PREFIX + 'type{0}'.format(index) for index in range(2)]
+    assert all(lex.definition('intent', name) is not None for name in intents)
+    assert all(lex.definition('slot_type', name) is not None for name in slot_types)
+    invoker = continuation.LocalInvoker(app.lambda_handler)
+    continuation.register_invoker(invoker)
+    event = benchmark.synthetic_event(
+        'Delete', intents=12, slot_types=2, metrics='false',
+        checkpointStore='file://' + str(tmpdir.join('checkpoints.json')),
+        continueBelowSeconds='70')
+
+    app.lambda_handler(event, ShortContext(lex))
+    assert responses == []
+    assert len(invoker.events) == 1
+
+    invoker.run(lambda: ShortContext(lex))
+
+    assert responses == ['SUCCESS']
+    assert lex.definition('bot', benchmark.PREFIX + 'LexBot') is None
+    assert [name for name in intents if lex.definition('intent', name) is not None] == []
+    assert [name for name in slot_types
+            if lex.definition('slot_type', name) is not None] == []
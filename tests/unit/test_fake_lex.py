@@ -0,0 +1,256 @@
+""" in-memory lex backend tests """
+# pylint: disable=missing-function-docstring
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+# pylint: disable=import-error
+import bot_builder
+import checkpoint
+import lex_helper
+import state_store
+from bot_builder import LexBotBuilder
+from intent_builder import IntentBuilder
+from models.bot import Bot
+from models.intent import Intent
+from models.slot import Slot
+from models.slot_type import SlotType
+from slot_builder import SlotBuilder
+from tests.fake_lex import FakeLambda, FakeLex, INTENT, SLOT_TYPE
+from utils import ProvisioningError
+# pylint: enable=import-error
+
+LAMBDA_ARN = 'arn:aws:lambda:us-east-1:123456789123:function:GreetingLambda'
+MESSAGES = {'clarification': 'clarification statement', 'abortStatement': 'abort statement'}
+
+
+@pytest.fixture(autouse=True)
+def aws_details():
+    lex_helper.cache_aws_details(LAMBDA_ARN)
+    yield
+    lex_helper.clear_aws_details()
+
+
+def error_code(excinfo):
+    return excinfo.value.response['Error']['Code']
+
+
+def bot(intent_names=('greeting', 'farewell')):
+    intents = [Intent('bot', name, LAMBDA_ARN, ['hello {size}'],
+                      [Slot('size', 'pizzasize', 'what size?', ['hello {size}'])],
+                      max_attempts=3, plaintext={'confirmation': 'ok', 'rejection': 'no'})
+               for name in intent_names]
+    return Bot('bot', intents, MESSAGES, locale='en-US', description='a bot')
+
+
+def builder(lex, lambda_sdk=None):
+    logger = Mock()
+    intent_builder = IntentBuilder(logger, None, lex_sdk=lex,
+                                   lambda_sdk=lambda_sdk or FakeLambda())
+    return LexBotBuilder(logger, None, lex_sdk=lex, intent_builder=intent_builder,
+                         slot_builder=SlotBuilder(logger, None, lex_sdk=lex), max_workers=2)
+
+
+def test_put_requires_matching_checksum():
+    lex = FakeLex()
+    created = lex.put_slot_type(name='size', enumerationValues=[])
+
+    with pytest.raises(ClientError) as excinfo:
+        lex.put_slot_type(name='size', enumerationValues=[])
+    assert error_code(excinfo) == 'PreconditionFailedException'
+
+    updated = lex.put_slot_type(name='size', enumerationValues=[], checksum=created['checksum'])
+    assert updated['checksum'] != created['checksum']
+
+
+def test_get_missing_resource_is_not_found():
+    with pytest.raises(ClientError) as excinfo:
+        FakeLex().get_intent(name='greeting', version='$LATEST')
+
+    assert error_code(excinfo) == 'NotFoundException'
+    assert excinfo.value.response['ResponseMetadata']['HTTPStatusCode'] == 404
+
+
+def test_create_version_only_when_latest_changed():
+    lex = FakeLex()
+    put = lex.put_intent(name='greeting', sampleUtterances=['hi'])
+
+    assert lex.create_intent_version(name='greeting', checksum=put['checksum'])['version'] == '1'
+    assert lex.create_intent_version(name='greeting')['version'] == '1'
+
+    lex.put_intent(name='greeting', sampleUtterances=['hello'], checksum=put['checksum'])
+    assert lex.create_intent_version(name='greeting')['version'] == '2'
+    assert [intent['version'] for intent in
+            lex.get_intent_versions(name='greeting')['intents']] == ['1', '2', '$LATEST']
+
+
+def test_delete_in_use_slot_type():
+    lex = FakeLex()
+    lex.put_slot_type(name='size')
+    lex.put_intent(name='order', slots=[{'name': 'size', 'slotType': 'size'}])
+
+    with pytest.raises(ClientError) as excinfo:
+        lex.delete_slot_type(name='size')
+    assert error_code(excinfo) == 'ResourceInUseException'
+
+
+def test_injected_failures_are_retried():
+    lex = FakeLex()
+    lex.fail('put_slot_type', 'ThrottlingException', times=2)
+    slot_builder = SlotBuilder(Mock(), None, lex_sdk=lex)
+    slot_builder._retry_policy()._sleep = lambda delay: None  # pylint: disable=protected-access
+
+    slot_builder.put_slot_type(SlotType('size', {'thick': ['fat']}))
+
+    assert lex.calls['put_slot_type'] == 3
+    assert lex.definition(SLOT_TYPE, 'size') is not None
+
+
+def test_latency_per_operation():
+    sleeps = []
+    lex = FakeLex(latency={'get_bot': 0.5}, sleep=sleeps.append)
+    lex.put_bot(name='bot', intents=[])
+    lex.get_bot(name='bot', versionOrAlias='$LATEST')
+
+    assert sleeps == [0.5]
+
+
+def test_builders_provision_and_delete_end_to_end():
+    lex = FakeLex()
+    lambda_sdk = FakeLambda()
+    slot_types = [SlotType('pizzasize', {'thick': ['fat'], 'thin': ['light']})]
+
+    response = builder(lex, lambda_sdk).put(bot(), slot_types=slot_types)
+
+    assert response['version'] == '1'
+    assert lex.definition(INTENT, 'greeting', '1') is not None
+    assert len(lambda_sdk.policies[LAMBDA_ARN]) == 2
+
+    lex.calls.clear()
+    builder(lex, lambda_sdk).put(bot(), slot_types=slot_types)
+    assert lex.calls['put_intent'] == 0
+    assert lex.calls['put_slot_type'] == 0
+
+    builder(lex, lambda_sdk).delete(bot(), slot_types=slot_types)
+    assert lex.definition(INTENT, 'greeting') is None
+    assert lex.definition(SLOT_TYPE, 'pizzasize') is None
+
+
+def test_unversioned_latest_intent_is_versioned_on_the_next_put():
+    lex = FakeLex()
+    builder(lex).put(bot(), slot_types=[SlotType('pizzasize', {'thick': ['fat']})])
+    intent_builder = builder(lex)._intent_builder  # pylint: disable=protected-access
+    changed = Intent('bot', 'greeting', LAMBDA_ARN, ['hi {size}'],
+                     [Slot('size', 'pizzasize', 'what size?', ['hi {size}'])],
+                     max_attempts=3, plaintext={'confirmation': 'ok', 'rejection': 'no'})
+    # an earlier put of the change whose create_intent_version failed
+    lex.put_intent(checksum=lex.definition(INTENT, 'greeting')['checksum'],
+                   **intent_builder.put_intent_request(changed))
+    lex.calls.clear()
+
+    response = intent_builder.put_intent(changed)
+
+    assert lex.calls['put_intent'] == 0
+    assert response['intentVersion'] == '2'
+    assert lex.definition(INTENT, 'greeting', '2')['sampleUtterances'] == ['hi {size}']
+
+
+def test_current_version_of_unchanged_intent():
+    lex = FakeLex()
+    builder(lex).put(bot(), slot_types=[SlotType('pizzasize', {'thick': ['fat']})])
+    intent_builder = builder(lex)._intent_builder  # pylint: disable=protected-access
+    greeting = lex.definition(INTENT, 'greeting')
+    # put by an earlier update whose create_intent_version failed
+    lex.put_intent(**dict(greeting, description='newer'))
+
+    farewell, = bot(['farewell']).intents
+    assert intent_builder.current_version(farewell)['intentVersion'] == '1'
+    greeting_intent, = bot(['greeting']).intents
+    assert intent_builder.current_version(greeting_intent)['intentVersion'] == '2'
+    assert lex.calls['get_intent_versions'] == 0
+
+
+def test_delete_retries_intents_while_bot_is_deleted():
+    lex = FakeLex(deleting_checks=3)
+    slot_types = [SlotType('pizzasize', {'thick': ['fat']})]
+    builder(lex).put(bot(), slot_types=slot_types)
+
+    bot_builder = builder(lex)
+    sleeps = []
+    # pylint: disable=protected-access
+    bot_builder._intent_builder._retry_policy()._sleep = sleeps.append
+    bot_builder.delete(bot())
+
+    assert lex.definition(INTENT, 'greeting') is None
+    assert lex.definition(INTENT, 'farewell') is None
+    assert lex.calls['delete_bot'] == 1
+    assert lex.calls['delete_intent'] == 2 + 3
+    assert len(sleeps) == 3
+
+
+def test_failed_deletes_are_raised_and_not_checkpointed(tmpdir):
+    lex = FakeLex(deleting_checks=20)
+    builder(lex).put(bot(), slot_types=[SlotType('pizzasize', {'thick': ['fat']})])
+    progress = checkpoint.Checkpoint(
+        state_store.from_uri('file://' + str(tmpdir.join('checkpoints.json'))),
+        'stack#bot#request', {})
+    logger = Mock()
+    intent_builder = IntentBuilder(logger, None, lex_sdk=lex, lambda_sdk=FakeLambda(),
+                                   checkpoint=progress)
+    # pylint: disable=protected-access
+    intent_builder._retry_policy()._sleep = lambda _: None
+    bot_builder = LexBotBuilder(logger, None, lex_sdk=lex, intent_builder=intent_builder,
+                                checkpoint=progress)
+
+    with pytest.raises(ProvisioningError):
+        bot_builder.delete(bot())
+
+    # the deleted bot still uses the intents after every attempt
+    assert lex.definition(INTENT, 'greeting') is not None
+    assert progress.completed(INTENT, 'greeting') is None
+    assert progress.completed('bot', 'bot') is not None
+
+
+def test_alias_switched_after_build():
+    lex = FakeLex()
+    slot_types = [SlotType('pizzasize', {'thick': ['fat']})]
+
+    def alias_builder():
+        logger = Mock()
+        intent_builder = IntentBuilder(logger, None, lex_sdk=lex, lambda_sdk=FakeLambda())
+        return LexBotBuilder(logger, None, lex_sdk=lex, intent_builder=intent_builder,
+                             slot_builder=SlotBuilder(logger, None, lex_sdk=lex),
+                             wait_for_build=False, alias='live')
+
+    first = alias_builder().put(bot(), slot_types=slot_types)
+    second = alias_builder().put(bot(), slot_types=slot_types)
+
+    assert (first['alias'], first['previousVersion']) == ('live', None)
+    assert (second['version'], second['previousVersion']) == ('2', '1')
+    assert lex.get_bot_alias(name='live', botName='bot')['botVersion'] == '2'
+
+    alias_builder().delete(bot(), slot_types=slot_types)
+    assert lex.definition('bot', 'bot') is None
+    assert lex.get_bot_aliases(botName='bot')['BotAliases'] == []
+
+
+def test_alias_waits_for_the_new_version(monkeypatch):
+    monkeypatch.setattr(bot_builder.time, 'sleep', lambda _: None)
+    lex = FakeLex(version_build_checks=2)
+    statuses = []
+    put_bot_alias = lex.put_bot_alias
+
+    def recording_put_bot_alias(**request):
+        statuses.append(lex.definition('bot', request['botName'], request['botVersion'])['status'])
+        return put_bot_alias(**request)
+
+    lex.put_bot_alias = recording_put_bot_alias
+    logger = Mock()
+    intent_builder = IntentBuilder(logger, None, lex_sdk=lex, lambda_sdk=FakeLambda())
+    LexBotBuilder(logger, None, lex_sdk=lex, intent_builder=intent_builder,
+                  slot_builder=SlotBuilder(logger, None, lex_sdk=lex),
+                  alias='live').put(bot(), slot_types=[SlotType('pizzasize', {'thick': ['fat']})])
+
+    assert statuses == ['READY']
+    assert lex.get_bot_alias(name='live', botName='bot')['botVersion'] == '1'
@@ -0,0 +1,160 @@
+""" coordinator and worker fan-out tests """
+# pylint: disable=missing-function-docstring, redefined-outer-name
+import os
+import time
+
+import pytest
+
+# pylint: disable=import-error
+import app
+import aws_helper
+import clients
+import continuation
+import fanout
+import lex_helper
+import state_store
+from tests import benchmark
+from tests.fake_lex import FakeLambda, FakeLex, FakeSts
+from tests.unit.test_continuation import ShortContext
+from utils import ProvisioningError
+# pylint: enable=import-error
+
+
+class WorkerContext(benchmark.BenchmarkContext):
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:lex-provisioner'
+
+
+@pytest.fixture()
+def lex(monkeypatch):
+    lex = FakeLex()
+    for service_name, backend in (('lex-models', lex), ('lambda', FakeLambda()),
+                                  ('sts', FakeSts())):
+        clients.register_client(service_name, backend)
+    monkeypatch.setitem(os.environ, 'AWS_REGION', 'us-east-1')
+    fanout.register_invoker(fanout.LocalWorkerInvoker(app.lambda_handler, WorkerContext))
+    yield lex
+    fanout.register_invoker(None)
+    continuation.register_invoker(None)
+    clients.clear_clients()
+    lex_helper.clear_aws_details()
+    state_store.clear_stores()
+
+
+def test_shard():
+    assert fanout.shard(['a', 'b', 'c', 'd', 'e'], 2) == [['a', 'c', 'e'], ['b', 'd']]
+    assert fanout.shard(['a'], 4) == [['a']]
+
+
+def test_worker_event_has_no_response_url():
+    event = fanout.worker_event({'ResponseURL': 'https://cfn', 'StackId': 'stack'}, 1, ['a'])
+
+    assert event == {'StackId': 'stack',
+                     fanout.WORKER_KEY: {'shard': 1, 'intents': ['a'], 'changedIntents': None,
+                                         'deadline': None}}
+
+
+class RecordingInvoker(fanout.LocalWorkerInvoker):
+    def __init__(self):
+        super().__init__(app.lambda_handler, WorkerContext)
+        self.invokes = []
+
+    def invoke(self, payload, context, timeout=None):
+        self.invokes.append((payload[fanout.WORKER_KEY]['deadline'], timeout))
+        return super().invoke(payload, context, timeout)
+
+
+def test_workers_have_the_time_of_the_coordinator(lex):
+    invoker = RecordingInvoker()
+    fanout.register_invoker(invoker)
+    event = benchmark.synthetic_event(intents=4, workers='2', metrics='false')
+
+    app.create(event, WorkerContext(timeout_seconds=100))
+
+    assert len(invoker.invokes) == 2
+    for deadline, timeout in invoker.invokes:
+        assert deadline < time.time() + 100 - fanout.WORKER_RETURN_SECONDS
+        assert 0 < timeout <= 100
+
+
+def test_worker_context_ends_with_the_coordinator():
+    event = {fanout.WORKER_KEY: {'deadline': time.time() + 10}}
+
+    context = fanout.worker_context(event, WorkerContext())
+
+    assert 9000 < context.get_remaining_time_in_millis() <= 10000
+    assert context.invoked_function_arn == WorkerContext.invoked_function_arn
+    assert fanout.worker_context({fanout.WORKER_KEY: {}}, WorkerContext()) \
+        .get_remaining_time_in_millis() > 10000
+
+
+def test_create_fans_out_intents(lex):
+    event = benchmark.synthetic_event(intents=7, workers='3', metrics='false')
+
+    response = app.create(event, WorkerContext())
+
+    assert response['Workers'] == '3'
+    assert len(response['WorkerSeconds'].split(',')) == 3
+    assert lex.calls['put_intent'] == 7
+    assert lex.calls['put_bot'] == 1
+    bot = lex.definition('bot', benchmark.PREFIX + 'LexBot', '1')
+    assert [intent['intentName'] for intent in bot['intents']] == \
+        [intent['Name'] for intent in event['ResourceProperties']['intents']]
+
+
+def test_update_only_sends_changed_intents(lex):
+    event = benchmark.synthetic_event(intents=4, workers='2', metrics='false')
+    app.create(event, WorkerContext())
+    lex.calls.clear()
+
+    app.update(benchmark.update_event(event, changed_fraction=0.25), WorkerContext())
+
+    assert lex.calls['put_intent'] == 1
+
+
+def test_permissions_are_added_once_by_the_coordinator(lex):
+    aws_lambda = FakeLambda(faults=lex.faults)
+    clients.register_client('lambda', aws_lambda)
+    event = benchmark.synthetic_event(intents=4, workers='2', metrics='false')
+
+    app.create(event, WorkerContext())
+
+    assert lex.calls['get_policy'] == 1
+    assert lex.calls['add_permission'] == 4
+    assert len(aws_lambda.policies[benchmark.LAMBDA_ARN]) == 4
+
+
+def test_worker_failure_fails_the_request(lex):
+    lex.fail('put_intent', 'BadRequestException')
+    event = benchmark.synthetic_event(intents=4, workers='2', metrics='false')
+
+    with pytest.raises(ProvisioningError) as excinfo:
+        app.create(event, WorkerContext())
+    assert 'shard' in str(excinfo.value)
+    assert lex.calls['put_bot'] == 0
+
+
+def test_workers_out_of_time_continue_the_request(lex, tmpdir, monkeypatch):
+    responses = []
+    monkeypatch.setattr(aws_helper, 'send_cfn_confirmation',
+                        lambda event, context, status, data, *args, **kwargs:
+                        responses.append((status, data)))
+    fanout.register_invoker(fanout.LocalWorkerInvoker(app.lambda_handler,
+                                                      lambda: ShortContext(lex)))
+    invoker = continuation.LocalInvoker(app.lambda_handler)
+    continuation.register_invoker(invoker)
+    event = benchmark.synthetic_event(
+        intents=12, workers='2', metrics='false',
+        checkpointStore='file://' + str(tmpdir.join('checkpoints.json')),
+        continueBelowSeconds='70')
+
+    app.lambda_handler(event, WorkerContext())
+    assert responses == []
+    assert len(invoker.events) == 1
+
+    invoker.run(WorkerContext)
+
+    assert [status for status, _ in responses] == ['SUCCESS']
+    assert lex.calls['put_bot'] == 1
+    assert len(lex.definition('bot', benchmark.PREFIX + 'LexBot')['intents']) == 12
+    # the coordinator forgets the intents the workers checkpointed
+    assert 'intent#' not in tmpdir.join('checkpoints.json').read()
@@ -0,0 +1,49 @@
+""" fingerprint tests """
+# pylint: disable=missing-function-docstring
+# pylint: disable=import-error
+import fingerprint
+# pylint: enable=import-error
+
+REQUEST = {
+    'name': 'greeting',
+    'sampleUtterances': ['hello', 'hi'],
+    'dialogCodeHook': {'uri': 'arn:codehook', 'messageVersion': '1.0'},
+    'slots': [],
+}
+
+
+def test_fingerprint_ignores_key_order_and_checksum():
+    reordered = dict(reversed(list(REQUEST.items())), checksum='abc')
+
+    assert fingerprint.fingerprint(reordered) == fingerprint.fingerprint(REQUEST)
+
+
+def test_unchanged_ignores_extra_response_fields():
+    response = dict(REQUEST, checksum='abc', version='$LATEST', createdDate=1,
+                    dialogCodeHook={'uri': 'arn:codehook', 'messageVersion': '1.0'})
+    del response['slots']
+
+    assert fingerprint.unchanged(REQUEST, response)
+
+
+def test_changed_utterance():
+    response = dict(REQUEST, sampleUtterances=['hello'])
+
+    assert not fingerprint.unchanged(REQUEST, response)
+
+
+def test_missing_resource_is_changed():
+    assert not fingerprint.unchanged(REQUEST, None)
+
+
+def test_slot_type_values_are_unordered():
+    request = {'name': 'size', 'enumerationValues': [
+        {'value': 'thin', 'synonyms': ['light', 'thin']},
+        {'value': 'thick', 'synonyms': ['fat']}]}
+    response = {'name': 'size', 'checksum': 'abc', 'enumerationValues': [
+        {'value': 'thick', 'synonyms': ['fat']},
+        {'value': 'thin', 'synonyms': ['thin', 'light']}]}
+
+    assert fingerprint.unchanged(request, response,
+                                 normalize=fingerprint.normalize_slot_type)
+    assert not fingerprint.unchanged(request, response)
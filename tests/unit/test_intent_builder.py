@@ -3,6 +3,7 @@ import pytest
 from pytest_mock import mocker
 from unittest.mock import Mock
 import botocore.session
+from botocore.exceptions import ClientError
 from botocore.stub import Stubber, ANY
 # import datetime
 
@@ -11,6 +12,7 @@ from intent_builder import IntentBuilder
 from lex_helper import LexHelper
 from models.intent import Intent
 from models.slot import Slot
+from tests.fake_lex import FakeLambda
 
 aws_region = 'us-east-1'
 aws_account_id = '1234567789'
@@ -639,18 +641,96 @@ def test_delete_intent(lex, mock_context, aws_lambda):
 
 
 def test_delete_deleted_intent(lex, mock_context, aws_lambda):
-    delete_intent_response, delete_request_1 = {}, {'name': INTENT_NAME}
-    delete_intent_response, delete_request_2 = {}, {'name': INTENT_NAME_2}
-
     intent_builder = IntentBuilder(Mock(), mock_context, lex_sdk=lex,
                                    lambda_sdk=aws_lambda)
 
     with Stubber(lex) as stubber:
         stub_not_found_get_request(stubber)
-        stub_intent_deletion(stubber, delete_intent_response, delete_request_1)
         stub_not_found_get_request(stubber)
-        stub_intent_deletion(stubber, delete_intent_response, delete_request_2)
 
         intent_builder.delete_intents([INTENT_NAME, INTENT_NAME_2])
 
         stubber.assert_no_pending_responses()
+
+
+def test_update_unchanged_intent_reuses_version(codehook_uri, mock_context, lex,
+                                                aws_lambda, monkeypatch_account):
+    """ an unchanged intent is not put, $LATEST is versioned with its checksum """
+
+    with Stubber(aws_lambda) as lambda_stubber, Stubber(lex) as stubber:
+        stub_lambda_request(lambda_stubber, codehook_uri)
+        intent_builder = IntentBuilder(Mock(), mock_context, lex_sdk=lex,
+                                       lambda_sdk=aws_lambda)
+        plaintext = {
+            "confirmation": 'some confirmation message',
+            'rejection': 'rejection message',
+            'conclusion': 'concluded'
+        }
+        intent = Intent(BOT_NAME, INTENT_NAME, codehook_uri, UTTERANCES,
+                        None, plaintext=plaintext, max_attempts=3)
+
+        get_response = intent_builder.put_intent_request(intent)
+        get_response.update({'checksum': 'chksum', 'version': '$LATEST'})
+        stubber.add_response('get_intent', get_response,
+                             {'name': INTENT_NAME, 'version': '$LATEST'})
+        stubber.add_response('create_intent_version',
+                             {'name': INTENT_NAME, 'version': '10', 'checksum': 'chksum'},
+                             {'name': INTENT_NAME, 'checksum': 'chksum'})
+
+        response = intent_builder.put_intent(intent)
+
+        stubber.assert_no_pending_responses()
+        assert response == {'intentName': INTENT_NAME, 'intentVersion': '10'}
+
+
+def codehook_intents(*names_and_arns):
+    return [Intent(BOT_NAME, name, arn, UTTERANCES, [], max_attempts=3,
+                   plaintext={'confirmation': 'ok', 'rejection': 'no'})
+            for name, arn in names_and_arns]
+
+
+def test_reconcile_permissions_reads_each_policy_once(monkeypatch_account):
+    first = 'arn:aws:lambda:us-east-1:1234567789:function:first'
+    second = 'arn:aws:lambda:us-east-1:1234567789:function:second'
+    aws_lambda = FakeLambda()
+    aws_lambda.add_permission(FunctionName=first, StatementId='lex-us-east-1-greeting')
+    aws_lambda.calls.clear()
+    intent_builder = IntentBuilder(Mock(), None, lex_sdk=Mock(), lambda_sdk=aws_lambda)
+
+    intent_builder.reconcile_permissions(codehook_intents(('greeting', first),
+                                                          ('farewell', first),
+                                                          ('help', second)),
+                                         max_workers=2)
+
+    assert aws_lambda.calls['get_policy'] == 2
+    assert aws_lambda.calls['add_permission'] == 2
+    assert set(aws_lambda.policies[first]) == {'lex-us-east-1-greeting',
+                                               'lex-us-east-1-farewell'}
+    assert set(aws_lambda.policies[second]) == {'lex-us-east-1-help'}
+
+
+def test_reconciled_permission_is_not_added_again(monkeypatch_account):
+    arn = 'arn:aws:lambda:us-east-1:1234567789:function:first'
+    aws_lambda = FakeLambda()
+    intent_builder = IntentBuilder(Mock(), None, lex_sdk=Mock(), lambda_sdk=aws_lambda)
+    intent, = codehook_intents(('greeting', arn))
+
+    intent_builder.reconcile_permissions([intent])
+    intent_builder._add_permission_to_lex_to_codehook(intent)
+
+    assert aws_lambda.calls['add_permission'] == 1
+
+
+def test_conflict_without_the_statement_is_raised(monkeypatch_account):
+    arn = 'arn:aws:lambda:us-east-1:1234567789:function:first'
+    aws_lambda = FakeLambda()
+    aws_lambda.faults.fail('add_permission', 'ResourceConflictException')
+    intent_builder = IntentBuilder(Mock(), None, lex_sdk=Mock(), lambda_sdk=aws_lambda)
+    intent, = codehook_intents(('greeting', arn))
+
+    with pytest.raises(ClientError):
+        intent_builder._add_permission_to_lex_to_codehook(intent)
+    intent_builder._add_permission_to_lex_to_codehook(intent)
+
+    assert aws_lambda.calls['add_permission'] == 2
+    assert set(aws_lambda.policies[arn]) == {'lex-us-east-1-greeting'}
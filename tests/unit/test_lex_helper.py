@@ -1,28 +1,43 @@
-import boto3
+import os
+import threading
+
 import mock
-# import pytest
+import pytest
 # from pytest_mock import mocker
-# import os
 
 # import botocore.session
 # from botocore.stub import Stubber, ANY
+from botocore.exceptions import ClientError
+
+import clients
+import lex_helper
 from lex_helper import LexHelper
+from retry import RetryPolicy
 
 account_id = '123456789012'
 aws_region = 'us-east-1'
 
 
 class StubLexHelper(LexHelper, object):
-    def __init__(self, mocker):
+    def __init__(self, mocker, context=None):
         self._logger = mocker.Mock
+        self._context = context
+
+
+@pytest.fixture(autouse=True)
+def clear_aws_details():
+    lex_helper.clear_aws_details()
+    yield
+    lex_helper.clear_aws_details()
 
 
 def monkeypatch_account(mocker, monkeypatch):
     arn_mock = mock.Mock()
 
     arn = "arn:aws:lambda:us-east-1:123456789012:function:elliott-helloworld"
-    monkeypatch.setattr(boto3, 'client', lambda x: arn_mock)
+    monkeypatch.setattr(clients, 'get_client', lambda x: arn_mock)
     arn_mock.get_caller_identity.return_value = {'Arn': arn}
+    return arn_mock
 
 
 def test_create_get_aws_details(mocker, monkeypatch):
@@ -35,3 +50,74 @@ def test_create_get_aws_details(mocker, monkeypatch):
 
         assert account == account_id
         assert region == aws_region
+
+
+def test_get_aws_details_cached(mocker, monkeypatch):
+    values = {'AWS_REGION': aws_region}
+    with mock.patch.dict('os.environ', values):
+        sts = monkeypatch_account(mocker, monkeypatch)
+
+        StubLexHelper(mocker)._get_aws_details()
+        account, region = StubLexHelper(mocker)._get_aws_details()
+
+        assert account == account_id
+        assert region == aws_region
+        assert sts.get_caller_identity.call_count == 1
+
+
+def test_get_aws_details_from_context(mocker, monkeypatch):
+    values = {'AWS_REGION': aws_region}
+    with mock.patch.dict('os.environ', values):
+        sts = monkeypatch_account(mocker, monkeypatch)
+        context = mocker.Mock()
+        context.invoked_function_arn = 'arn:aws:lambda:us-east-1:210987654321:function:provisioner'
+
+        account, region = StubLexHelper(mocker, context)._get_aws_details()
+
+        assert account == '210987654321'
+        assert region == aws_region
+        sts.get_caller_identity.assert_not_called()
+
+
+def test_cache_aws_details_ignores_invalid_arn():
+    assert not lex_helper.cache_aws_details(None)
+    assert not lex_helper.cache_aws_details('not an arn')
+    assert lex_helper.cache_aws_details(
+        'arn:aws:lambda:us-east-1:123456789012:function:provisioner')
+
+
+def test_delete_lex_resource_stops_retrying(mocker):
+    in_use = ClientError({'Error': {'Code': 'ResourceInUseException', 'Message': 'in use'}},
+                         'delete_intent')
+    delete = mock.Mock(side_effect=in_use)
+    helper = StubLexHelper(mocker)
+    helper._logger = mock.Mock()
+    helper._retry = RetryPolicy(helper._logger, sleep=lambda _: None)
+
+    with pytest.raises(ClientError):
+        helper._delete_lex_resource(delete, 'delete_intent', name='greeting')
+
+    assert delete.call_count == LexHelper.MAX_DELETE_TRIES
+
+
+def test_get_aws_details_survives_concurrent_clears(mocker):
+    context = mocker.Mock()
+    context.invoked_function_arn = 'arn:aws:lambda:us-east-1:210987654321:function:provisioner'
+    helper = StubLexHelper(mocker, context)
+    results = []
+    stop = threading.Event()
+
+    def clear():
+        while not stop.is_set():
+            lex_helper.clear_aws_details()
+
+    clearer = threading.Thread(target=clear)
+    clearer.start()
+    try:
+        for _ in range(2000):
+            results.append(helper._get_aws_details())
+    finally:
+        stop.set()
+        clearer.join()
+
+    assert set(results) == {('210987654321', os.environ.get('AWS_REGION', 'us-east-1'))}
@@ -0,0 +1,164 @@
+""" lex call metrics tests """
+# pylint: disable=missing-function-docstring
+import io
+import json
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+# pylint: disable=import-error
+from metrics import MetricsRecorder, payload_size, resource_type, response_size
+from retry import RetryPolicy, RetryStats
+# pylint: enable=import-error
+
+
+def recorder(enabled=True):
+    stream = io.StringIO()
+    return MetricsRecorder(stream=stream, enabled=enabled), stream
+
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.mark.parametrize('operation,expected', [
+    ('put_intent', 'intent'),
+    ('create_intent_version', 'intent'),
+    ('get_bot_versions', 'bot'),
+    ('put_bot_alias', 'bot'),
+    ('delete_slot_type', 'slot_type'),
+    ('add_permission', 'permission'),
+])
+def test_resource_type(operation, expected):
+    assert resource_type(operation) == expected
+
+
+def test_payload_size():
+    assert payload_size(None) == 0
+    assert payload_size({'name': 'greeting'}) == len('{"name": "greeting"}')
+
+
+def test_record_writes_emf_line():
+    metrics, stream = recorder()
+
+    metrics.record('put_intent', 12.34, retries=1, throttles=1, request_bytes=10,
+                   response_bytes=20)
+
+    line, = lines(stream)
+    directive = line['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'LexProvisioner'
+    assert directive['Dimensions'] == [['Operation', 'ResourceType']]
+    assert {'Name': 'Latency', 'Unit': 'Milliseconds'} in directive['Metrics']
+    assert line['Operation'] == 'put_intent'
+    assert line['ResourceType'] == 'intent'
+    assert line['Latency'] == 12.3
+    assert line['Retries'] == 1
+    assert line['Throttles'] == 1
+    assert line['Errors'] == 0
+    assert 'ErrorCode' not in line
+
+
+def test_summary_totals_every_call():
+    metrics, stream = recorder()
+    metrics.record('put_intent', 10, request_bytes=5)
+    metrics.record('put_intent', 20, error_code='BadRequestException')
+    metrics.record('get_bot', 5, retries=2)
+
+    metrics.emit_summary()
+
+    summary = lines(stream)[-1]
+    assert summary['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [[]]
+    assert summary['Calls'] == 3
+    assert summary['Latency'] == 35
+    assert summary['Errors'] == 1
+    assert summary['Retries'] == 2
+    assert summary['Operations']['put_intent']['Calls'] == 2
+    assert summary['Operations']['put_intent']['RequestBytes'] == 5
+
+
+def test_disabled_recorder_writes_nothing():
+    metrics, stream = recorder(enabled=False)
+    metrics.record('put_intent', 10)
+    metrics.emit_summary()
+
+    assert stream.getvalue() == ''
+
+
+def test_reset_clears_totals():
+    metrics, stream = recorder()
+    metrics.record('put_intent', 10)
+    metrics.reset()
+    metrics.emit_summary()
+
+    assert lines(stream)[-1]['Calls'] == 0
+
+
+def test_retry_policy_records_calls():
+    metrics, stream = recorder()
+    calls = []
+
+    def func(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise ClientError({'Error': {'Code': 'ThrottlingException'}}, 'put_intent')
+        return {'checksum': 'abc',
+                'ResponseMetadata': {'HTTPHeaders': {'content-length': '17'}}}
+
+    retry_policy = RetryPolicy(Mock(), stats=RetryStats(), sleep=lambda delay: None,
+                               metrics=metrics)
+    retry_policy.call(func, 'put_intent', name='greeting')
+
+    line, = lines(stream)
+    assert line['Operation'] == 'put_intent'
+    assert line['Retries'] == 1
+    assert line['Throttles'] == 1
+    assert line['RequestBytes'] == 0
+    assert line['ResponseBytes'] == 17
+
+
+def test_request_sizes_are_opt_in():
+    metrics, stream = recorder()
+    metrics.reset(request_sizes=True)
+
+    RetryPolicy(Mock(), stats=RetryStats(), metrics=metrics).call(
+        lambda **kwargs: {}, 'put_intent', name='greeting')
+
+    line, = lines(stream)
+    assert line['RequestBytes'] == payload_size({'name': 'greeting'})
+
+
+def test_response_size():
+    assert response_size(None) == 0
+    assert response_size({'checksum': 'abc'}) == 0
+    assert response_size({'ResponseMetadata': {'HTTPHeaders': {'content-length': '42'}}}) == 42
+
+
+def test_retry_policy_records_other_errors():
+    metrics, stream = recorder()
+
+    def func(**kwargs):
+        raise ReadTimeoutError(endpoint_url='https://models.lex.us-east-1.amazonaws.com')
+
+    retry_policy = RetryPolicy(Mock(), stats=RetryStats(), metrics=metrics)
+    with pytest.raises(ReadTimeoutError):
+        retry_policy.call(func, 'put_intent', name='greeting')
+
+    line, = lines(stream)
+    assert line['Errors'] == 1
+    assert line['ErrorCode'] == 'ReadTimeoutError'
+
+
+def test_retry_policy_records_error_code():
+    metrics, stream = recorder()
+
+    def func(**kwargs):
+        raise ClientError({'Error': {'Code': 'BadRequestException'}}, 'put_intent')
+
+    retry_policy = RetryPolicy(Mock(), stats=RetryStats(), metrics=metrics)
+    with pytest.raises(ClientError):
+        retry_policy.call(func, 'put_intent', name='greeting')
+
+    line, = lines(stream)
+    assert line['Errors'] == 1
+    assert line['ErrorCode'] == 'BadRequestException'
@@ -0,0 +1,70 @@
+""" parallel tests """
+# pylint: disable=missing-function-docstring
+import threading
+
+import pytest
+
+# pylint: disable=import-error
+from parallel import run_concurrently
+from utils import ProvisioningError
+# pylint: enable=import-error
+
+
+def test_results_keep_item_order():
+    results = run_concurrently(lambda item: item * 2, [3, 1, 2], max_workers=3)
+
+    assert results == [6, 2, 4]
+
+
+def test_serial_reraises_original_exception():
+    def fail(item):
+        raise ValueError(item)
+
+    with pytest.raises(ValueError):
+        run_concurrently(fail, ['a', 'b'])
+
+
+def test_concurrent_failures_are_keyed():
+    def fail_on_b(item):
+        if item == 'b':
+            raise ValueError('bad item')
+        return item
+
+    with pytest.raises(ProvisioningError) as excinfo:
+        run_concurrently(fail_on_b, ['a', 'b', 'c'], max_workers=2)
+
+    assert list(excinfo.value.failures.keys()) == ['b']
+    assert 'b: bad item' in str(excinfo.value)
+
+
+def test_collects_all_failures_without_fail_fast():
+    calls = []
+
+    def fail(item):
+        calls.append(item)
+        raise ValueError(item)
+
+    with pytest.raises(ProvisioningError) as excinfo:
+        run_concurrently(fail, ['a', 'b', 'c'], fail_fast=False)
+
+    assert calls == ['a', 'b', 'c']
+    assert sorted(excinfo.value.failures.keys()) == ['a', 'b', 'c']
+
+
+def test_worker_count_is_bounded():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def track(item):
+        with lock:
+            running.append(item)
+            peak.append(len(running))
+        threading.Event().wait(0.01)
+        with lock:
+            running.remove(item)
+        return item
+
+    run_concurrently(track, range(10), max_workers=3)
+
+    assert max(peak) <= 3
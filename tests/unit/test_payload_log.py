@@ -0,0 +1,120 @@
+""" payload logging tests """
+# pylint: disable=missing-function-docstring
+import io
+import json
+import logging
+
+import pytest
+
+# pylint: disable=import-error
+import payload_log
+from payload_log import PayloadLog, sample_rate, summarize
+# pylint: enable=import-error
+
+INTENT = {'name': 'greeting', 'sampleUtterances': ['hello {0}'.format(number)
+                                                   for number in range(5000)]}
+
+
+class Payload(dict):
+    """ counts how often it is serialised """
+    serialised = 0
+
+    def items(self):
+        Payload.serialised += 1
+        return dict.items(self)
+
+
+@pytest.fixture
+def logger():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    test_logger = logging.getLogger('test_payload_log')
+    test_logger.addHandler(handler)
+    test_logger.propagate = False
+    test_logger.stream = stream
+    yield test_logger
+    test_logger.removeHandler(handler)
+    test_logger.setLevel(logging.NOTSET)
+
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_small_payload_is_logged_whole():
+    assert summarize({'name': 'greeting', 'slots': [1, 2]}) == \
+        ({'name': 'greeting', 'slots': [1, 2]}, False)
+
+
+def test_large_payload_is_summarized():
+    summary, summarized = summarize(dict(INTENT, description='x' * 1000))
+
+    assert summarized
+    assert len(summary['sampleUtterances']) == payload_log.MAX_ITEMS + 1
+    assert summary['sampleUtterances'][-1] == '... 4990 more'
+    assert summary['description'].endswith('... 1000 chars')
+
+
+def test_nothing_is_serialised_when_level_disabled(logger):
+    logger.setLevel(logging.WARNING)
+    Payload.serialised = 0
+
+    assert not PayloadLog().log(logger, 'put_intent request', Payload(INTENT))
+    assert Payload.serialised == 0
+    assert logger.stream.getvalue() == ''
+
+
+def test_summary_is_one_json_line(logger):
+    logger.setLevel(logging.INFO)
+
+    PayloadLog().log(logger, 'put_intent request', INTENT, intent='greeting')
+
+    line, = lines(logger.stream)
+    assert line['message'] == 'put_intent request'
+    assert line['intent'] == 'greeting'
+    assert line['summarized']
+    assert 'sampled' not in line
+
+
+def test_long_summary_is_truncated(logger):
+    logger.setLevel(logging.INFO)
+    payload = dict(('key{0}'.format(number), 'value') for number in range(1000))
+
+    PayloadLog(max_chars=100).log(logger, 'wide', payload)
+
+    assert logger.stream.getvalue().rstrip().endswith('chars')
+    assert len(logger.stream.getvalue()) < 150
+
+
+def test_full_payload_is_sampled(logger):
+    logger.setLevel(logging.INFO)
+    draws = iter([0.05, 0.5])
+    payloads = PayloadLog(sample_rate=0.1, rand=lambda: next(draws))
+
+    payloads.log(logger, 'sampled', INTENT)
+    payloads.log(logger, 'not sampled', INTENT)
+
+    sampled, summarized = lines(logger.stream)
+    assert sampled['sampled']
+    assert sampled['payload'] == INTENT
+    assert summarized['summarized']
+
+
+def test_sampled_payload_keeps_the_level(logger):
+    logger.setLevel(logging.INFO)
+    levels = []
+    logger.addFilter(lambda record: levels.append(record.levelno) or True)
+    payloads = PayloadLog(sample_rate=1)
+
+    assert payloads.log(logger, 'put_intent request', INTENT, level=logging.WARNING)
+    assert not payloads.log(logger, 'get_intent response', INTENT, level=logging.DEBUG)
+
+    line, = lines(logger.stream)
+    assert line['sampled']
+    assert levels == [logging.WARNING]
+
+
+@pytest.mark.parametrize('value,expected', [
+    (None, 0.0), ('0.25', 0.25), (2, 1.0), (-1, 0.0), ('often', 0.0)])
+def test_sample_rate(value, expected):
+    assert sample_rate(value) == expected
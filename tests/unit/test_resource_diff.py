@@ -0,0 +1,53 @@
+""" resource diff tests """
+# pylint: disable=missing-function-docstring
+# pylint: disable=import-error
+import resource_diff
+from resource_diff import ResourceDiff
+# pylint: enable=import-error
+
+
+def properties(intents, slot_types):
+    return {'intents': [dict(Name=name, Utterances=utterances)
+                        for name, utterances in intents],
+            'slotTypes': slot_types}
+
+
+OLD = properties([('greeting', ['hello']), ('farewell', ['bye']), ('order', ['order'])],
+                 {'size': {'thin': ['thin']}, 'volume': {'loud': ['loud']}})
+NEW = properties([('greeting', ['hello']), ('order', ['order a pizza']), ('help', ['help'])],
+                 {'size': {'thin': ['thin', 'light']}, 'crust': {'thick': ['thick']}})
+
+
+def test_diff_intents():
+    diff = resource_diff.diff_intents(OLD, NEW)
+
+    assert diff == ResourceDiff(['help'], ['order'], ['farewell'], ['greeting'])
+    assert diff.to_put() == ['help', 'order']
+
+
+def test_diff_slot_types():
+    diff = resource_diff.diff_slot_types(OLD, NEW, 'test', 'test')
+
+    assert diff == ResourceDiff(['testcrust'], ['testsize'], ['testvolume'], [])
+
+
+def test_diff_slot_types_prefix_change():
+    diff = resource_diff.diff_slot_types(OLD, OLD, 'old', 'new')
+
+    assert diff.added == ['newsize', 'newvolume']
+    assert diff.removed == ['oldsize', 'oldvolume']
+
+
+def test_diff_missing_properties():
+    diff = resource_diff.diff_intents({}, NEW)
+
+    assert diff.added == ['greeting', 'order', 'help']
+    assert diff.removed == []
+
+
+def test_diff_slot_types_with_source_always_changed():
+    old = properties([], {'product': {'Source': 's3://bucket/products.csv'}})
+
+    diff = resource_diff.diff_slot_types(old, old)
+
+    assert diff.changed == ['product']
@@ -0,0 +1,100 @@
+""" retry policy tests """
+# pylint: disable=missing-function-docstring
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+# pylint: disable=import-error
+from retry import Deadline, RetryPolicy, RetryStats
+# pylint: enable=import-error
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'operation')
+
+
+def flaky(*errors):
+    calls = []
+
+    def func(**kwargs):
+        calls.append(kwargs)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return {'ok': True}
+    return func, calls
+
+
+def context(remaining_millis):
+    lambda_context = Mock()
+    lambda_context.get_remaining_time_in_millis.return_value = remaining_millis
+    return lambda_context
+
+
+def policy(deadline=None, **kwargs):
+    sleeps = []
+    stats = RetryStats()
+    retry_policy = RetryPolicy(Mock(), deadline=deadline, stats=stats,
+                               sleep=sleeps.append, **kwargs)
+    return retry_policy, sleeps, stats
+
+
+def test_retries_throttling_with_backoff():
+    retry_policy, sleeps, stats = policy()
+    func, calls = flaky(client_error('ThrottlingException'),
+                        client_error('ConflictException'))
+
+    assert retry_policy.call(func, 'put_intent', name='greeting') == {'ok': True}
+    assert calls == [{'name': 'greeting'}] * 3
+    assert len(sleeps) == 2
+    assert stats.snapshot()['put_intent']['retries'] == 2
+    assert stats.snapshot()['put_intent']['waited_seconds'] == pytest.approx(sum(sleeps), abs=0.01)
+
+
+def test_does_not_retry_unclassified_errors():
+    retry_policy, sleeps, _ = policy()
+    func, calls = flaky(client_error('BadRequestException'))
+
+    with pytest.raises(ClientError):
+        retry_policy.call(func, 'put_intent')
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_extra_retryable_codes():
+    retry_policy, _, _ = policy()
+    func, calls = flaky(client_error('ResourceInUseException'))
+
+    retry_policy.call(func, 'delete_intent', retryable=('ResourceInUseException',))
+    assert len(calls) == 2
+
+
+def test_stops_after_max_attempts():
+    retry_policy, sleeps, _ = policy(max_attempts=3)
+    func, calls = flaky(*[client_error('LimitExceededException')] * 5)
+
+    with pytest.raises(ClientError):
+        retry_policy.call(func, 'get_intent')
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_does_not_sleep_past_deadline():
+    retry_policy, sleeps, _ = policy(deadline=Deadline(context(4000)))
+    func, calls = flaky(*[client_error('LimitExceededException')] * 5)
+
+    with pytest.raises(ClientError):
+        retry_policy.call(func, 'get_intent')
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_backoff_is_capped():
+    retry_policy, _, _ = policy(max_delay=2.0)
+
+    assert all(retry_policy.delay('throttled', attempt) <= 2.0 for attempt in range(1, 10))
+
+
+def test_deadline_without_context():
+    assert Deadline(None).remaining() is None
+    assert Deadline(context(10000), margin=5).remaining() == 5.0
@@ -0,0 +1,152 @@
+""" scheduler tests """
+# pylint: disable=missing-function-docstring
+import threading
+import time
+
+import pytest
+
+# pylint: disable=import-error
+from models.bot import Bot
+from models.intent import Intent
+from models.slot import Slot
+from models.slot_type import SlotType
+from scheduler import DependencyGraph, run_graph, BOT, INTENT, SLOT_TYPE
+from utils import ProvisioningError
+# pylint: enable=import-error
+
+BOT_NAME = 'pizzabot'
+
+
+def pizza_bot():
+    size = Slot('size', 'pizzasize', 'what size?', ['a {size} pizza'])
+    person = Slot('name', 'AMAZON.Person', 'who?', ['I am {name}'])
+    order = Intent(BOT_NAME, 'order', None, ['order'], [size])
+    greeting = Intent(BOT_NAME, 'greeting', None, ['hello'], [person])
+    return Bot(BOT_NAME, [order, greeting], {})
+
+
+def slot_types():
+    return SlotType.create_slot_types({'pizzasize': {'thin': ['thin']},
+                                       'volume': {'loud': ['loud']}})
+
+
+def test_create_graph_dependencies():
+    graph = DependencyGraph.create_graph(pizza_bot(), slot_types())
+
+    assert graph.dependencies((SLOT_TYPE, 'pizzasize')) == []
+    assert graph.dependencies((INTENT, 'order')) == [(SLOT_TYPE, 'pizzasize')]
+    assert graph.dependencies((INTENT, 'greeting')) == []
+    assert graph.dependencies((BOT, BOT_NAME)) == [(INTENT, 'order'), (INTENT, 'greeting')]
+
+
+def test_reversed_graph():
+    graph = DependencyGraph.create_graph(pizza_bot(), slot_types()).reversed()
+
+    assert graph.keys()[0] == (BOT, BOT_NAME)
+    assert graph.dependencies((BOT, BOT_NAME)) == []
+    assert graph.dependencies((INTENT, 'order')) == [(BOT, BOT_NAME)]
+    assert graph.dependencies((SLOT_TYPE, 'pizzasize')) == [(INTENT, 'order')]
+    assert graph.dependencies((SLOT_TYPE, 'volume')) == []
+
+
+def test_unknown_dependency():
+    graph = DependencyGraph()
+
+    with pytest.raises(ValueError):
+        graph.add('intent', ['slot type'])
+
+
+def test_run_graph_respects_dependencies():
+    graph = DependencyGraph.create_graph(pizza_bot(), slot_types())
+    finished = []
+    lock = threading.Lock()
+
+    def run(key, dependency_results):
+        for dependency in graph.dependencies(key):
+            assert dependency in finished
+            assert dependency in dependency_results
+        with lock:
+            finished.append(key)
+        return key[1]
+
+    results = run_graph(graph, run, max_workers=4)
+
+    assert finished[-1] == (BOT, BOT_NAME)
+    assert results[(INTENT, 'order')] == 'order'
+
+
+def test_run_graph_starts_without_waiting_for_unrelated():
+    graph = DependencyGraph.create_graph(pizza_bot(), slot_types())
+    greeting_done = threading.Event()
+
+    def run(key, _):
+        if key == (SLOT_TYPE, 'volume'):
+            # only finishes once an intent that does not use it has been put
+            assert greeting_done.wait(5)
+        if key == (INTENT, 'greeting'):
+            greeting_done.set()
+
+    run_graph(graph, run, max_workers=4)
+
+
+def test_run_graph_stops_on_failure():
+    graph = DependencyGraph.create_graph(pizza_bot(), slot_types())
+    started = []
+
+    def run(key, _):
+        started.append(key)
+        if key == (SLOT_TYPE, 'pizzasize'):
+            raise ValueError('put failed')
+
+    with pytest.raises(ProvisioningError) as excinfo:
+        run_graph(graph, run)
+
+    assert list(excinfo.value.failures.keys()) == ['slot_type pizzasize']
+    assert (INTENT, 'order') not in started
+    assert (BOT, BOT_NAME) not in started
+
+
+class FakeDeadline(object):
+    def __init__(self, remaining):
+        self.remaining_seconds = remaining
+
+    def remaining(self):
+        return self.remaining_seconds
+
+    def allows(self, seconds):
+        return self.remaining_seconds > seconds
+
+
+def test_run_graph_starts_nothing_past_the_deadline():
+    graph = DependencyGraph.create_graph(pizza_bot(), slot_types())
+    deadline = FakeDeadline(10)
+    started = []
+
+    def run(key, _):
+        started.append(key)
+        deadline.remaining_seconds = -1
+
+    with pytest.raises(ProvisioningError) as excinfo:
+        run_graph(graph, run, deadline=deadline)
+
+    assert 'deadline' in str(excinfo.value)
+    assert len(started) == 1
+
+
+def test_run_graph_does_not_wait_past_the_deadline():
+    graph = DependencyGraph.create_graph(pizza_bot(), slot_types())
+    release = threading.Event()
+
+    def run(key, _):
+        if key == (SLOT_TYPE, 'pizzasize'):
+            release.wait(5)
+
+    started = time.time()
+    try:
+        with pytest.raises(ProvisioningError) as excinfo:
+            run_graph(graph, run, max_workers=2, deadline=FakeDeadline(0.1))
+    finally:
+        release.set()
+
+    assert 'deadline' in str(excinfo.value)
+    assert time.time() - started < 5
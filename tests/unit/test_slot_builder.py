@@ -4,6 +4,7 @@ from unittest.mock import Mock
 import pytest
 #  from pytest_mock import mocker
 import botocore.session
+from botocore.exceptions import ClientError
 from botocore.stub import Stubber, ANY
 
 # pylint: disable=import-error
@@ -154,6 +155,26 @@ def test_update_slot_type(put_slot_type_response, mocker, lex):
         assert response['version'] == '$LATEST'
 
 
+def test_update_unchanged_slot_type(mocker, lex):
+    context = mock_context(mocker)
+
+    with Stubber(lex) as stubber:
+        slot_builder = SlotBuilder(Mock(), context, lex_sdk=lex)
+        get_response = put_slot_type_request(SLOT_TYPE_NAME, synonyms=[{
+            'value': 'thin',
+            'synonyms': ['skinny']
+        }])
+        get_response.update({'checksum': 'chksum', 'version': '$LATEST'})
+        stubber.add_response('get_slot_type', get_response,
+                             {'name': SLOT_TYPE_NAME, 'version': ANY})
+
+        slot_type = SlotType.create_slot_types({SLOT_TYPE_NAME: {'thin': ['skinny']}})
+        response = slot_builder.put_slot_type(slot_type[0])
+
+        stubber.assert_no_pending_responses()
+        assert response['checksum'] == 'chksum'
+
+
 def test_delete_slot_type(lex, mocker):
     delete_request = {'name': SLOT_TYPE_NAME}
 
@@ -185,16 +206,54 @@ def test_delete_unknown_error_slot_type(lex, mocker):
     with Stubber(lex) as stubber:
         stubber.add_client_error('delete_slot_type', service_error_code='UnknownException')
 
-        slot_builder.delete_slot_type(SLOT_TYPE_NAME)
+        with pytest.raises(ClientError):
+            slot_builder.delete_slot_type(SLOT_TYPE_NAME)
         stubber.assert_no_pending_responses()
 
 
-def test_delete_in_use_slot_type(lex, mocker):
+def test_delete_in_use_slot_type_is_retried(lex, mocker):
     context = mock_context(mocker)
     slot_builder = SlotBuilder(Mock(), context, lex_sdk=lex)
+    slot_builder._retry_policy()._sleep = lambda delay: None  # pylint: disable=protected-access
 
     with Stubber(lex) as stubber:
         stubber.add_client_error('delete_slot_type', service_error_code='ResourceInUseException')
+        stub_slot_type_deletion(stubber, {}, {'name': SLOT_TYPE_NAME})
 
         slot_builder.delete_slot_type(SLOT_TYPE_NAME)
         stubber.assert_no_pending_responses()
+
+
+def test_delete_slot_type_still_in_use_fails(lex, mocker):
+    context = mock_context(mocker)
+    slot_builder = SlotBuilder(Mock(), context, lex_sdk=lex)
+    slot_builder._retry_policy()._sleep = lambda delay: None  # pylint: disable=protected-access
+
+    with Stubber(lex) as stubber:
+        for _ in range(SlotBuilder.IN_USE_DELETE_TRIES):
+            stubber.add_client_error('delete_slot_type',
+                                     service_error_code='ResourceInUseException')
+
+        with pytest.raises(ClientError):
+            slot_builder.delete_slot_type(SLOT_TYPE_NAME)
+        stubber.assert_no_pending_responses()
+
+
+def test_create_slot_type_from_source(put_slot_type_response, mocker, lex, tmpdir):
+    context = mock_context(mocker)
+    source = tmpdir.join('values.csv')
+    source.write('thin,skinny\nTHIN,skinny\n')
+
+    with Stubber(lex) as stubber:
+        slot_builder = SlotBuilder(Mock(), context, lex_sdk=lex)
+        stub_slot_type_not_found_get(stubber)
+        stub_slot_type_creation(stubber, put_slot_type_response,
+                                put_slot_type_request(SLOT_TYPE_NAME, synonyms=[{
+                                    'value': 'thin',
+                                    'synonyms': ['skinny']
+                                }]))
+
+        slot_type = SlotType.create_slot_types({SLOT_TYPE_NAME: {'Source': str(source)}})
+        slot_builder.put_slot_type(slot_type[0])
+
+        stubber.assert_no_pending_responses()
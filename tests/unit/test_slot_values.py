@@ -0,0 +1,74 @@
+""" external slot type values tests """
+# pylint: disable=missing-function-docstring
+import io
+from unittest.mock import Mock
+
+import pytest
+
+# pylint: disable=import-error
+import clients
+import slot_values
+from utils import ValidationError
+# pylint: enable=import-error
+
+
+@pytest.fixture()
+def s3():
+    s3_client = Mock()
+    clients.register_client('s3', s3_client)
+    yield s3_client
+    clients.clear_clients()
+
+
+def test_is_external():
+    assert slot_values.is_external({'Source': 's3://bucket/values.csv'})
+    assert not slot_values.is_external({'thin': ['skinny']})
+    assert not slot_values.is_external(None)
+
+
+def test_load_csv_file(tmpdir):
+    source = tmpdir.join('sizes.csv')
+    source.write('thin,skinny,light\n  Thin ,slim\nthick,fat\n\n')
+
+    values = slot_values.load('size', {'Source': str(source)})
+
+    assert values == {'thin': ['skinny', 'light', 'slim'], 'thick': ['fat']}
+
+
+def test_load_json_lines_from_s3(s3):
+    s3.get_object.return_value = {'Body': Mock(iter_lines=lambda: iter([
+        b'{"value": "red", "synonyms": ["scarlet", "Scarlet"]}',
+        b'',
+        b'{"value": "blue"}']))}
+
+    values = slot_values.load('colour', {'Source': 's3://bucket/colours.data',
+                                         'Format': 'jsonl'})
+
+    s3.get_object.assert_called_once_with(Bucket='bucket', Key='colours.data')
+    assert values == {'red': ['scarlet'], 'blue': []}
+
+
+def test_openers_can_be_replaced(monkeypatch):
+    monkeypatch.setitem(slot_values.OPENERS, 's3', lambda uri: io.StringIO('big,large\n'))
+
+    assert slot_values.load('size', {'Source': 's3://bucket/sizes.csv'}) == {'big': ['large']}
+
+
+def test_unknown_format():
+    with pytest.raises(ValidationError):
+        slot_values.load('size', {'Source': 'sizes.txt'})
+
+
+def test_invalid_json_line():
+    with pytest.raises(ValidationError):
+        list(slot_values.parse_json_lines(['{"value": "red"}', 'not json']))
+
+
+def test_validate_limits(monkeypatch):
+    monkeypatch.setattr(slot_values, 'MAX_VALUES', 2)
+
+    with pytest.raises(ValidationError) as excinfo:
+        slot_values.validate('size', {'a': [], 'b': ['x' * 141], 'c': []})
+
+    assert '3 values' in str(excinfo.value)
+    assert 'synonym' in str(excinfo.value)
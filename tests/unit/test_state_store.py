@@ -0,0 +1,165 @@
+""" deployment state store tests """
+# pylint: disable=missing-function-docstring, redefined-outer-name
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+# pylint: disable=import-error
+import lex_helper
+import state_store
+from bot_builder import LexBotBuilder
+from intent_builder import IntentBuilder
+from models.bot import Bot
+from models.intent import Intent
+from models.slot_type import SlotType
+from slot_builder import SlotBuilder
+from state_store import DynamoDbStateStore, FileStateStore, SqliteStateStore
+from tests.fake_lex import FakeDynamoDb, FakeLambda, FakeLex
+from utils import ValidationError
+# pylint: enable=import-error
+
+LAMBDA_ARN = 'arn:aws:lambda:us-east-1:123456789123:function:GreetingLambda'
+RECORD = {'checksum': 'abc', 'version': '3', 'fingerprint': 'f00'}
+
+
+@pytest.fixture(autouse=True)
+def aws_details():
+    lex_helper.cache_aws_details(LAMBDA_ARN)
+    yield
+    lex_helper.clear_aws_details()
+    state_store.clear_stores()
+
+
+@pytest.fixture(params=['file', 'sqlite', 'dynamodb'])
+def store(request, tmpdir):
+    if request.param == 'file':
+        return FileStateStore(str(tmpdir.join('state.json')))
+    if request.param == 'sqlite':
+        return SqliteStateStore(str(tmpdir.join('state.db')))
+    return DynamoDbStateStore('lex-state', client=FakeDynamoDb())
+
+
+def test_store_round_trip(store):
+    assert store.get('intent', 'greeting') is None
+
+    store.put('intent', 'greeting', RECORD)
+    assert store.get('intent', 'greeting') == RECORD
+    assert store.get('slot_type', 'greeting') is None
+
+    store.delete('intent', 'greeting')
+    assert store.get('intent', 'greeting') is None
+
+
+def test_file_store_survives_restart(tmpdir):
+    path = str(tmpdir.join('state.json'))
+    FileStateStore(path).put('bot', 'pizza', RECORD)
+
+    assert FileStateStore(path).get('bot', 'pizza') == RECORD
+
+
+def test_file_store_sees_writes_from_other_processes(tmpdir):
+    path = str(tmpdir.join('state.json'))
+    store = FileStateStore(path)
+    assert store.get('bot', 'pizza') is None
+
+    FileStateStore(path).put('bot', 'pizza', RECORD)
+
+    assert store.get('bot', 'pizza') == RECORD
+
+
+def test_from_uri(tmpdir):
+    uri = 'sqlite://' + str(tmpdir.join('state.db'))
+
+    assert state_store.from_uri(None) is None
+    assert isinstance(state_store.from_uri(uri), SqliteStateStore)
+    assert state_store.from_uri(uri) is state_store.from_uri(uri)
+    with pytest.raises(ValidationError):
+        state_store.from_uri('redis://localhost')
+
+
+def bot():
+    intents = [Intent('bot', name, LAMBDA_ARN, ['hello'], [], max_attempts=3,
+                      plaintext={'confirmation': 'ok', 'rejection': 'no'})
+               for name in ('greeting', 'farewell')]
+    return Bot('bot', intents, {'clarification': 'what?', 'abortStatement': 'bye'},
+               locale='en-US', description='a bot')
+
+
+def builder(lex, state):
+    logger = Mock()
+    intent_builder = IntentBuilder(logger, None, lex_sdk=lex, lambda_sdk=FakeLambda(),
+                                   state=state)
+    return LexBotBuilder(logger, None, lex_sdk=lex, intent_builder=intent_builder,
+                         slot_builder=SlotBuilder(logger, None, lex_sdk=lex, state=state),
+                         state=state)
+
+
+def test_second_deploy_skips_gets(tmpdir):
+    lex = FakeLex()
+    state = FileStateStore(str(tmpdir.join('state.json')))
+    slot_types = [SlotType('size', {'thin': ['skinny']})]
+    builder(lex, state).put(bot(), slot_types=slot_types)
+
+    lex.calls.clear()
+    builder(lex, state).put(bot(), slot_types=slot_types)
+
+    assert not [operation for operation in lex.calls if operation.startswith('get_')]
+    assert lex.calls['put_intent'] == 0
+    assert lex.calls['put_slot_type'] == 0
+    assert lex.calls['create_intent_version'] == 0
+    assert lex.calls['put_bot'] == 1
+
+
+def test_changed_resource_is_put_with_cached_checksum(tmpdir):
+    lex = FakeLex()
+    state = FileStateStore(str(tmpdir.join('state.json')))
+    builder(lex, state).put(bot(), slot_types=[SlotType('size', {'thin': ['skinny']})])
+    lex.calls.clear()
+
+    builder(lex, state).put(bot(), slot_types=[SlotType('size', {'thick': ['chunky']})])
+
+    assert not [operation for operation in lex.calls if operation.startswith('get_')]
+    assert lex.calls['put_slot_type'] == 1
+    assert lex.calls['put_intent'] == 0
+
+
+def test_stale_checksum_falls_back_to_get(tmpdir):
+    lex = FakeLex()
+    state = FileStateStore(str(tmpdir.join('state.json')))
+    slot_builder = SlotBuilder(Mock(), None, lex_sdk=lex, state=state)
+    slot_builder.put_slot_type(SlotType('size', {'thin': ['skinny']}))
+    state.put('slot_type', 'size', dict(state.get('slot_type', 'size'), checksum='stale'))
+
+    response = slot_builder.put_slot_type(SlotType('size', {'thin': ['skinny', 'slim']}))
+
+    assert lex.calls['get_slot_type'] == 2
+    assert state.get('slot_type', 'size')['checksum'] == response['checksum']
+
+
+def test_bad_request_is_not_a_stale_checksum(tmpdir):
+    lex = FakeLex()
+    state = FileStateStore(str(tmpdir.join('state.json')))
+    slot_builder = SlotBuilder(Mock(), None, lex_sdk=lex, state=state)
+    slot_builder.put_slot_type(SlotType('size', {'thin': ['skinny']}))
+    lex.calls.clear()
+    lex.fail('put_slot_type', 'BadRequestException')
+
+    with pytest.raises(ClientError):
+        slot_builder.put_slot_type(SlotType('size', {'thin': ['skinny', 'slim']}))
+
+    assert lex.calls['get_slot_type'] == 0
+    assert lex.calls['put_slot_type'] == 1
+
+
+def test_delete_forgets_state(tmpdir):
+    lex = FakeLex()
+    state = FileStateStore(str(tmpdir.join('state.json')))
+    slot_types = [SlotType('size', {'thin': ['skinny']})]
+    builder(lex, state).put(bot(), slot_types=slot_types)
+
+    builder(lex, state).delete(bot(), slot_types=slot_types)
+
+    assert state.get('bot', 'bot') is None
+    assert state.get('intent', 'greeting') is None
+    assert state.get('slot_type', 'size') is None
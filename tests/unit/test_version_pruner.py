@@ -0,0 +1,85 @@
+""" version pruner tests """
+# pylint: disable=missing-function-docstring
+from unittest.mock import Mock
+
+# pylint: disable=import-error
+from tests.fake_lex import FakeLex, BOT, INTENT
+from version_pruner import Pacer, VersionPruner
+# pylint: enable=import-error
+
+
+def deploy(lex, bot_name, intent_names, revision):
+    """Put every intent and the bot again, creating a new version of each"""
+    intents = []
+    for name in intent_names:
+        current = lex.definition(INTENT, name)
+        put = lex.put_intent(name=name, description=str(revision),
+                             checksum=current and current['checksum'])
+        version = lex.create_intent_version(name=name, checksum=put['checksum'])
+        intents.append({'intentName': name, 'intentVersion': version['version']})
+    current = lex.definition(BOT, bot_name)
+    put = lex.put_bot(name=bot_name, intents=intents, checksum=current and current['checksum'])
+    return lex.create_bot_version(name=bot_name, checksum=put['checksum'])['version']
+
+
+def versions(lex, resource_type, name):
+    operation = 'get_bot_versions' if resource_type == BOT else 'get_intent_versions'
+    key = 'bots' if resource_type == BOT else 'intents'
+    return [summary['version'] for summary in getattr(lex, operation)(name=name)[key]]
+
+
+def test_prune_keeps_newest_and_aliased_versions():
+    lex = FakeLex()
+    for revision in range(5):
+        deploy(lex, 'bot', ['greeting', 'farewell'], revision)
+        if revision == 0:
+            lex.put_bot_alias(name='prod', botName='bot', botVersion='1')
+
+    pruner = VersionPruner(Mock(), None, lex_sdk=lex, keep=2, max_workers=4)
+    deleted = pruner.prune('bot', ['greeting', 'farewell'])
+
+    assert versions(lex, BOT, 'bot') == ['1', '4', '5', '$LATEST']
+    assert versions(lex, INTENT, 'greeting') == ['1', '4', '5', '$LATEST']
+    assert sorted(deleted) == sorted([(BOT, 'bot', '2'), (BOT, 'bot', '3'),
+                                      (INTENT, 'greeting', '2'), (INTENT, 'greeting', '3'),
+                                      (INTENT, 'farewell', '2'), (INTENT, 'farewell', '3')])
+
+
+def test_prune_without_old_versions_deletes_nothing():
+    lex = FakeLex()
+    deploy(lex, 'bot', ['greeting'], 0)
+
+    assert VersionPruner(Mock(), None, lex_sdk=lex, keep=1).prune('bot', ['greeting']) == []
+    assert lex.calls['delete_bot_version'] == 0
+
+
+def test_throttled_deletes_slow_down_and_retry():
+    lex = FakeLex()
+    for revision in range(3):
+        deploy(lex, 'bot', ['greeting'], revision)
+    lex.fail('delete_bot_version', 'ThrottlingException', times=2)
+    paced = []
+    pacer = Pacer(sleep=paced.append, clock=lambda: 0.0)
+    pruner = VersionPruner(Mock(), None, lex_sdk=lex, keep=1, pacer=pacer)
+    pruner._retry_policy()._sleep = lambda delay: None  # pylint: disable=protected-access
+
+    pruner.prune('bot', ['greeting'])
+
+    assert versions(lex, BOT, 'bot') == ['3', '$LATEST']
+    assert lex.calls['delete_bot_version'] == 4
+    # calls after a throttle wait for the pacer
+    assert paced[0] == 0.1
+
+
+def test_pacer_backs_off_and_recovers():
+    pacer = Pacer(max_interval=0.3)
+
+    pacer.throttled()
+    assert pacer.interval == 0.1
+    pacer.throttled()
+    pacer.throttled()
+    assert pacer.interval == 0.3
+
+    for _ in range(5):
+        pacer.succeeded()
+    assert pacer.interval == 0.0